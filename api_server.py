@@ -0,0 +1,340 @@
+# HTTP API калькулятора для MES и печати этикеток (работает без Streamlit)
+# и офлайн-версия калькулятора (PWA из static/, расчет идет в браузере)
+#
+# Запуск:  python api_server.py --port 8080 --workers 4
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+from functools import partial
+
+try:
+    from aiohttp import web
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+import catalog_service
+import instrumentation
+from calculator import calculate
+from connector_search import search_connectors
+from pair_table import PAIRS_LIMIT, get_pair_table
+
+logger = logging.getLogger(__name__)
+
+# Как часто (секунды) проверять новый каталог из Google Sheets; правки из
+# журнала CSV (Streamlit, другие воркеры) приходят по подписке сразу
+CATALOG_REFRESH = 30
+
+TOLERANCE_TYPES = {"мм": "мм", "mm": "мм", "%": "%"}
+
+# Наибольший limit в запросах списков: ответ собирается в памяти целиком
+MAX_LIMIT = 1000
+
+# Оболочка PWA: отдается из корня, чтобы service worker видел весь сайт
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SHELL_FILES = ("index.html", "sw.js", "calc.js", "manifest.json", "icon-192.png", "icon-512.png")
+
+# Последний снимок каталога для /catalog/snapshot: тело и ETag
+_snapshot = {"version": None, "etag": None, "body": None}
+
+_json_response = partial(web.json_response, dumps=partial(json.dumps, ensure_ascii=False)) if HAS_AIOHTTP else None
+
+
+class ApiError(Exception):
+    """Ошибка запроса: отдается клиенту как JSON с кодом status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _calculate_item(catalog, item):
+    """Расчет одной позиции из JSON запроса"""
+    if not isinstance(item, dict):
+        raise ApiError("Ожидается объект с полями connector1, connector2, length")
+    try:
+        length = float(item["length"])
+        tolerance = float(item.get("tolerance", 0.0))
+    except KeyError as e:
+        raise ApiError(f"Не указано поле {e}")
+    except (TypeError, ValueError):
+        raise ApiError("length и tolerance должны быть числами")
+    # NaN и Infinity в ответе - уже не JSON
+    if not (math.isfinite(length) and math.isfinite(tolerance)):
+        raise ApiError("length и tolerance должны быть конечными числами")
+    tolerance_type = TOLERANCE_TYPES.get(str(item.get("tolerance_type", "мм")).strip().lower())
+    if tolerance_type is None:
+        raise ApiError("tolerance_type: ожидается 'мм' или '%'")
+    for field in ("connector1", "connector2"):
+        if field not in item:
+            raise ApiError(f"Не указано поле '{field}'")
+        if not isinstance(item[field], str):
+            raise ApiError(f"{field}: ожидается название коннектора (строка)")
+        if item[field] not in catalog:
+            raise ApiError(f"Неизвестный коннектор '{item[field]}'", status=404)
+    result = calculate(catalog, item["connector1"], item["connector2"], length, tolerance, tolerance_type)
+    result["length"] = length
+    return result
+
+
+def catalog_snapshot(catalog):
+    """Компактный JSON каталога и его ETag (считаются один раз на версию).
+
+    ETag - хеш содержимого, поэтому он одинаков во всех процессах API.
+    """
+    version = getattr(catalog, "version", None)
+    if version is None or _snapshot["version"] != version:
+        items = list(catalog.items())
+        body = json.dumps(
+            {"names": [name for name, _ in items], "sizes": [size for _, size in items]},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        _snapshot.update(version=version, body=body, etag=f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+    return _snapshot["etag"], _snapshot["body"]
+
+
+def _query_number(request, name, default=None, cast=float):
+    value = request.query.get(name, default)
+    if value is None:
+        raise ApiError(f"Не указан параметр '{name}'")
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"{name} должен быть числом")
+
+
+def _query_limit(request, default):
+    """Параметр limit: целое число от 1 до MAX_LIMIT"""
+    try:
+        limit = int(request.query.get("limit", default))
+    except ValueError:
+        raise ApiError("limit должен быть целым числом")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f"limit должен быть от 1 до {MAX_LIMIT}")
+    return limit
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise ApiError("Тело запроса должно быть JSON")
+
+
+def create_app(catalog=None, catalog_key=None):
+    """Приложение aiohttp; catalog - фиксированный каталог (для тестов и бенчмарков),
+    catalog_key - каталог из catalog_service.CATALOGS (по умолчанию первый)"""
+    app = web.Application()
+    service = catalog_service.get_catalog(catalog_key) if catalog is None else None
+    app["catalog"] = catalog if catalog is not None else service.current()
+    routes = web.RouteTableDef()
+
+    @web.middleware
+    async def errors(request, handler):
+        try:
+            return await handler(request)
+        except ApiError as e:
+            return _json_response({"error": str(e)}, status=e.status)
+
+    @web.middleware
+    async def timing(request, handler):
+        # Шаблон маршрута, а не путь: /connectors/{name} - одна метрика
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unknown"
+        with instrumentation.span(f"api {request.method} {route}"):
+            return await handler(request)
+
+    @routes.get("/metrics")
+    async def metrics(request):
+        """Метрики процесса в формате Prometheus"""
+        return web.Response(text=instrumentation.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    @routes.get("/catalog/snapshot")
+    async def snapshot(request):
+        """Каталог для офлайн-расчета в браузере; 304, если ETag совпал"""
+        etag, body = catalog_snapshot(request.app["catalog"])
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        response = web.Response(body=body, content_type="application/json", charset="utf-8", headers=headers)
+        response.enable_compression()
+        return response
+
+    def shell_file(name):
+        async def handler(request):
+            response = web.FileResponse(os.path.join(STATIC_DIR, name))
+            # Новые sw.js и страница должны подхватываться сразу
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return handler
+
+    routes.get("/")(shell_file("index.html"))
+    for name in SHELL_FILES:
+        routes.get(f"/{name}")(shell_file(name))
+
+    @routes.get("/health")
+    async def health(request):
+        return _json_response({"status": "ok", "connectors": len(request.app["catalog"])})
+
+    @routes.get("/connectors")
+    async def connectors(request):
+        """Поиск (q) или весь каталог по страницам: offset и limit, total - всего"""
+        catalog = request.app["catalog"]
+        query = request.query.get("q")
+        response = {}
+        if query is None:
+            try:
+                offset = int(request.query.get("offset", 0))
+            except ValueError:
+                raise ApiError("offset должен быть целым числом")
+            if offset < 0:
+                raise ApiError("offset не может быть отрицательным")
+            # У CatalogSnapshot названия уже отсортированы
+            names = getattr(catalog, "names", None) or sorted(catalog)
+            names = names[offset:offset + _query_limit(request, MAX_LIMIT)]
+            response["total"] = len(catalog)
+        else:
+            names = search_connectors(catalog, query, _query_limit(request, 50))
+        response["count"] = len(names)
+        response["connectors"] = [{"name": name, "size": catalog[name]} for name in names]
+        return _json_response(response)
+
+    # Названия содержат '/', например 16_SMA-50-2-103/111_NE
+    @routes.get("/connectors/{name:.+}")
+    async def connector(request):
+        name = request.match_info["name"]
+        catalog = request.app["catalog"]
+        if name not in catalog:
+            raise ApiError(f"Неизвестный коннектор '{name}'", status=404)
+        return _json_response({"name": name, "size": catalog[name]})
+
+    @routes.get("/pairs")
+    async def pairs(request):
+        """Пары, дающие окончательную длину в окне [min, max] для кабеля length"""
+        tolerance_type = TOLERANCE_TYPES.get(request.query.get("tolerance_type", "мм").strip().lower())
+        if tolerance_type is None:
+            raise ApiError("tolerance_type: ожидается 'мм' или '%'")
+        total, results = get_pair_table(request.app["catalog"]).pairs_in_window(
+            _query_number(request, "length"),
+            _query_number(request, "min"),
+            _query_number(request, "max"),
+            _query_number(request, "tolerance", 0.0),
+            tolerance_type,
+            _query_limit(request, PAIRS_LIMIT),
+        )
+        return _json_response({"count": total, "pairs": results})
+
+    @routes.get("/cut-lengths")
+    async def cut_lengths(request):
+        """Длина реза для каждой пары (или пар с connector) под окончательную длину final"""
+        tolerance_type = TOLERANCE_TYPES.get(request.query.get("tolerance_type", "мм").strip().lower())
+        if tolerance_type is None:
+            raise ApiError("tolerance_type: ожидается 'мм' или '%'")
+        catalog = request.app["catalog"]
+        connector = request.query.get("connector")
+        if connector is not None and connector not in catalog:
+            raise ApiError(f"Неизвестный коннектор '{connector}'", status=404)
+        total, results = get_pair_table(catalog).cut_lengths(
+            _query_number(request, "final"),
+            _query_number(request, "tolerance", 0.0),
+            tolerance_type,
+            connector,
+            _query_limit(request, PAIRS_LIMIT),
+        )
+        return _json_response({"count": total, "pairs": results})
+
+    @routes.post("/calculate")
+    async def calculate_one(request):
+        item = await _read_json(request)
+        return _json_response(_calculate_item(request.app["catalog"], item))
+
+    @routes.post("/calculate/bulk")
+    async def calculate_bulk(request):
+        body = await _read_json(request)
+        items = body.get("items") if isinstance(body, dict) else body
+        if not isinstance(items, list):
+            raise ApiError("Ожидается список позиций или {\"items\": [...]}")
+        catalog = request.app["catalog"]
+        results = []
+        # Ошибка в одной позиции не мешает остальным
+        for item in items:
+            try:
+                results.append(_calculate_item(catalog, item))
+            except ApiError as e:
+                results.append({"error": str(e)})
+        return _json_response({"results": results})
+
+    async def refresh_catalog(app):
+        """Фоновое обновление каталога: запросы всегда читают готовый каталог"""
+        while True:
+            await asyncio.sleep(CATALOG_REFRESH)
+            try:
+                app["catalog"] = await asyncio.to_thread(service.current)
+            except Exception as e:
+                logger.warning("Не удалось обновить каталог: %s", e)
+
+    async def start_refresh(app):
+        if catalog is None:
+            loop = asyncio.get_running_loop()
+            # Новая версия приходит из потока, который ее получил
+            app["unsubscribe"] = service.subscribe(
+                lambda new: loop.call_soon_threadsafe(app.__setitem__, "catalog", new)
+            )
+            app["catalog"] = service.current()
+            app["refresh_task"] = asyncio.create_task(refresh_catalog(app))
+
+    async def stop_refresh(app):
+        task = app.get("refresh_task")
+        if task is not None:
+            task.cancel()
+        unsubscribe = app.get("unsubscribe")
+        if unsubscribe is not None:
+            unsubscribe()
+
+    app.middlewares.append(timing)
+    app.middlewares.append(errors)
+    app.add_routes(routes)
+    app.on_startup.append(start_refresh)
+    app.on_cleanup.append(stop_refresh)
+    return app
+
+
+def _serve(host, port, reuse_port, catalog_key=None):
+    web.run_app(create_app(catalog_key=catalog_key), host=host, port=port, reuse_port=reuse_port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API калькулятора длины кабеля")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1, help="число процессов (общий порт через SO_REUSEPORT)")
+    parser.add_argument("--catalog", default=None, help="ключ каталога из настройки CATALOGS (по умолчанию первый)")
+    args = parser.parse_args()
+
+    if not HAS_AIOHTTP:
+        raise SystemExit("Для HTTP API нужен пакет aiohttp: pip install aiohttp")
+    if args.catalog is not None and args.catalog not in catalog_service.CATALOGS:
+        raise SystemExit(f"Нет каталога {args.catalog}; доступны: {', '.join(catalog_service.CATALOGS)}")
+
+    logging.basicConfig(level=logging.INFO)
+    if args.workers <= 1:
+        _serve(args.host, args.port, reuse_port=False, catalog_key=args.catalog)
+        return
+    workers = [
+        multiprocessing.Process(target=_serve, args=(args.host, args.port, True, args.catalog))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
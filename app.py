@@ -1,132 +1,217 @@
+import time
+
 import streamlit as st
-import csv
-import os
 
-# Импортируем функции для работы с Google Sheets
-try:
-    from google_sheets_config import load_catalog_from_sheets, save_catalog_to_sheets
-    USE_GOOGLE_SHEETS = True
-except ImportError:
-    USE_GOOGLE_SHEETS = False
+import instrumentation
+from catalog_service import CATALOGS, USE_GOOGLE_SHEETS, get_catalog
+from google_connection import get_setting
+from catalog_view import PAGE_SIZE, TableView
+from calculator import compute_final_length, tolerance_to_mm
+from connector_search import search_connectors
 
-CSV_FILE = "connectors.csv"
+# Функции Google Sheets для статуса подключения и разрешения конфликтов
+# (модули легкие: requests и gspread загружаются при первом запросе к Google)
+if USE_GOOGLE_SHEETS:
+    from google_connection import breaker
+    from catalog_sync import load_sync_state, resolve_conflict
 
 # ---------- Работа с данными ----------
-def load_catalog():
-    """Загружает каталог с приоритетом Google Sheets"""
-    catalog = {}
-    
-    # Приоритет 1: Google Sheets (облако)
-    if USE_GOOGLE_SHEETS:
-        try:
-            catalog = load_catalog_from_sheets()
-            if catalog:  # Если получили данные из облака
-                return catalog
-        except:
-            pass  # Если облако недоступно, переходим к локальному
-    
-    # Приоритет 2: CSV файл (локально)
-    if os.path.exists(CSV_FILE):
-        with open(CSV_FILE, newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) == 2:
-                    name, size = row
-                    try:
-                        catalog[name] = float(size)
-                    except ValueError:
-                        continue
-    
-    # Приоритет 3: Базовый набор (если ничего не загрузилось)
-    if not catalog:
-        catalog = {
-            "SF9351-60004": 3.0,
-            "16_MCX-50-2-104": 5.0,
-            "16_SMA-50-2-103/111_NE": 3.0,
-        }
-    
-    return catalog
-
 def sync_catalogs():
-    """Синхронизирует данные между Google Sheets и CSV"""
-    if not USE_GOOGLE_SHEETS:
+    """Синхронизирует данные выбранного каталога между Google Sheets и CSV (только изменения)"""
+    if not service.use_sheets:
         return False
     
     try:
-        # Загружаем данные из Google Sheets
-        sheets_catalog = load_catalog_from_sheets()
-        if not sheets_catalog:
-            return False
-        
-        # Загружаем данные из CSV
-        csv_catalog = {}
-        if os.path.exists(CSV_FILE):
-            with open(CSV_FILE, newline="", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    if len(row) == 2:
-                        name, size = row
-                        try:
-                            csv_catalog[name] = float(size)
-                        except ValueError:
-                            continue
-        
-        # Объединяем: Google Sheets + уникальные из CSV
-        merged_catalog = sheets_catalog.copy()
-        for name, size in csv_catalog.items():
-            if name not in merged_catalog:  # Добавляем только уникальные
-                merged_catalog[name] = size
-        
-        # Сохраняем объединенный каталог в Google Sheets
-        from google_sheets_config import save_catalog_to_sheets
-        if save_catalog_to_sheets(merged_catalog):
-            # Обновляем CSV файл
-            with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                for name, size in merged_catalog.items():
-                    writer.writerow([name, size])
-            return True
-        
-        return False
+        # Конфликты не разрешаются автоматически - они попадают в отчет
+        # синхронизации и показываются в боковой панели
+        service.sync()
+        return True
     except Exception as e:
         st.error(f"Ошибка синхронизации: {e}")
         return False
 
-def update_catalog_files():
-    """Обновляет файлы с актуальными данными каталога"""
-    # Обновляем CSV файл
+def update_catalog_files(changes):
+    """Обновляет файлы с актуальными данными каталога
+
+    changes - изменения для журнала CSV, например
+    [{"op": "update", "name": "SMA-50-2-103", "size": 3.0}]
+    """
+    # Изменения дописываются в журнал CSV (миллисекунды), а в Google Sheets
+    # уходят в фоне; при ошибке очередь повторит отправку сама
     try:
-        with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            for name, size in st.session_state.catalog.items():
-                writer.writerow([name, size])
+        service.save_changes(changes)
+        return True
     except Exception as e:
         st.error(f"Ошибка обновления CSV: {e}")
+        return False
+
+# Функция сохранения больше не нужна - данные редактируются только в Google Sheets
+
+# ---------- Интерфейс ----------
+def connector_picker(label, key):
+    """Выбор коннектора с поиском: в браузер уходят только лучшие совпадения"""
+    catalog = st.session_state.catalog
+    query = st.text_input(f"🔎 Поиск: {label}", key=f"{key}_query", placeholder="Например: sma 50 103")
+    options = search_connectors(catalog, query)
+    # Уже выбранный коннектор оставляем в списке, даже если он не подходит под запрос
+    current = st.session_state.get(key)
+    if current in catalog and current not in options:
+        options = [current] + options
+    if not options:
+        st.warning("Коннектор не найден")
+        return None
+    return st.selectbox(label, options, key=key)
+
+def harness_editor():
+    """Жгут на странице калькулятора: редактор сегментов, длины резов и
+    накопление допусков (расчет - harness.py, NumPy загружается только здесь)"""
+    import pandas as pd
+    from harness import (
+        HEADERS, PATH_HEADERS, Harness, evaluate, example_harness, export_harness, monte_carlo, read_harness,
+    )
     
-    # Обновляем Google Sheets (если доступно)
-    if USE_GOOGLE_SHEETS:
+    st.caption(
+        "Сегмент - кабель между двумя узлами (разъем, сросток, переходник, ветвление). "
+        "Коннекторы на концах - из каталога, пустое название - размер 0. "
+        "± Допуск - разброс длины сегмента для накопления допусков"
+    )
+    if "harness_df" not in st.session_state:
+        st.session_state.harness_df = example_harness()
+    uploaded = st.file_uploader("Загрузить жгут (CSV или XLSX)", type=["csv", "xlsx"], key="harness_file")
+    if uploaded is not None and st.session_state.get("harness_file_id") != uploaded.file_id:
         try:
-            from google_sheets_config import save_catalog_to_sheets
-            save_catalog_to_sheets(st.session_state.catalog)
+            st.session_state.harness_df = read_harness(uploaded.getvalue(), uploaded.name)
         except Exception as e:
-            st.warning(f"Не удалось обновить Google Sheets: {e}")
+            st.error(f"❌ Не удалось прочитать файл: {e}")
+        else:
+            st.session_state.harness_file_id = uploaded.file_id
+            # Правки редактора относятся к прежней таблице
+            st.session_state.pop("harness_editor", None)
+    
+    edited = st.data_editor(
+        st.session_state.harness_df.rename(columns=HEADERS),
+        num_rows="dynamic",
+        use_container_width=True,
+        key="harness_editor",
+        column_config={
+            HEADERS["tolerance_type"]: st.column_config.SelectboxColumn(options=["мм", "%"], default="мм"),
+            HEADERS["length"]: st.column_config.NumberColumn(min_value=0.0),
+            HEADERS["deviation"]: st.column_config.NumberColumn(min_value=0.0, default=0.0),
+        },
+    )
+    df = edited.rename(columns={header: column for column, header in HEADERS.items()})
+    try:
+        harness = Harness(df)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    segments, paths = evaluate(harness, st.session_state.catalog)
+    st.download_button("⬇️ Скачать жгут (CSV)", export_harness(harness.frame), file_name="harness.csv", mime="text/csv")
+    
+    st.subheader("Длины резов")
+    errors = int((segments["error"] != "").sum())
+    if errors:
+        st.warning(f"⚠️ Неизвестные коннекторы или неверные значения в {errors} сегментах - см. колонку 'Ошибка'")
+    columns = ["segment", "start", "end", "connector1", "size1", "connector2", "size2", "tolerance_mm", "cut_length", "error"]
+    st.dataframe(segments[columns].rename(columns=HEADERS), use_container_width=True, hide_index=True)
+    
+    st.subheader("Накопление допусков")
+    st.caption(
+        f"Пути от узла {harness.root}. Номинал - сумма длин сегментов с толерансом; "
+        "худший случай - ± сумма допусков, RSS - ± корень из суммы квадратов"
+    )
+    st.dataframe(paths.rename(columns=PATH_HEADERS), use_container_width=True, hide_index=True)
+    
+    st.subheader("🎲 Монте-Карло")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        samples = st.number_input("Выборок", min_value=10_000, max_value=10_000_000, value=1_000_000, step=100_000, key="mc_samples")
+    with col2:
+        distribution = st.radio("Распределение", ["Нормальное (допуск = 3σ)", "Равномерное"], key="mc_distribution")
+    with col3:
+        limit = st.number_input("Допуск сборки ± (мм)", min_value=0.0, value=0.0, step=0.5, key="mc_limit")
+    # Результат относится к этому жгуту и параметрам
+    mc_key = (int(pd.util.hash_pandas_object(harness.frame).sum()), samples, distribution, limit)
+    if st.button("🎲 Моделировать", type="primary"):
+        st.session_state.harness_mc = (mc_key, monte_carlo(
+            harness,
+            int(samples),
+            limit=limit or None,
+            distribution="uniform" if distribution == "Равномерное" else "normal",
+        ))
+    simulation = st.session_state.get("harness_mc")
+    if simulation is not None and simulation[0] == mc_key:
+        simulation = simulation[1]
+        st.dataframe(simulation.stats.rename(columns=PATH_HEADERS), use_container_width=True, hide_index=True)
+        path = st.selectbox("Распределение длины пути", range(len(paths)), format_func=lambda i: paths["path"].iat[i], key="mc_path")
+        st.bar_chart(simulation.histogram(path), x="Отклонение (мм)", y="Доля (%)")
 
-# Функция сохранения больше не нужна - данные редактируются только в Google Sheets
+# Как часто страница проверяет, сменилась ли версия каталога (с)
+CATALOG_POLL_INTERVAL = float(get_setting("CATALOG_POLL_INTERVAL", 5))
 
-# ---------- Интерфейс ----------
-# Загружаем каталог только при первом запуске или принудительном обновлении
-if "catalog" not in st.session_state or st.session_state.get("force_reload", False):
-    st.session_state.catalog = load_catalog()
-    st.session_state.force_reload = False
+@st.fragment(run_every=CATALOG_POLL_INTERVAL)
+def watch_catalog():
+    """Новая версия каталога (правка в другой сессии или процессе, загрузка
+    из Google Sheets) - перезапуск страницы. Сравниваются только номера
+    версий общего каталога в памяти, запросов к Google нет"""
+    service = get_catalog(st.session_state.catalog_key)
+    if service.current(refresh=False).version != st.session_state.catalog.version:
+        st.rerun()
+    if service.status() == "loading":
+        st.info("☁️ Загрузка каталога из Google Sheets...")
+
+@st.fragment(run_every=1)
+def cutting_progress():
+    """Ждет фоновую оптимизацию раскроя и перезапускает страницу с результатом"""
+    job = st.session_state.get("cut_job")
+    if job is None or job[1].done():
+        st.rerun()
+    st.info("⏳ Идет оптимизация раскроя...")
+
+@st.fragment(run_every=1)
+def label_progress():
+    """Прогресс задания на этикетки; по окончании - перезапуск страницы с архивом"""
+    job = st.session_state.get("label_job")
+    if job is None or job.status != "running":
+        st.rerun()
+    st.progress(job.progress, text=f"🏷️ Готово этикеток: {job.done} из {job.total}")
+    if st.button("⏹️ Отменить", key="label_cancel"):
+        job.cancel()
+
+# Замеры перезапуска: участки страницы, запросы к Google, профиль по желанию
+instrumentation.start_metrics_server()
+instrumentation.begin_rerun(st.session_state.get("current_page", "Калькулятор"), profile=st.session_state.get("profiling", False))
+
+# Выбранный каталог (линия производства); в память он загружается при
+# первом обращении, неактивные каталоги выгружаются (catalog_service)
+if st.session_state.get("catalog_key") not in CATALOGS:
+    st.session_state.catalog_key = next(iter(CATALOGS))
+service = get_catalog(st.session_state.catalog_key)
+
+# Общая для всех сессий версия каталога: правки любой сессии (и других
+# процессов с тем же CSV) применяются к ней без повторной загрузки, а
+# watch_catalog перезапускает страницу, когда версия сменилась. Первая
+# отрисовка не ждет сеть: пока каталог грузится, используется локальный снимок
+st.session_state.catalog = service.current()
 
 # Навигация по страницам
 if "current_page" not in st.session_state:
     st.session_state.current_page = "Калькулятор"
 
 # Боковая панель для навигации
+instrumentation.section("render.sidebar")
 with st.sidebar:
     st.title("📋 Навигация")
     
+    # Каталог линии производства: обе страницы работают с выбранным
+    if len(CATALOGS) > 1:
+        st.selectbox(
+            "📚 Каталог",
+            list(CATALOGS),
+            format_func=lambda key: CATALOGS[key]["title"],
+            key="catalog_key",
+        )
+    
     if st.button("🧮 Калькулятор", use_container_width=True):
         st.session_state.current_page = "Калькулятор"
         st.rerun()
@@ -135,6 +220,18 @@ with st.sidebar:
         st.session_state.current_page = "Управление"
         st.rerun()
     
+    if st.button("📦 Пакетный расчет", use_container_width=True):
+        st.session_state.current_page = "Пакетный расчет"
+        st.rerun()
+    
+    if st.button("🔁 Подбор пар", use_container_width=True):
+        st.session_state.current_page = "Подбор пар"
+        st.rerun()
+    
+    if st.button("✂️ Раскрой кабеля", use_container_width=True):
+        st.session_state.current_page = "Раскрой"
+        st.rerun()
+    
     st.divider()
     
     # Синхронизация
@@ -144,9 +241,37 @@ with st.sidebar:
             st.success("✅ Данные синхронизированы!")
         else:
             st.warning("⚠️ Синхронизация недоступна")
-        st.session_state.force_reload = True
         st.rerun()
     
+    sync_state = load_sync_state(service.storage) if service.use_sheets else {}
+    if service.use_sheets:
+        # Состояние фоновой очереди записи
+        queue_status = service.write_queue.status()
+        if queue_status["error"]:
+            retry_in = max(0, (queue_status["retry_at"] or 0) - time.time())
+            st.warning(f"⚠️ Не отправлено изменений: {queue_status['pending']}. Ошибка: {queue_status['error']} (повтор через {retry_in:.0f} с)")
+        elif queue_status["pending"]:
+            st.info(f"⏳ Отправляется в Google Sheets: {queue_status['pending']}")
+        last_sync = sync_state.get("finished_at")
+        if last_sync:
+            st.caption(f"Последняя синхронизация: {time.strftime('%d.%m %H:%M:%S', time.localtime(last_sync))}")
+    
+    # Конфликты: запись изменили и локально, и в таблице - выбирает пользователь
+    for conflict in sync_state.get("conflicts", []):
+        name = conflict["name"]
+        local_value = "удален" if conflict["local"]["deleted"] else f"{conflict['local']['size']} мм"
+        remote_value = "удален" if conflict["remote"]["deleted"] else f"{conflict['remote']['size']} мм"
+        st.warning(f"⚠️ Конфликт '{name}': локально {local_value}, в таблице {remote_value}")
+        col1, col2 = st.columns(2)
+        with col1:
+            keep_local = st.button("💾 Локальное", key=f"keep_local_{name}", use_container_width=True)
+        with col2:
+            keep_remote = st.button("☁️ Из таблицы", key=f"keep_remote_{name}", use_container_width=True)
+        if keep_local or keep_remote:
+            resolve_conflict(service.storage, conflict, "local" if keep_local else "remote")
+            sync_catalogs()
+            st.rerun()
+    
     st.divider()
     
     # Мини-конвертер
@@ -179,27 +304,32 @@ with st.sidebar:
     st.subheader("📊 Информация")
     st.caption(f"Коннекторов: {len(st.session_state.catalog)}")
     
-    # Информация о подключении (кэшируем статус)
-    if "connection_status" not in st.session_state:
-        if USE_GOOGLE_SHEETS:
-            try:
-                test_catalog = load_catalog_from_sheets()
-                if test_catalog:
-                    st.session_state.connection_status = "connected"
-                else:
-                    st.session_state.connection_status = "unavailable"
-            except:
-                st.session_state.connection_status = "unavailable"
-        else:
-            st.session_state.connection_status = "local_only"
-    
-    # Показываем кэшированный статус
-    if st.session_state.connection_status == "connected":
+    # Информация о подключении - по общему кэшу, без запросов к Google
+    connection_status = service.status()
+    if service.use_sheets and breaker.state == "open":
+        st.warning(f"⚠️ Google Sheets не отвечает, используются локальные данные (повтор через {breaker.retry_in():.0f} с)")
+    elif connection_status == "connected":
         st.success("☁️ Google Sheets подключен")
-    elif st.session_state.connection_status == "unavailable":
+    elif connection_status == "unavailable":
         st.warning("⚠️ Google Sheets недоступен")
-    else:
+    elif connection_status == "local_only":
         st.info("💾 Только локальные данные")
+    # Следит за новыми версиями каталога (и показывает загрузку из Google Sheets)
+    watch_catalog()
+    
+    # Диагностика: прошлый перезапуск по участкам, запросы к Google, профиль
+    with st.expander("🩺 Диагностика"):
+        st.checkbox("Профилировать перезапуски (cProfile)", key="profiling")
+        report = instrumentation.session_report()
+        if report and report["last"]:
+            last = report["last"]
+            st.caption(f"Прошлый перезапуск: {last['seconds'] * 1000:.0f} мс ({last['page']})")
+            for name, seconds in sorted(last["spans"].items(), key=lambda item: -item[1]):
+                st.caption(f"{name}: {seconds * 1000:.1f} мс")
+            calls = ", ".join(f"{kind}: {count}" for kind, count in report["calls"].items()) or "нет"
+            st.caption(f"Запросов к Google за сессию: {calls}")
+            if report["profile"] and st.session_state.get("profiling"):
+                st.code(report["profile"], language=None)
 
 # CSS стили для улучшения внешнего вида выпадающих списков
 st.markdown("""
@@ -235,16 +365,27 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Основной контент в зависимости от выбранной страницы
+instrumentation.section("render.page")
 if st.session_state.current_page == "Калькулятор":
     # Страница калькулятора
     st.title("🧮 Калькулятор длины кабеля")
     st.caption(f"📊 Коннекторов в базе: {len(st.session_state.catalog)}")
+    calc_mode = st.radio("Что считаем", ["Кабель", "Жгут"], horizontal=True, key="calc_mode")
     
     st.divider()
     
+    # Жгут: несколько сегментов с коннекторами, сростками и допусками
+    if calc_mode == "Жгут":
+        harness_editor()
+        instrumentation.finish_rerun()
+        st.stop()
+    
     # Основной калькулятор
-    conn1 = st.selectbox("1 Коннектор", list(st.session_state.catalog.keys()), key="conn1")
-    conn2 = st.selectbox("2 Коннектор", list(st.session_state.catalog.keys()), key="conn2")
+    conn1 = connector_picker("1 Коннектор", "conn1")
+    conn2 = connector_picker("2 Коннектор", "conn2")
+    if conn1 is None or conn2 is None:
+        instrumentation.finish_rerun()
+        st.stop()
     cable_len = st.number_input("Длина кабеля (мм)", min_value=0.0, step=1.0)
     
     # Переключатель типа толеранса
@@ -253,15 +394,15 @@ if st.session_state.current_page == "Калькулятор":
     # Поле ввода толеранса в зависимости от выбранного типа
     if tol_type == "мм":
         tol_value = st.number_input("Толеранц (мм)", value=0.0, step=0.1, key="tol_mm")
-        tol_mm = tol_value
     else:
         tol_percent = st.number_input("Толеранц (%)", value=0.0, step=0.1, key="tol_percent")
-        # Конвертируем % в мм (от длины кабеля)
-        tol_mm = (tol_percent / 100) * cable_len
+        tol_value = tol_percent
+    # Конвертируем % в мм (от длины кабеля)
+    tol_mm = tolerance_to_mm(tol_value, tol_type, cable_len)
     
     size1 = st.session_state.catalog[conn1]
     size2 = st.session_state.catalog[conn2]
-    final_len = cable_len - (size1 + size2) + tol_mm
+    final_len = compute_final_length(cable_len, size1, size2, tol_mm)
     
     st.write("Размер коннектора 1:", size1, "мм")
     st.write("Размер коннектора 2:", size2, "мм")
@@ -279,7 +420,7 @@ elif st.session_state.current_page == "Управление":
     st.title("⚙️ Управление коннекторами")
     
     # Кнопки управления
-    col1, col2 = st.columns([1, 1])
+    col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
         if st.button("➕ Добавить коннектор", type="primary", use_container_width=True):
             st.session_state.show_add_connector = True
@@ -290,6 +431,11 @@ elif st.session_state.current_page == "Управление":
             st.session_state.show_all_connectors = not st.session_state.get("show_all_connectors", False)
             st.rerun()
     
+    with col3:
+        if st.button("📥 Импорт из файла", use_container_width=True):
+            st.session_state.show_import = not st.session_state.get("show_import", False)
+            st.rerun()
+    
     st.divider()
     
     # Форма добавления коннектора
@@ -310,68 +456,24 @@ elif st.session_state.current_page == "Управление":
                 # Преобразуем название в верхний регистр
                 new_name_upper = new_name.upper().strip()
                 
-                # Проверяем дубликаты в Google Sheets и CSV
-                duplicate_found = False
-                
-                # Проверяем в Google Sheets
-                if USE_GOOGLE_SHEETS:
-                    try:
-                        from google_sheets_config import load_catalog_from_sheets
-                        sheets_catalog = load_catalog_from_sheets()
-                        if sheets_catalog and new_name_upper in sheets_catalog:
-                            st.error(f"❌ Коннектор '{new_name_upper}' уже существует в Google Sheets!")
-                            duplicate_found = True
-                    except:
-                        pass
-                
-                # Проверяем в CSV файле
-                if not duplicate_found and os.path.exists(CSV_FILE):
-                    with open(CSV_FILE, newline="", encoding="utf-8") as f:
-                        reader = csv.reader(f)
-                        for row in reader:
-                            if len(row) == 2 and row[0] == new_name_upper:
-                                st.error(f"❌ Коннектор '{new_name_upper}' уже существует в CSV файле!")
-                                duplicate_found = True
-                                break
-                
-                if not duplicate_found:
-                    # Приоритет 1: Добавляем в Google Sheets
-                    sheets_saved = False
-                    if USE_GOOGLE_SHEETS:
-                        try:
-                            from google_sheets_config import save_catalog_to_sheets
-                            # Загружаем текущий каталог и добавляем новый коннектор
-                            current_catalog = load_catalog()
-                            current_catalog[new_name_upper] = new_size
-                            sheets_saved = save_catalog_to_sheets(current_catalog)
-                        except Exception as e:
-                            st.warning(f"Не удалось сохранить в Google Sheets: {e}")
-                    
-                    # Приоритет 2: Добавляем в CSV файл
-                    csv_saved = False
-                    try:
-                        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-                            writer = csv.writer(f)
-                            writer.writerow([new_name_upper, new_size])
-                        csv_saved = True
-                    except Exception as e:
-                        st.warning(f"Не удалось сохранить в CSV: {e}")
-                    
-                    # Обновляем локальный каталог
-                    st.session_state.catalog[new_name_upper] = new_size
-                    
-                    # Показываем результат
-                    if sheets_saved and csv_saved:
-                        st.success(f"✅ Коннектор '{new_name_upper}' добавлен в Google Sheets и CSV!")
-                    elif sheets_saved:
-                        st.success(f"✅ Коннектор '{new_name_upper}' добавлен в Google Sheets!")
-                    elif csv_saved:
-                        st.success(f"✅ Коннектор '{new_name_upper}' добавлен в CSV файл!")
+                # Проверяем дубликаты: каталог сессии (Google Sheets + очередь) и CSV
+                if new_name_upper in st.session_state.catalog:
+                    st.error(f"❌ Коннектор '{new_name_upper}' уже существует!")
+                elif new_name_upper in service.storage:
+                    st.error(f"❌ Коннектор '{new_name_upper}' уже существует в CSV файле!")
+                else:
+                    # Изменение пишется в журнал CSV, в Google Sheets оно уйдет в фоне
+                    changes = [{"op": "add", "name": new_name_upper, "size": new_size}]
+                    # Каталог всех сессий обновится по журналу (CatalogService.publish)
+                    if update_catalog_files(changes):
+                        if service.use_sheets:
+                            st.success(f"✅ Коннектор '{new_name_upper}' добавлен! Отправка в Google Sheets идет в фоне")
+                        else:
+                            st.success(f"✅ Коннектор '{new_name_upper}' добавлен в CSV файл!")
                     else:
                         st.error("❌ Не удалось сохранить коннектор!")
                     
                     st.session_state.show_add_connector = False
-                    st.session_state.force_reload = True
                     st.rerun()
             elif submit:
                 st.error("❌ Пожалуйста, заполните все поля!")
@@ -380,40 +482,140 @@ elif st.session_state.current_page == "Управление":
                 st.session_state.show_add_connector = False
                 st.rerun()
     
+    # Массовый импорт библиотеки поставщика: предпросмотр, затем одна
+    # пакетная запись в журнал CSV и в Google Sheets
+    if st.session_state.get("show_import", False):
+        from catalog_import import PREVIEW_HEADERS, STATUS_LABELS, import_changes, prepare_import, read_library, template_csv
+        
+        st.subheader("📥 Импорт коннекторов из файла")
+        st.caption("CSV или XLSX с колонками: Название, Размер (мм)")
+        st.download_button("📄 Скачать шаблон", template_csv(), file_name="connectors_template.csv", mime="text/csv")
+        
+        uploaded = st.file_uploader("Библиотека коннекторов (CSV или XLSX)", type=["csv", "xlsx"], key="import_file")
+        if uploaded is not None:
+            # Предпросмотр считается один раз на файл и версию каталога
+            import_key = (uploaded.file_id, st.session_state.catalog.version)
+            if st.session_state.get("import_key") != import_key:
+                try:
+                    library = read_library(uploaded.getvalue(), uploaded.name)
+                except Exception as e:
+                    st.error(f"❌ Не удалось прочитать файл: {e}")
+                    st.stop()
+                st.session_state.import_preview = prepare_import(
+                    library, [st.session_state.catalog, service.storage.snapshot()]
+                )
+                st.session_state.import_key = import_key
+            preview = st.session_state.import_preview
+            
+            update_existing = st.checkbox("Обновлять размеры существующих коннекторов", key="import_update")
+            changes = import_changes(preview, update_existing)
+            counts = preview["status"].value_counts()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Строк в файле", len(preview))
+            with col2:
+                st.metric("Будет записано", len(changes))
+            with col3:
+                st.metric("Пропущено", len(preview) - len(changes))
+            skipped = int(counts.get("similar", 0) + counts.get("repeat", 0))
+            if skipped:
+                st.warning(f"⚠️ Строк с названиями, совпадающими с другими без учета регистра и разделителей: {skipped} - они не импортируются")
+            if counts.get("invalid", 0):
+                st.warning(f"⚠️ Строк без названия или с неверным размером: {int(counts['invalid'])}")
+            
+            # Сначала строки, требующие внимания; в браузер - только начало таблицы
+            order = {status: i for i, status in enumerate(["invalid", "similar", "repeat", "update", "add", "same"])}
+            shown = preview.sort_values("status", key=lambda column: column.map(order), kind="stable").head(200)
+            st.dataframe(
+                shown.assign(status=shown["status"].map(STATUS_LABELS)).rename(columns=PREVIEW_HEADERS),
+                use_container_width=True,
+                hide_index=True,
+            )
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                apply_import = st.button(f"✅ Импортировать ({len(changes)})", type="primary", disabled=not changes, use_container_width=True)
+            with col2:
+                cancel_import = st.button("❌ Отмена", key="cancel_import", use_container_width=True)
+            
+            if apply_import:
+                # Все строки - одна запись в журнал и одна отправка в Google Sheets
+                if update_catalog_files(changes):
+                    if service.use_sheets:
+                        st.success(f"✅ Импортировано коннекторов: {len(changes)}. Отправка в Google Sheets идет в фоне")
+                    else:
+                        st.success(f"✅ Импортировано коннекторов: {len(changes)}")
+                    st.session_state.show_import = False
+                    st.rerun()
+                else:
+                    st.error("❌ Не удалось сохранить коннекторы!")
+            if cancel_import:
+                st.session_state.show_import = False
+                st.rerun()
+    
     # Показ всех коннекторов с возможностью редактирования и удаления
     if st.session_state.get("show_all_connectors", False):
         st.subheader("📋 Все коннекторы в базе")
         
-        # Создаем DataFrame для красивого отображения
-        import pandas as pd
-        connectors_data = []
-        for name, size in st.session_state.catalog.items():
-            connectors_data.append({"Коннектор": name, "Размер (мм)": size})
+        catalog = st.session_state.catalog
         
-        if connectors_data:
-            df = pd.DataFrame(connectors_data)
-            df = df.sort_values("Коннектор")  # Сортируем по алфавиту
-            
-            st.dataframe(df, use_container_width=True)
-            
-            # Статистика
+        if len(catalog):
+            # Статистика хранится в каталоге и обновляется вместе с правками
+            stats = catalog.stats()
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Всего коннекторов", len(df))
+                st.metric("Всего коннекторов", stats["count"])
             with col2:
-                st.metric("Средний размер", f"{df['Размер (мм)'].mean():.1f} мм")
+                st.metric("Средний размер", f"{stats['mean']:.1f} мм")
             with col3:
-                st.metric("Максимальный размер", f"{df['Размер (мм)'].max():.1f} мм")
+                st.metric("Максимальный размер", f"{stats['max']:.1f} мм")
+            
+            # Фильтр, сортировка и страницы считаются на сервере,
+            # в браузер уходит только видимая страница
+            sorts = {
+                "Название ↑": ("name", False),
+                "Название ↓": ("name", True),
+                "Размер ↑": ("size", False),
+                "Размер ↓": ("size", True),
+            }
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col1:
+                name_filter = st.text_input("🔎 Фильтр по названию", key="table_filter")
+            with col2:
+                sort_label = st.selectbox("Сортировка", list(sorts), key="table_sort")
+            with col3:
+                page_size = st.selectbox("Строк на странице", [25, PAGE_SIZE, 100, 200], index=1, key="table_page_size")
+            
+            sort, descending = sorts[sort_label]
+            view = TableView(catalog, name_filter, sort, descending)
+            pages = view.page_count(page_size)
+            # После смены фильтра номер страницы может оказаться за концом
+            if st.session_state.get("table_page", 1) > pages:
+                st.session_state.table_page = pages
+            page = st.number_input(f"Страница (из {pages})", min_value=1, max_value=pages, step=1, key="table_page")
+            
+            with instrumentation.span("render.table"):
+                rows = view.page(page, page_size)
+            st.caption(f"Найдено: {len(view)}")
+            st.dataframe(
+                {"Коннектор": [name for name, _ in rows], "Размер (мм)": [size for _, size in rows]},
+                use_container_width=True,
+                hide_index=True,
+            )
             
             st.divider()
             
             # Управление коннекторами
             st.subheader("🔧 Редактирование коннекторов")
             
-            # Выбор коннектора для редактирования
+            # Выбор из видимой страницы таблицы (нужный коннектор находится фильтром)
+            options = [""] + [name for name, _ in rows]
+            current = st.session_state.get("edit_connector")
+            if current and current in catalog and current not in options:
+                options.append(current)
             selected_connector = st.selectbox(
                 "Выберите коннектор для редактирования:",
-                [""] + list(st.session_state.catalog.keys()),
+                options,
                 key="edit_connector"
             )
             
@@ -436,20 +638,20 @@ elif st.session_state.current_page == "Управление":
                                     st.error(f"❌ Коннектор '{new_name_upper}' уже существует!")
                                 else:
                                     # Удаляем старый и добавляем новый
-                                    del st.session_state.catalog[selected_connector]
-                                    st.session_state.catalog[new_name_upper] = new_size
+                                    changes = [
+                                        {"op": "delete", "name": selected_connector},
+                                        {"op": "add", "name": new_name_upper, "size": new_size},
+                                    ]
                                     
                                     # Обновляем файлы
-                                    update_catalog_files()
+                                    update_catalog_files(changes)
                                     st.success(f"✅ Коннектор переименован в '{new_name_upper}'!")
-                                    st.session_state.force_reload = True
                                     st.rerun()
                             else:
                                 # Изменяем только размер
-                                st.session_state.catalog[selected_connector] = new_size
-                                update_catalog_files()
+                                changes = [{"op": "update", "name": selected_connector, "size": new_size}]
+                                update_catalog_files(changes)
                                 st.success(f"✅ Размер коннектора '{selected_connector}' обновлен!")
-                                st.session_state.force_reload = True
                                 st.rerun()
                 
                 with col2:
@@ -458,10 +660,269 @@ elif st.session_state.current_page == "Управление":
                     
                     if st.button("🗑️ Удалить коннектор", type="secondary"):
                         if selected_connector in st.session_state.catalog:
-                            del st.session_state.catalog[selected_connector]
-                            update_catalog_files()
+                            changes = [{"op": "delete", "name": selected_connector}]
+                            update_catalog_files(changes)
                             st.success(f"✅ Коннектор '{selected_connector}' удален!")
-                            st.session_state.force_reload = True
                             st.rerun()
         else:
             st.info("Коннекторы не найдены")
+
+elif st.session_state.current_page == "Пакетный расчет":
+    # Страница пакетного расчета по спецификации
+    from batch_calc import RESULT_HEADERS, calculate_bom, export_results, read_bom, template_csv
+    
+    st.title("📦 Пакетный расчет")
+    st.caption("Загрузите спецификацию: 1 Коннектор, 2 Коннектор, Длина кабеля (мм), Толеранс, Тип толеранса (мм или %)")
+    st.download_button("📄 Скачать шаблон", template_csv(), file_name="bom_template.csv", mime="text/csv")
+    
+    uploaded = st.file_uploader("Спецификация (CSV или XLSX)", type=["csv", "xlsx"])
+    if uploaded is not None:
+        # Результат считается один раз на файл и версию каталога
+        bom_key = (uploaded.file_id, st.session_state.catalog.version)
+        if st.session_state.get("bom_key") != bom_key:
+            try:
+                bom = read_bom(uploaded.getvalue(), uploaded.name)
+            except Exception as e:
+                st.error(f"❌ Не удалось прочитать файл: {e}")
+                st.stop()
+            st.session_state.bom_result = calculate_bom(bom, st.session_state.catalog)
+            st.session_state.bom_key = bom_key
+        result = st.session_state.bom_result
+        
+        errors = int((result["error"] != "").sum())
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Строк", len(result))
+        with col2:
+            st.metric("С ошибками", errors)
+        if errors:
+            st.warning(f"⚠️ Неизвестные коннекторы или неверные значения в {errors} строках - см. колонку 'Ошибка'")
+        
+        # В браузер уходит только начало таблицы, полный результат - файлом
+        st.dataframe(result.head(100).rename(columns=RESULT_HEADERS), use_container_width=True)
+        
+        result_format = st.radio("Формат результата", ["CSV", "XLSX"], horizontal=True, key="bom_format")
+        if result_format == "XLSX":
+            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        else:
+            mime = "text/csv"
+        st.download_button(
+            "⬇️ Скачать результат",
+            export_results(result, result_format.lower()),
+            file_name=f"bom_result.{result_format.lower()}",
+            mime=mime,
+            type="primary",
+        )
+        
+        # Этикетки и карта резов рисуются в пуле процессов (label_jobs):
+        # страница только показывает прогресс и не мешает другим сессиям
+        from label_jobs import FORMATS, LabelJob, assemblies
+        
+        st.divider()
+        st.subheader("🏷️ Этикетки и карта резов")
+        label_formats = st.multiselect("Форматы", list(FORMATS), default=["zpl", "pdf"], format_func=FORMATS.get, key="label_formats")
+        job = st.session_state.get("label_job")
+        if job is not None and st.session_state.get("label_job_key") != bom_key:
+            # Архив для другого файла или версии каталога
+            job.cancel()
+            job = st.session_state.label_job = None
+        running = job is not None and job.status == "running"
+        if st.button("🏷️ Подготовить этикетки", disabled=running or not label_formats):
+            rows = assemblies(result)
+            if not rows:
+                st.warning("⚠️ Нет строк без ошибок")
+            else:
+                st.session_state.label_job = LabelJob(rows, label_formats, title=f"Карта резов: {uploaded.name}")
+                st.session_state.label_job_key = bom_key
+                st.rerun()
+        if running:
+            label_progress()
+        elif job is not None and job.status == "done":
+            st.success(f"✅ Этикеток: {job.total}, за {job.finished - job.started:.1f} с")
+            with open(job.path, "rb") as f:
+                st.download_button("⬇️ Скачать архив", f, file_name="labels.zip", mime="application/zip", type="primary")
+        elif job is not None and job.status == "error":
+            st.error(f"Ошибка подготовки этикеток: {job.error}")
+        elif job is not None and job.status == "cancelled":
+            st.info("Подготовка этикеток отменена")
+
+elif st.session_state.current_page == "Подбор пар":
+    # Обратный расчет: какие пары коннекторов дают нужную длину
+    import pandas as pd
+    from pair_table import get_pair_table
+    
+    st.title("🔁 Подбор пар коннекторов")
+    table = get_pair_table(st.session_state.catalog)
+    
+    mode = st.radio("Что ищем", ["Пары для длины кабеля", "Длина реза для пары"], horizontal=True, key="pairs_mode")
+    tol_type = st.radio("Тип толеранса", ["мм", "%"], horizontal=True, key="pairs_tol_type")
+    tolerance = st.number_input(f"Толеранс ({tol_type})", value=0.0, step=0.1, key="pairs_tolerance")
+    
+    if mode == "Пары для длины кабеля":
+        cable_len = st.number_input("Длина кабеля (мм)", min_value=0.0, step=1.0, key="pairs_cable_len")
+        col1, col2 = st.columns(2)
+        with col1:
+            min_final = st.number_input("Окончательная длина от (мм)", min_value=0.0, step=1.0, key="pairs_min")
+        with col2:
+            max_final = st.number_input("до (мм)", min_value=0.0, step=1.0, key="pairs_max")
+        total, rows = table.pairs_in_window(cable_len, min_final, max_final, tolerance, tol_type)
+        labels = {"final_length": "Окончательная длина (мм)"}
+    else:
+        final_length = st.number_input("Нужная окончательная длина (мм)", min_value=0.0, step=1.0, key="pairs_final")
+        connector = None
+        if st.checkbox("Только пары с коннектором", key="pairs_with_connector"):
+            connector = connector_picker("Коннектор", "pairs_connector")
+        total, rows = table.cut_lengths(final_length, tolerance, tol_type, connector)
+        labels = {"cable_len": "Длина реза (мм)"}
+    
+    st.caption(f"Подходящих пар: {total}" + (f" (показаны первые {len(rows)})" if total > len(rows) else ""))
+    if rows:
+        df = pd.DataFrame(rows).drop(columns=["tolerance_mm"], errors="ignore")
+        df = df.rename(columns={
+            "connector1": "1 Коннектор",
+            "connector2": "2 Коннектор",
+            "size1": "Размер 1 (мм)",
+            "size2": "Размер 2 (мм)",
+            **labels,
+        })
+        st.dataframe(df, use_container_width=True)
+
+
+elif st.session_state.current_page == "Раскрой":
+    # Раскрой бухт: окончательные длины раскладываются по бухтам
+    import pandas as pd
+    from cutting_plan import (
+        DEFAULT_TIME_LIMIT, HAS_SCIPY, PLAN_HEADERS, export_plan, parse_lengths, plan_ffd, read_cuts, submit,
+    )
+    
+    st.title("✂️ Раскрой кабеля")
+    st.caption("Резы раскладываются по бухтам так, чтобы остатков было меньше. Каждый рез занимает свою длину плюс припуск")
+    
+    source = st.radio("Резы", ["Список длин", "Файл", "Пакетный расчет"], horizontal=True, key="cut_source")
+    lengths, labels = [], None
+    if source == "Список длин":
+        text = st.text_area("Длины резов (мм)", key="cut_text", placeholder="1500\n870,5\n2300x4")
+        try:
+            lengths = parse_lengths(text)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+    elif source == "Файл":
+        uploaded = st.file_uploader("Резы (CSV или XLSX): длина, количество, метка", type=["csv", "xlsx"], key="cut_file")
+        if uploaded is not None:
+            # Файл читается один раз
+            if st.session_state.get("cut_file_id") != uploaded.file_id:
+                try:
+                    st.session_state.cut_file_cuts = read_cuts(uploaded.getvalue(), uploaded.name)
+                except Exception as e:
+                    st.error(f"❌ Не удалось прочитать файл: {e}")
+                    instrumentation.finish_rerun()
+                    st.stop()
+                st.session_state.cut_file_id = uploaded.file_id
+            lengths, labels = st.session_state.cut_file_cuts
+    else:
+        result = st.session_state.get("bom_result")
+        if result is None:
+            st.info("Сначала загрузите спецификацию на странице 📦 Пакетный расчет")
+        else:
+            result = result[result["error"] == ""]
+            lengths = result["final_length"].tolist()
+            labels = (result["connector1"] + " / " + result["connector2"]).tolist()
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        stocks_text = st.text_input("Длины бухт (мм)", value="100000", key="cut_stocks", help="Несколько длин - через пробел или ';'")
+    with col2:
+        kerf = st.number_input("Припуск на рез (мм)", min_value=0.0, value=0.0, step=0.5, key="cut_kerf")
+    try:
+        stocks = [stock for stock in parse_lengths(stocks_text) if stock > 0]
+    except ValueError as e:
+        st.error(f"❌ Длины бухт: {e}")
+        stocks = []
+    if not lengths or not stocks:
+        instrumentation.finish_rerun()
+        st.stop()
+    
+    # План FFD - сразу (10 000 резов - доли секунды), один раз на набор данных
+    plan_key = (hash(tuple(lengths)), len(lengths), tuple(stocks), kerf)
+    if st.session_state.get("cut_plan_key") != plan_key:
+        st.session_state.cut_plan = plan_ffd(lengths, stocks, kerf)
+        st.session_state.cut_plan_key = plan_key
+    plan = st.session_state.cut_plan
+    
+    # Оптимизация - в фоновом потоке: страница не ждет, результат заменит план FFD
+    if HAS_SCIPY and not plan.optimal:
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            time_limit = st.number_input("Лимит времени оптимизации (с)", min_value=1.0, max_value=300.0, value=DEFAULT_TIME_LIMIT, step=1.0, key="cut_time_limit")
+        with col2:
+            st.write("")
+            if st.button("🚀 Оптимизировать", use_container_width=True, disabled="cut_job" in st.session_state):
+                st.session_state.cut_job = (plan_key, submit(lengths, stocks, kerf, time_limit, start=plan))
+                st.rerun()
+    elif not HAS_SCIPY:
+        st.caption("Оптимизация недоступна: не установлен scipy. Показан план first fit decreasing")
+    
+    job = st.session_state.get("cut_job")
+    if job is not None:
+        job_key, future = job
+        if not future.done():
+            cutting_progress()
+        else:
+            del st.session_state.cut_job
+            try:
+                optimized = future.result()
+            except Exception as e:
+                st.error(f"Ошибка оптимизации: {e}")
+            else:
+                if job_key == plan_key:
+                    st.session_state.cut_plan = plan = optimized
+    
+    for i, reason in plan.unplaced[:5]:
+        st.warning(f"⚠️ Рез №{i + 1} ({lengths[i]} мм) не размещен: {reason}")
+    if len(plan.unplaced) > 5:
+        st.warning(f"⚠️ И еще {len(plan.unplaced) - 5} резов не размещено")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Резов", plan.cut_count)
+    with col2:
+        st.metric("Бухт", len(plan.spools))
+    with col3:
+        st.metric("Отходы", f"{plan.waste_percent:.2f} %")
+    with col4:
+        st.metric("Отходы (мм)", f"{plan.waste:.0f}")
+    method = "оптимизация" if plan.method == "optimize" else "first fit decreasing"
+    if plan.optimal:
+        st.success(f"✅ План оптимален ({method})")
+    elif plan.lower_bound:
+        st.caption(f"Метод: {method}. Нижняя граница расхода: {plan.lower_bound:.0f} мм, в плане: {plan.total_stock:.0f} мм")
+    
+    # В браузер уходит только начало таблиц, полный план - файлом
+    st.subheader("Бухты")
+    st.dataframe(
+        pd.DataFrame(plan.spool_rows()[:200]).rename(columns={
+            "spool": "Бухта",
+            "stock": "Длина бухты (мм)",
+            "cuts": "Резов",
+            "used": "Израсходовано (мм)",
+            "remainder": "Остаток (мм)",
+        }),
+        use_container_width=True,
+    )
+    st.subheader("Порядок резов")
+    st.dataframe(pd.DataFrame(plan.cut_rows(labels)[:500]).rename(columns=PLAN_HEADERS), use_container_width=True)
+    
+    plan_format = st.radio("Формат плана", ["CSV", "XLSX"], horizontal=True, key="cut_format")
+    if plan_format == "XLSX":
+        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        mime = "text/csv"
+    st.download_button(
+        "⬇️ Скачать план раскроя",
+        export_plan(plan, labels, plan_format.lower()),
+        file_name=f"cutting_plan.{plan_format.lower()}",
+        mime=mime,
+        type="primary",
+    )
+
+instrumentation.finish_rerun()
@@ -0,0 +1,150 @@
+# Пакетный расчет длины кабеля для целой спецификации (BOM)
+import io
+
+import numpy as np
+import pandas as pd
+
+from calculator import compute_final_length
+from catalog_store import CatalogSnapshot
+
+# Колонки результата и их возможные названия во входном файле
+COLUMNS = {
+    "connector1": ["коннектор 1", "1 коннектор", "connector1", "connector 1", "conn1"],
+    "connector2": ["коннектор 2", "2 коннектор", "connector2", "connector 2", "conn2"],
+    "length": ["длина кабеля (мм)", "длина кабеля", "длина", "length", "cable_len"],
+    "tolerance": ["толеранс", "толеранц", "tolerance", "tol"],
+    "tolerance_type": ["тип толеранса", "tolerance_type", "tol_type"],
+}
+
+# Заголовки результата - как подписи на странице калькулятора
+RESULT_HEADERS = {
+    "connector1": "1 Коннектор",
+    "connector2": "2 Коннектор",
+    "length": "Длина кабеля (мм)",
+    "tolerance": "Толеранс",
+    "tolerance_type": "Тип толеранса",
+    "size1": "Размер коннектора 1 (мм)",
+    "size2": "Размер коннектора 2 (мм)",
+    "tolerance_mm": "Толеранс (мм)",
+    "final_length": "Окончательная длина кабеля (мм)",
+    "error": "Ошибка",
+}
+
+
+def template_csv():
+    """Пример входного файла для скачивания"""
+    return (
+        "1 Коннектор;2 Коннектор;Длина кабеля (мм);Толеранс;Тип толеранса\n"
+        "16_SMA-50-2-103/111_NE;16_MCX-50-2-104;1000;5;мм\n"
+        "SF9351-60004;16_MCX-50-2-104;2500;0,5;%\n"
+    ).encode("utf-8")
+
+
+def read_table(data, filename, columns, required):
+    """Читает CSV/XLSX в DataFrame (все значения - строки).
+
+    Колонки переименовываются по словарю columns {колонка: [варианты
+    заголовка]}; если нет колонок из required - ValueError.
+    """
+    if filename.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(io.BytesIO(data), dtype=str)
+    else:
+        # Разделитель ';' обычно означает русский Excel с десятичной запятой
+        first_line = data[:4096].split(b"\n", 1)[0]
+        sep = ";" if first_line.count(b";") > first_line.count(b",") else ","
+        df = pd.read_csv(io.BytesIO(data), sep=sep, dtype=str, encoding="utf-8-sig")
+
+    renames = {}
+    for column in df.columns:
+        key = str(column).strip().lower()
+        for target, aliases in columns.items():
+            if key in aliases and target not in renames.values():
+                renames[column] = target
+    df = df.rename(columns=renames)
+
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        raise ValueError(
+            "Не найдены колонки: " + ", ".join(columns[c][0] for c in missing)
+        )
+    return df
+
+
+def read_bom(data, filename):
+    """Читает CSV/XLSX со спецификацией в DataFrame с колонками из COLUMNS"""
+    df = read_table(data, filename, COLUMNS, ("connector1", "connector2", "length"))
+    if "tolerance" not in df.columns:
+        df["tolerance"] = "0"
+    if "tolerance_type" not in df.columns:
+        df["tolerance_type"] = "мм"
+    return df[list(COLUMNS)]
+
+
+def to_number(series):
+    """Строки в числа (десятичная запятая допускается), ошибки - NaN"""
+    return pd.to_numeric(
+        series.fillna("").astype(str).str.strip().str.replace(",", ".", regex=False),
+        errors="coerce",
+    )
+
+
+def calculate_bom(df, catalog):
+    """Считает все строки за один проход.
+
+    Та же формула, что и на странице калькулятора:
+    final_len = cable_len - (size1 + size2) + tol_mm, где tol_mm для
+    толеранса в % считается от длины кабеля. Неизвестные коннекторы и
+    нечисловые значения попадают в колонку error.
+    """
+    result = pd.DataFrame({
+        "connector1": df["connector1"].fillna("").astype(str).str.strip(),
+        "connector2": df["connector2"].fillna("").astype(str).str.strip(),
+        "length": to_number(df["length"]),
+        "tolerance": to_number(df["tolerance"]).fillna(0.0),
+        "tolerance_type": df["tolerance_type"].fillna("мм").astype(str).str.strip().str.lower(),
+    })
+
+    # Поиск размеров - хеш-соединение с каталогом; названия в каталоге
+    # хранятся в верхнем регистре, поэтому при промахе пробуем upper()
+    if isinstance(catalog, CatalogSnapshot):
+        # CatalogSnapshot: готовые массивы, без обхода словаря
+        sizes = pd.Series(catalog.as_numpy(), index=catalog.names)
+    else:
+        sizes = pd.Series(catalog, dtype="float64")
+    for column, size_column in (("connector1", "size1"), ("connector2", "size2")):
+        found = result[column].map(sizes)
+        missing = found.isna()
+        if missing.any():
+            found[missing] = result.loc[missing, column].str.upper().map(sizes)
+        result[size_column] = found
+
+    length = result["length"].to_numpy()
+    percent = result["tolerance_type"].isin(["%", "процент", "percent"]).to_numpy()
+    tolerance = result["tolerance"].to_numpy()
+    result["tolerance_mm"] = np.where(percent, tolerance / 100 * length, tolerance)
+    result["final_length"] = compute_final_length(
+        length, result["size1"].to_numpy(), result["size2"].to_numpy(), result["tolerance_mm"].to_numpy()
+    )
+
+    # Пояснение для строк, которые не удалось посчитать
+    unknown1 = result["size1"].isna()
+    unknown2 = result["size2"].isna()
+    bad_length = result["length"].isna()
+    error = pd.Series("", index=result.index)
+    error = error.mask(unknown1, error + "неизвестный коннектор 1 '" + result["connector1"] + "'; ")
+    error = error.mask(unknown2, error + "неизвестный коннектор 2 '" + result["connector2"] + "'; ")
+    error = error.mask(bad_length, error + "неверная длина; ")
+    result["error"] = error.str.rstrip("; ")
+    return result
+
+
+def export_results(result, fmt="csv"):
+    """Результат в виде файла для скачивания (bytes)"""
+    out = result.rename(columns=RESULT_HEADERS)
+    buffer = io.BytesIO()
+    if fmt == "xlsx":
+        out.to_excel(buffer, index=False)
+    else:
+        # utf-8-sig и ';' - чтобы русский Excel открыл файл без мастера импорта
+        out.to_csv(buffer, index=False, sep=";", decimal=",", encoding="utf-8-sig", float_format="%.2f")
+    return buffer.getvalue()
@@ -0,0 +1,83 @@
+# Холодный старт приложения: импорты и первая отрисовка калькулятора
+#
+# Запуск из корня репозитория:
+#   python benchmarks/cold_start.py
+# Измерение идет в отдельном процессе (python -X importtime), чтобы модули
+# не были уже загружены. Печатает JSON: время импорта модулей приложения,
+# время первого запуска страницы, самые долгие импорты и какие тяжелые
+# библиотеки оказались загружены.
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Не нужны странице калькулятора: загружаются только на своих страницах
+# (requests не в списке - его загружает фоновая загрузка каталога)
+HEAVY_MODULES = ("numpy", "pandas", "gspread", "google.oauth2")
+TOP_IMPORTS = 10
+
+
+def _child(workdir):
+    """Выполняется в новом процессе: импорт и первый запуск app.py"""
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    start = time.perf_counter()
+    import catalog_service  # noqa: F401
+    import_s = time.perf_counter() - start
+
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    first_run_s = time.perf_counter() - start
+    rendered = any(s.label == "1 Коннектор" for s in app.selectbox)
+
+    print(json.dumps({
+        "import_s": import_s,
+        "first_run_s": first_run_s,
+        "rendered": rendered,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def _top_imports(stderr):
+    """Самые долгие импорты верхнего уровня из вывода -X importtime"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # Отступ в имени - уровень вложенности импорта
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        imports.append((int(cumulative) / 1e6, name.strip()))
+    imports.sort(reverse=True)
+    return [{"module": name, "seconds": seconds} for seconds, name in imports[:TOP_IMPORTS]]
+
+
+def measure():
+    """Отчет о холодном старте (словарь)"""
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "connectors.csv"), "w", encoding="utf-8") as f:
+            f.write("SMA-M,10.5\nSMA-F,9.0\n")
+        env = dict(os.environ)
+        # Google недоступен мгновенно: измеряется только локальный старт
+        env["GOOGLE_SHEETS_EXPORT_URL"] = "http://127.0.0.1:9/export.csv?id={id}"
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child", workdir],
+            capture_output=True, text=True, env=env, check=True,
+        )
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["top_imports"] = _top_imports(completed.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        _child(sys.argv[2])
+    else:
+        print(json.dumps(measure(), ensure_ascii=False, indent=2))
@@ -0,0 +1,500 @@
+# Бенчмарки каталога, поиска, расчета и сохранения
+#
+# Запуск из корня репозитория:
+#   python benchmarks/run_benchmarks.py --output bench.json --check
+# --check сравнивает результаты с benchmarks/thresholds.json и завершает
+# работу с кодом 1, если какой-то показатель вышел за порог.
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import catalog_storage  # noqa: E402
+from catalog_binary import open_snapshot, write_snapshot  # noqa: E402
+import google_sheets_config  # noqa: E402
+from catalog_store import CatalogSnapshot  # noqa: E402
+from catalog_view import TableView  # noqa: E402
+from connector_search import ConnectorIndex  # noqa: E402
+from pair_table import get_pair_table  # noqa: E402
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+SIZES = (1_000, 10_000, 100_000)
+FAMILIES = ["SMA", "MCX", "SF", "BNC", "TNC", "N", "QMA", "SMB", "MMCX"]
+
+
+def make_catalog(count, seed=1):
+    """Детерминированный каталог с названиями как в реальной базе"""
+    rng = random.Random(seed)
+    catalog = {}
+    while len(catalog) < count:
+        name = (
+            f"{rng.randint(1, 99)}_{rng.choice(FAMILIES)}-{rng.choice([50, 75])}-"
+            f"{rng.randint(1, 9)}-{rng.randint(100, 999)}/{rng.randint(100, 199)}_{rng.choice(['NE', 'E', 'NH'])}"
+        )
+        catalog[name] = round(rng.uniform(1, 20), 1)
+    return catalog
+
+
+def timed(fn, repeat=5):
+    """Медиана времени выполнения (секунды)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def write_csv(path, catalog):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for name, size in catalog.items():
+            f.write(f"{name},{size}\n")
+
+
+# ---------- Локальный CSV ----------
+def bench_csv_load(results, workdir):
+    for count in SIZES:
+        path = os.path.join(workdir, f"load_{count}.csv")
+        write_csv(path, make_catalog(count))
+        # Новый объект - холодная загрузка снимка, как при старте процесса
+        results[f"csv_load_{count}"] = timed(lambda: catalog_storage.CatalogStorage(path).load())
+
+
+# ---------- Экспорт Google Sheets через локальный HTTP сервер ----------
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_export_server(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_sheets_parse(results, workdir, server):
+    port = server.server_address[1]
+    for count in SIZES:
+        with open(os.path.join(workdir, f"export_{count}.csv"), "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(google_sheets_config.SHEET_HEADER) + "\n")
+            for name, size in make_catalog(count).items():
+                f.write(f"{name},{size},1,0,\n")
+        google_sheets_config.EXPORT_URL = f"http://127.0.0.1:{port}/export_{count}.csv?id={{id}}"
+        # Без If-Modified-Since: локальный сервер иначе ответит 304 без тела
+        results[f"sheets_load_{count}"] = timed(google_sheets_config._fetch_catalog_from_sheets, repeat=3)
+
+
+# ---------- Запись в Google Sheets (gspread с подсчетом запросов) ----------
+class FakeWorksheet:
+    """Лист в памяти; каждый метод - один запрос к API"""
+
+    def __init__(self, calls, rows=None, sheet_id=1):
+        self.calls = calls
+        self.rows = rows or []
+        self.id = sheet_id
+        self.index = 0
+        self.row_count = max(len(self.rows), 1000)
+        self.col_count = len(google_sheets_config.SHEET_HEADER)
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def get_all_values(self, **kwargs):
+        self._call("get_all_values")
+        return [list(row) for row in self.rows]
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        for item in data:
+            start = int(item["range"].split(":")[0][1:])
+            for offset, values in enumerate(item["values"]):
+                while len(self.rows) < start + offset:
+                    self.rows.append([])
+                self.rows[start + offset - 1] = [str(value) for value in values]
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._call("update")
+        self.rows = [[str(value) for value in row] for row in values]
+
+    def add_rows(self, count):
+        self._call("add_rows")
+        self.row_count += count
+
+    def add_cols(self, count):
+        self._call("add_cols")
+        self.col_count += count
+
+
+class FakeSpreadsheet:
+    def __init__(self, calls):
+        self.calls = calls
+        self.sheets = {google_sheets_config.WORKSHEET_NAME: FakeWorksheet(calls)}
+
+    def worksheet(self, title):
+        if title not in self.sheets:
+            import gspread
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.calls["add_worksheet"] = self.calls.get("add_worksheet", 0) + 1
+        self.sheets[title] = FakeWorksheet(self.calls, sheet_id=len(self.sheets) + 1)
+        return self.sheets[title]
+
+    def del_worksheet(self, worksheet):
+        self.calls["del_worksheet"] = self.calls.get("del_worksheet", 0) + 1
+
+    def batch_update(self, body):
+        self.calls["spreadsheet_batch_update"] = self.calls.get("spreadsheet_batch_update", 0) + 1
+        staging_id = body["requests"][1]["updateSheetProperties"]["properties"]["sheetId"]
+        staging = next(sheet for sheet in self.sheets.values() if sheet.id == staging_id)
+        self.sheets = {google_sheets_config.WORKSHEET_NAME: staging}
+
+
+def bench_sheets_save(results):
+    if not google_sheets_config.HAS_GSPREAD:
+        print("gspread не установлен - пропускаю бенчмарк сохранения")
+        return
+    calls = {}
+    spreadsheet = FakeSpreadsheet(calls)
+
+    class FakeClient:
+        def open_by_key(self, key):
+            return spreadsheet
+
+    original = google_sheets_config.get_google_sheets_client
+    google_sheets_config.get_google_sheets_client = lambda: FakeClient()
+    try:
+        catalog = make_catalog(2_000)
+        results["sheets_save_initial_2000_s"] = timed(
+            lambda: google_sheets_config.save_catalog_to_sheets(catalog), repeat=1
+        )
+        results["sheets_save_initial_2000_calls"] = sum(calls.values())
+
+        # Одна правка на "Управлении": переименование коннектора
+        calls.clear()
+        name = next(iter(catalog))
+        catalog["RENAMED-" + name] = catalog.pop(name)
+        results["sheets_save_rename_2000_s"] = timed(
+            lambda: google_sheets_config.save_catalog_to_sheets(catalog), repeat=1
+        )
+        results["sheets_save_rename_2000_calls"] = sum(calls.values())
+    finally:
+        google_sheets_config.get_google_sheets_client = original
+
+
+# ---------- Поиск и расчет ----------
+def bench_search(results):
+    catalog = make_catalog(50_000)
+    start = time.perf_counter()
+    index = ConnectorIndex(catalog)
+    results["search_index_build_50000"] = time.perf_counter() - start
+    queries = ["s", "sma", "sma 50 2", "16_SMA-50-2-103", "103", "smq-50-2-103", "zzzz"]
+    results["search_query_50000_max"] = max(timed(lambda q=q: index.search(q), repeat=20) for q in queries)
+
+
+def bench_pairs(results):
+    catalog = CatalogSnapshot.from_dict(make_catalog(50_000))
+    start = time.perf_counter()
+    table = get_pair_table(catalog)
+    results["pairs_build_50000"] = time.perf_counter() - start
+    results["pairs_window_50000"] = timed(lambda: table.pairs_in_window(1000, 980, 981), repeat=20)
+    results["pairs_cut_lengths_50000"] = timed(lambda: table.cut_lengths(990, connector=catalog.names[0]), repeat=20)
+    # Правка одного коннектора - таблица обновляется, а не строится заново
+    changed = catalog.with_changes([{"op": "update", "name": catalog.names[1], "size": 33.3}])
+    start = time.perf_counter()
+    get_pair_table(changed)
+    results["pairs_incremental_50000"] = time.perf_counter() - start
+
+
+def bench_table(results):
+    catalog = CatalogSnapshot.from_dict(make_catalog(100_000))
+    catalog.stats()
+    catalog.by_size()
+    # Страница таблицы управления и правка одного коннектора
+    results["table_page_100000"] = timed(lambda: TableView(catalog, "", "size", True).page(100), repeat=20)
+    change = [{"op": "update", "name": catalog.names[1], "size": 33.3}]
+    results["catalog_edit_100000"] = timed(lambda: catalog.with_changes(change).stats(), repeat=5)
+    results["table_filter_100000"] = timed(lambda: TableView(catalog.with_changes(change), "sma 5"), repeat=3)
+
+
+def bench_binary_snapshot(results, workdir):
+    catalog = CatalogSnapshot.from_dict(make_catalog(100_000))
+    path = os.path.join(workdir, "catalog.bin")
+    results["binary_write_100000"] = timed(lambda: write_snapshot(path, catalog.names, catalog.sizes), repeat=3)
+    # Открытие и поиск по названию - без разбора файла
+    results["binary_open_100000"] = timed(lambda: CatalogSnapshot.from_mapped(open_snapshot(path)), repeat=20)
+    mapped = CatalogSnapshot.from_mapped(open_snapshot(path))
+    names = [catalog.names[i] for i in range(0, len(catalog), 997)]
+    results["binary_lookup_100_names"] = timed(lambda: [mapped[name] for name in names], repeat=20)
+
+
+def bench_batch_calc(results):
+    try:
+        import pandas as pd
+        from batch_calc import calculate_bom
+    except ImportError:
+        print("pandas не установлен - пропускаю бенчмарк пакетного расчета")
+        return
+    catalog = make_catalog(10_000)
+    names = list(catalog)
+    rng = random.Random(2)
+    bom = pd.DataFrame({
+        "connector1": [rng.choice(names) for _ in range(100_000)],
+        "connector2": [rng.choice(names) for _ in range(100_000)],
+        "length": [str(rng.randint(100, 5000)) for _ in range(100_000)],
+        "tolerance": ["1,5"] * 100_000,
+        "tolerance_type": [rng.choice(["мм", "%"]) for _ in range(100_000)],
+    })
+    results["batch_calc_100000"] = timed(lambda: calculate_bom(bom, catalog), repeat=3)
+
+
+def bench_import(results, workdir):
+    try:
+        import pandas as pd
+        from catalog_import import import_changes, prepare_import
+    except ImportError:
+        print("pandas не установлен - пропускаю бенчмарк импорта")
+        return
+    catalog = CatalogSnapshot.from_dict(make_catalog(100_000))
+    catalog.key_index()
+    names = list(catalog.names)
+    rng = random.Random(3)
+    # Библиотека поставщика: новые названия, повторы каталога и варианты
+    # написания с другими разделителями
+    library = [(f"NEW-{i}", "2,5") for i in range(4_000)]
+    library += [(rng.choice(names), "3") for _ in range(500)]
+    library += [(rng.choice(names).replace("-", "_").lower(), "3") for _ in range(500)]
+    df = pd.DataFrame(library, columns=["name", "size"])
+    results["import_preview_5000"] = timed(lambda: prepare_import(df, [catalog]), repeat=3)
+    changes = import_changes(prepare_import(df, [catalog]))
+    path = os.path.join(workdir, "import.csv")
+
+    def write():
+        if os.path.exists(path + ".journal"):
+            os.remove(path + ".journal")
+        catalog_storage.CatalogStorage(path).apply_changes(changes)
+    results["import_write_4000"] = timed(write, repeat=3)
+
+
+def bench_cutting(results):
+    try:
+        from cutting_plan import HAS_SCIPY, optimize, plan_ffd
+    except ImportError:
+        print("pandas не установлен - пропускаю бенчмарк раскроя")
+        return
+    rng = random.Random(4)
+    kinds = [rng.randint(300, 4000) + 0.5 for _ in range(60)]
+    lengths = [rng.choice(kinds) for _ in range(10_000)]
+    stocks = [100_000, 50_000]
+    results["cutting_ffd_10000"] = timed(lambda: plan_ffd(lengths, stocks, 2.0), repeat=3)
+    if not HAS_SCIPY:
+        print("scipy не установлен - пропускаю бенчмарк оптимизации раскроя")
+        return
+    # Оптимизация должна укладываться в лимит времени
+    start = time.perf_counter()
+    optimize(lengths, stocks, 2.0, time_limit=5.0)
+    results["cutting_optimize_10000_s"] = time.perf_counter() - start
+    # Почти все длины разные (точность 0,1 мм): тысячи предметов в LP и рюкзаке
+    distinct = [round(rng.uniform(700, 2600), 1) for _ in range(10_000)]
+    start = time.perf_counter()
+    optimize(distinct, [5_000, 6_100], 2.0, time_limit=5.0)
+    results["cutting_optimize_distinct_10000_s"] = time.perf_counter() - start
+
+
+def bench_labels(results):
+    try:
+        import label_jobs
+    except ImportError:
+        print("Pillow не установлен - пропускаю бенчмарк этикеток")
+        return
+    rng = random.Random(5)
+    names = list(make_catalog(1_000))
+    rows = [
+        {
+            "number": i + 1,
+            "connector1": rng.choice(names),
+            "connector2": rng.choice(names),
+            "length": float(rng.randint(100, 5000)),
+            "tolerance": 1.5,
+            "tolerance_type": "мм",
+            "tolerance_mm": 1.5,
+            "final_length": float(rng.randint(100, 5000)),
+        }
+        for i in range(1_000)
+    ]
+    # Вместе с запуском процессов пула
+    job = label_jobs.LabelJob(rows, ["zpl", "pdf"])
+    while job.status == "running":
+        time.sleep(0.05)
+    results["labels_1000_s"] = job.finished - job.started
+
+
+def bench_harness(results):
+    try:
+        import pandas as pd
+        from harness import Harness, evaluate, monte_carlo
+    except ImportError:
+        print("NumPy/pandas не установлены - пропускаю бенчмарк жгутов")
+        return
+    catalog = make_catalog(10_000)
+    names = list(catalog)
+    rng = random.Random(6)
+
+    def tree(count):
+        """Случайное дерево: каждый сегмент идет от уже существующего узла"""
+        return pd.DataFrame([
+            {
+                "segment": f"W{i}",
+                "start": f"N{rng.randint(0, i)}",
+                "end": f"N{i + 1}",
+                "connector1": rng.choice(names + [""]),
+                "connector2": rng.choice(names),
+                "length": float(rng.randint(100, 3000)),
+                "tolerance": 1.0,
+                "tolerance_type": rng.choice(["мм", "%"]),
+                "deviation": rng.choice([1.0, 2.0, 5.0]),
+            }
+            for i in range(count)
+        ])
+
+    large = tree(1_000)
+    results["harness_evaluate_1000"] = timed(lambda: evaluate(Harness(large), catalog), repeat=3)
+    harness = Harness(tree(30))
+    results["harness_monte_carlo_1e6"] = timed(lambda: monte_carlo(harness, 1_000_000, limit=5.0, seed=1), repeat=3)
+
+
+# ---------- Страница калькулятора через AppTest ----------
+def bench_app_rerun(results, workdir, server):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit не установлен - пропускаю бенчмарк перезапуска страницы")
+        return
+    appdir = os.path.join(workdir, "app")
+    os.makedirs(appdir, exist_ok=True)
+    catalog = make_catalog(10_000)
+    write_csv(os.path.join(appdir, "connectors.csv"), catalog)
+    port = server.server_address[1]
+    google_sheets_config.EXPORT_URL = f"http://127.0.0.1:{port}/export_10000.csv?id={{id}}"
+
+    cwd = os.getcwd()
+    os.chdir(appdir)
+    try:
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+        start = time.perf_counter()
+        app.run()
+        results["app_first_run_10000"] = time.perf_counter() - start
+        results["app_rerun_10000"] = timed(app.run, repeat=5)
+    finally:
+        os.chdir(cwd)
+
+
+# ---------- Холодный старт ----------
+def bench_cold_start(results):
+    try:
+        import streamlit  # noqa: F401
+    except ImportError:
+        print("streamlit не установлен - пропускаю бенчмарк холодного старта")
+        return
+    from cold_start import measure
+    report = measure()
+    results["cold_import_s"] = report["import_s"]
+    results["cold_first_run_s"] = report["first_run_s"]
+    results["cold_heavy_modules"] = len(report["heavy_modules"])
+    if report["heavy_modules"]:
+        print("При старте загружены: " + ", ".join(report["heavy_modules"]))
+
+
+# ---------- Одновременное добавление коннекторов ----------
+def _add_connectors(path, worker, count):
+    storage = catalog_storage.CatalogStorage(path)
+    for i in range(count):
+        storage.add(f"W{worker}-{i}", float(i))
+
+
+def bench_concurrent_adds(results, workdir, workers=4, per_worker=250):
+    path = os.path.join(workdir, "concurrent.csv")
+    processes = [Process(target=_add_connectors, args=(path, w, per_worker)) for w in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    loaded = catalog_storage.CatalogStorage(path).load()
+    results["concurrent_adds_1000_s"] = elapsed
+    results["concurrent_adds_lost"] = workers * per_worker - len(loaded)
+
+
+def check(results, thresholds):
+    """Список превышенных порогов"""
+    failures = []
+    for name, limit in thresholds.items():
+        if name in results and results[name] > limit:
+            failures.append(f"{name}: {results[name]:.4g} > {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки калькулятора длины кабеля")
+    parser.add_argument("--output", default="bench_output.json", help="куда записать JSON с результатами")
+    parser.add_argument("--check", action="store_true", help="сравнить с thresholds.json")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_export_server(workdir)
+        try:
+            bench_csv_load(results, workdir)
+            bench_sheets_parse(results, workdir, server)
+            bench_sheets_save(results)
+            bench_search(results)
+            bench_pairs(results)
+            bench_table(results)
+            bench_binary_snapshot(results, workdir)
+            bench_batch_calc(results)
+            bench_import(results, workdir)
+            bench_cutting(results)
+            bench_labels(results)
+            bench_harness(results)
+            bench_app_rerun(results, workdir, server)
+            bench_cold_start(results)
+            bench_concurrent_adds(results, workdir)
+        finally:
+            server.shutdown()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    for name, value in results.items():
+        print(f"{name:36} {value:.4g}")
+
+    if args.check:
+        with open(THRESHOLDS_FILE, encoding="utf-8") as f:
+            failures = check(results, json.load(f))
+        if failures:
+            print("\nРегрессии:\n  " + "\n  ".join(failures))
+            sys.exit(1)
+        print("\nВсе показатели в пределах порогов")
+
+
+if __name__ == "__main__":
+    main()
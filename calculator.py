@@ -0,0 +1,35 @@
+# Расчет длины кабеля без привязки к интерфейсу
+
+
+def tolerance_to_mm(tolerance, tolerance_type, cable_len):
+    """Толеранс в мм; для толеранса в % - от длины кабеля"""
+    if tolerance_type == "%":
+        return (tolerance / 100) * cable_len
+    return tolerance
+
+
+def compute_final_length(cable_len, size1, size2, tol_mm=0.0):
+    """Окончательная длина кабеля с учетом размеров двух коннекторов.
+
+    Работает и с числами, и с массивами NumPy (пакетный расчет).
+    """
+    return cable_len - (size1 + size2) + tol_mm
+
+
+def calculate(catalog, connector1, connector2, cable_len, tolerance=0.0, tolerance_type="мм"):
+    """Полный расчет для пары коннекторов из каталога.
+
+    Возвращает словарь с размерами, толерансом в мм и окончательной длиной;
+    для неизвестного коннектора бросает KeyError.
+    """
+    size1 = catalog[connector1]
+    size2 = catalog[connector2]
+    tol_mm = tolerance_to_mm(tolerance, tolerance_type, cable_len)
+    return {
+        "connector1": connector1,
+        "connector2": connector2,
+        "size1": size1,
+        "size2": size2,
+        "tolerance_mm": tol_mm,
+        "final_length": compute_final_length(cable_len, size1, size2, tol_mm),
+    }
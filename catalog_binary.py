@@ -0,0 +1,154 @@
+# Двоичный снимок каталога: открывается через mmap без разбора
+#
+# Файл (все числа little-endian):
+#   заголовок  HEADER: "CCSN", версия формата, число коннекторов, размер
+#              таблицы строк, crc32 тела, отпечаток данных, из которых
+#              собран снимок (см. CatalogStorage.file_stamp)
+#   размеры    float64[count]
+#   смещения   uint32[count + 1] - начало каждого названия в таблице строк
+#   строки     названия UTF-8 подряд, в порядке сортировки
+#
+# Процессы открывают один и тот же файл через mmap, поэтому страницы
+# снимка лежат в памяти один раз (кэш страниц ОС), а открытие не зависит от
+# размера каталога: названия декодируются только при обращении к ним.
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Sequence
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CCSN"
+FORMAT_VERSION = 1
+# magic, версия, резерв, count, размер строк, crc32, 4 байта выравнивания,
+# отпечаток: inode, mtime_ns и размер CSV, размер журнала (-1 - нет файла)
+HEADER = struct.Struct("<4sHHIII4xqqqq")
+
+
+class SnapshotError(ValueError):
+    """Файл снимка поврежден или другого формата"""
+
+
+def _encode_stamp(stamp):
+    csv_stamp, journal_size = stamp if stamp is not None else (None, None)
+    ino, mtime_ns, size = csv_stamp if csv_stamp is not None else (-1, -1, -1)
+    return ino, mtime_ns, size, -1 if journal_size is None else journal_size
+
+
+def _decode_stamp(ino, mtime_ns, size, journal_size):
+    csv_stamp = None if ino == -1 and mtime_ns == -1 and size == -1 else (ino, mtime_ns, size)
+    return csv_stamp, None if journal_size == -1 else journal_size
+
+
+def write_snapshot(path, names, sizes, stamp=None):
+    """Записывает снимок атомарно (временный файл + os.replace).
+
+    names - отсортированные названия, sizes - размеры в том же порядке,
+    stamp - отпечаток исходных данных, по которому снимок проверяется при
+    открытии (None - не проверять).
+    """
+    offsets = array("I", [0])
+    strings = bytearray()
+    for name in names:
+        strings += name.encode("utf-8")
+        offsets.append(len(strings))
+    size_column = array("d", sizes)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        size_column.byteswap()
+    # Таблица строк дополняется до 8 байт - размер файла кратен 8
+    strings += b"\0" * (-len(strings) % 8)
+    body = [size_column.tobytes(), offsets.tobytes(), bytes(strings)]
+    checksum = 0
+    for part in body:
+        checksum = zlib.crc32(part, checksum)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, len(size_column), len(strings), checksum, *_encode_stamp(stamp)
+    )
+
+    # У каждого процесса свой временный файл - запись может идти одновременно
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            for part in body:
+                f.write(part)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MappedNames(Sequence):
+    """Названия из таблицы строк снимка; декодируются при обращении"""
+
+    def __init__(self, offsets, strings):
+        self._offsets = offsets
+        self._strings = strings
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return str(self._strings[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        strings = self._strings
+        offsets = self._offsets
+        for i in range(len(offsets) - 1):
+            yield str(strings[offsets[i]:offsets[i + 1]], "utf-8")
+
+
+class MappedSnapshot:
+    """Открытый снимок: names (MappedNames), sizes (memoryview float64), stamp"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = memoryview(self._mmap)
+        if len(data) < HEADER.size:
+            raise SnapshotError(f"{path}: файл короче заголовка")
+        magic, version, _, count, strings_size, checksum, *stamp = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(f"{path}: неизвестный формат")
+        sizes_end = HEADER.size + 8 * count
+        offsets_end = sizes_end + 4 * (count + 1)
+        if len(data) != offsets_end + strings_size:
+            raise SnapshotError(f"{path}: неверная длина файла")
+        self.path = path
+        self.checksum = checksum
+        self.stamp = _decode_stamp(*stamp)
+        self.sizes = data[HEADER.size:sizes_end].cast("d")
+        self._body = data[HEADER.size:]
+        self.names = MappedNames(data[sizes_end:offsets_end].cast("I"), data[offsets_end:])
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def verify(self):
+        """Сверка crc32 тела (один проход по файлу, без разбора)"""
+        return zlib.crc32(self._body) == self.checksum
+
+
+def open_snapshot(path):
+    """Открывает снимок; None - файла нет, он поврежден или платформа big-endian"""
+    if sys.byteorder != "little" or not os.path.exists(path):
+        return None
+    try:
+        return MappedSnapshot(path)
+    except (OSError, ValueError) as e:
+        logger.warning("Не удалось открыть снимок каталога %s: %s", path, e)
+        return None
@@ -0,0 +1,115 @@
+# Массовый импорт коннекторов из библиотеки поставщика (CSV/XLSX)
+import pandas as pd
+
+from batch_calc import read_table, to_number
+from catalog_store import CatalogSnapshot
+from connector_search import name_keys
+
+# Колонки библиотеки и их возможные названия во входном файле
+COLUMNS = {
+    "name": ["название", "название коннектора", "коннектор", "name", "connector", "part", "part number"],
+    "size": ["размер (мм)", "размер", "size", "size_mm", "size (mm)"],
+}
+
+# Что будет сделано со строкой при импорте
+STATUS_LABELS = {
+    "add": "➕ новый",
+    "update": "✏️ новый размер",
+    "same": "без изменений",
+    "similar": "⚠️ похожее название в каталоге",
+    "repeat": "⚠️ повтор в файле",
+    "invalid": "❌ ошибка",
+}
+
+# Заголовки предпросмотра
+PREVIEW_HEADERS = {
+    "name": "Коннектор",
+    "size": "Размер (мм)",
+    "status": "Действие",
+    "current": "Размер в каталоге (мм)",
+    "similar": "Похожие в каталоге",
+}
+
+
+def template_csv():
+    """Пример входного файла для скачивания"""
+    return (
+        "Название;Размер (мм)\n"
+        "SMA-50-2-103;3\n"
+        "16_MCX-50-2-104;5,5\n"
+    ).encode("utf-8")
+
+
+def read_library(data, filename):
+    """Читает CSV/XLSX с колонками название и размер"""
+    df = read_table(data, filename, COLUMNS, ("name", "size"))
+    return df[list(COLUMNS)]
+
+
+def _lookup(catalogs, names, keys):
+    """Размеры по точному названию и похожие названия каталогов (по name_key).
+
+    Каталоги не перебираются: для каждой строки файла - поиск в словарях
+    каталога. key_index строится один раз и переносится в новые версии
+    правками (with_changes; снимок хранилища - CatalogStorage.snapshot).
+    При совпадении названий в нескольких каталогах берется первый.
+    """
+    catalogs = [CatalogSnapshot.from_dict(catalog) for catalog in catalogs]
+
+    def size(name):
+        for catalog in catalogs:
+            if name in catalog:
+                return catalog[name]
+        return None
+
+    def similar(key):
+        found = []
+        for catalog in catalogs:
+            found += [name for name in catalog.key_index().get(key, ()) if name not in found]
+        return ", ".join(found) or None
+
+    return names.map(size).astype("float64"), keys.map(similar)
+
+
+def prepare_import(df, catalogs):
+    """Предпросмотр импорта за один векторный проход, ничего не сохраняет.
+
+    Названия приводятся к верхнему регистру без пробелов по краям, размеры
+    разбираются как числа. Дубликаты ищутся по нормализованному названию
+    (name_key), поэтому SMA_50_2_103 совпадет с SMA-50-2-103 из каталога.
+    catalogs - каталоги для сверки (каталог сессии и локальный CSV).
+    Колонка status - ключ из STATUS_LABELS.
+    """
+    names = df["name"].fillna("").astype(str).str.strip().str.upper()
+    sizes = to_number(df["size"])
+    keys = name_keys(names)
+    current, similar = _lookup(catalogs, names, keys)
+    invalid = (names == "") | (keys == "") | sizes.isna() | ~(sizes > 0)
+    repeat = keys.where(~invalid).duplicated(keep="first") & ~invalid
+    exists = current.notna()
+
+    status = pd.Series("add", index=df.index)
+    status = status.mask(similar.notna() & ~exists, "similar")
+    status = status.mask(exists, "update")
+    status = status.mask(exists & (current == sizes), "same")
+    status = status.mask(repeat, "repeat")
+    status = status.mask(invalid, "invalid")
+
+    return pd.DataFrame({
+        "name": names,
+        "size": sizes,
+        "status": status,
+        "current": current,
+        "similar": similar.where(status == "similar", ""),
+    })
+
+
+def import_changes(preview, update_existing=False):
+    """Изменения для одной пакетной записи: новые коннекторы и, если
+    update_existing, новые размеры существующих"""
+    statuses = ["add", "update"] if update_existing else ["add"]
+    rows = preview[preview["status"].isin(statuses)]
+    return [
+        {"op": "add" if status == "add" else "update", "name": name, "size": float(size)}
+        for name, size, status in zip(rows["name"], rows["size"], rows["status"])
+    ]
@@ -0,0 +1,441 @@
+# Каталоги коннекторов без интерфейса: загрузка, сохранение изменений, синхронизация
+#
+# Каталогов может быть несколько (по одному на линию производства): у
+# каждого свой лист Google Sheets, свой CSV с журналом и свой кэш. Каталог
+# загружается при первом обращении (get_catalog), давно не используемые
+# выгружаются из памяти.
+#
+# Последняя версия каталога (CatalogService.current) общая для всех сессий.
+# Правки применяются к ней по журналу CSV без повторной загрузки: свои -
+# сразу после записи, правки других процессов с тем же CSV - фоновым
+# потоком, который следит за файлами (os.stat, без запросов к сети).
+#
+# Каждая новая версия локального каталога (CSV и журнал, без листа Google
+# Sheets) записывается в двоичный снимок рядом с CSV (catalog_binary). Следующий запуск открывает его через mmap, если с тех
+# пор CSV и журнал не менялись: загрузка не зависит от размера каталога, а
+# все процессы делят одну копию в кэше страниц ОС.
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from catalog_binary import open_snapshot, write_snapshot
+from catalog_storage import get_storage, release_storage
+from catalog_store import CatalogSnapshot
+from google_connection import get_setting
+from instrumentation import span
+from write_queue import WriteQueue
+
+# Импортируем функции для работы с Google Sheets
+try:
+    from google_sheets_config import (
+        SPREADSHEET_ID, WORKSHEET_NAME, SheetSource, cached_catalog, catalog_status, load_catalog_from_sheets,
+    )
+    from catalog_sync import sync_catalog
+    USE_GOOGLE_SHEETS = True
+except ImportError:
+    USE_GOOGLE_SHEETS = False
+    SPREADSHEET_ID = WORKSHEET_NAME = None
+
+logger = logging.getLogger(__name__)
+
+CSV_FILE = "connectors.csv"
+# CSV остальных каталогов: catalogs/<ключ>.csv
+CATALOGS_DIR = "catalogs"
+DEFAULT_KEY = "default"
+# Сколько каталогов держать в памяти одновременно
+MAX_ACTIVE_CATALOGS = int(get_setting("MAX_ACTIVE_CATALOGS", 8))
+# Как часто проверять журнал CSV на правки других процессов (секунды, 0 - не проверять)
+WATCH_INTERVAL = float(get_setting("CATALOG_WATCH_INTERVAL", 0.5))
+# Двоичный снимок каталога (<csv>.bin) для быстрого запуска
+USE_BINARY_SNAPSHOT = str(get_setting("CATALOG_BINARY_SNAPSHOT", "1")).lower() not in ("0", "false", "no", "")
+
+# Базовый набор (если ничего не загрузилось)
+DEFAULT_CATALOG = CatalogSnapshot.from_dict({
+    "SF9351-60004": 3.0,
+    "16_MCX-50-2-104": 5.0,
+    "16_SMA-50-2-103/111_NE": 3.0,
+})
+
+
+def _catalog_settings():
+    """Каталоги из настройки CATALOGS: {ключ: {"title", "sheet_id", "worksheet", "csv"}}.
+
+    Без настройки - один каталог "default" (GOOGLE_SHEETS_ID, connectors.csv).
+    sheet_id по умолчанию - GOOGLE_SHEETS_ID, пустой sheet_id - только CSV.
+    """
+    settings = get_setting("CATALOGS")
+    if isinstance(settings, str):
+        settings = json.loads(settings)
+    if not settings:
+        settings = {DEFAULT_KEY: {"title": "Основной каталог"}}
+    catalogs = {}
+    for key, options in settings.items():
+        options = dict(options)
+        default = key == DEFAULT_KEY
+        catalogs[str(key)] = {
+            "title": options.get("title", key),
+            "sheet_id": options.get("sheet_id", SPREADSHEET_ID),
+            "worksheet": options.get("worksheet", WORKSHEET_NAME if default else key),
+            "csv": options.get("csv", CSV_FILE if default else os.path.join(CATALOGS_DIR, f"{key}.csv")),
+        }
+    return catalogs
+
+
+CATALOGS = _catalog_settings()
+
+
+class CatalogService:
+    """Один каталог: локальное хранилище, лист Google Sheets и очередь записи.
+
+    Объект один на каталог в процессе (get_catalog) и общий для всех сессий.
+    Сессии читают current() и подписываются на новые версии (subscribe).
+    """
+
+    def __init__(self, key, title, csv_file, sheet_id=None, worksheet=None):
+        self.key = key
+        self.title = title
+        directory = os.path.dirname(csv_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Локальное хранилище: снимок csv_file + журнал изменений рядом с ним
+        self.storage = get_storage(csv_file)
+        self.source = SheetSource(sheet_id, worksheet) if USE_GOOGLE_SHEETS and sheet_id else None
+        self.use_sheets = self.source is not None
+        # Синхронизация из очереди и по кнопке не должна идти одновременно
+        self._sync_lock = threading.Lock()
+        # Каталог из Google Sheets с наложенными неотправленными правками
+        self._overlay = {"key": None, "catalog": None}
+        self._overlay_lock = threading.Lock()
+        # Очередь фоновой отправки правок
+        self.write_queue = WriteQueue(self.storage, self.sync)
+        # Последняя версия каталога, каталог Google Sheets, из которого она
+        # собрана, и подписчики на новые версии
+        self._current = None
+        self._current_remote = None
+        self._current_lock = threading.Lock()
+        self._subscribers = []
+        self._file_stamp = None
+        # Двоичный снимок: путь, непроверенный открытый снимок и фоновая запись
+        self.binary_path = csv_file + ".bin"
+        self._unverified = None
+        self._binary_job = None
+        self._binary_writing = False
+        self._binary_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<CatalogService {self.key}>"
+
+    def load_catalog(self, wait=True):
+        """Загружает каталог с приоритетом Google Sheets.
+
+        Возвращает CatalogSnapshot: один объект на версию каталога, общий для
+        всех сессий и запросов API. wait=False - не ждать первой загрузки из
+        Google Sheets: пока она идет в фоне, отдается локальный каталог.
+        """
+        with span("catalog_load"):
+            return self._load_catalog(wait)
+
+    def _load_catalog(self, wait):
+        return self._assemble(self._remote(wait))
+
+    def _remote(self, wait):
+        """Каталог из Google Sheets или None, если его нет"""
+        if not self.use_sheets:
+            return None
+        try:
+            return load_catalog_from_sheets(wait=wait, source=self.source) or None
+        except Exception:
+            return None  # Если облако недоступно, переходим к локальному
+
+    def _assemble(self, remote):
+        # Приоритет 1: Google Sheets (облако)
+        if remote:
+            return self._with_pending(remote)
+
+        # Приоритет 2: CSV файл (локально)
+        catalog = self.storage.snapshot()
+
+        # Приоритет 3: Базовый набор
+        if not catalog:
+            catalog = DEFAULT_CATALOG
+
+        return catalog
+
+    def _with_pending(self, catalog):
+        """Каталог из таблицы плюс локальные правки, которые еще в очереди"""
+        state, pending = self.storage.pending()
+        if not pending:
+            return catalog
+        key = (catalog.version, state)
+        with self._overlay_lock:
+            if self._overlay["key"] != key:
+                changes = [
+                    {"op": "delete", "name": name} if record.deleted
+                    else {"op": "update", "name": name, "size": record.size}
+                    for name, record in pending.items()
+                ]
+                self._overlay["catalog"] = catalog.with_changes(changes)
+                self._overlay["key"] = key
+            return self._overlay["catalog"]
+
+    # ---------- Общая версия каталога и оповещения ----------
+    def current(self, refresh=True):
+        """Последняя версия каталога - один объект для всех сессий.
+
+        Правки применяются к ней изменениями (publish), целиком она
+        собирается заново, только когда в кэше появился новый каталог из
+        Google Sheets. refresh=False - смотреть только в уже загруженный
+        кэш, не запуская его обновление (без запросов к сети).
+        """
+        if not self.use_sheets:
+            remote = None
+        elif refresh:
+            remote = self._remote(wait=False)
+        else:
+            remote = cached_catalog(self.source) or None
+        with self._current_lock:
+            if self._current is not None and remote is self._current_remote:
+                return self._current
+            catalog = self._reload(remote)
+        self._notify(catalog)
+        return catalog
+
+    def _reload(self, remote, use_binary=True):
+        """Собирает каталог целиком (под _current_lock).
+
+        Без каталога из Google Sheets сначала пробуется двоичный снимок.
+        """
+        with span("catalog_load"):
+            catalog = self._open_binary() if remote is None and use_binary else None
+            if catalog is None:
+                stamp = self.storage.file_stamp()
+                # Все, что уже есть в журнале, войдет в каталог
+                self.storage.take_changes()
+                catalog = self._assemble(remote)
+                if remote is None:
+                    # В снимок попадают только локальные данные: его отпечаток -
+                    # отпечаток CSV и журнала, версию листа он не знает
+                    self._save_binary(catalog, stamp)
+        self._current = catalog
+        self._current_remote = remote
+        return catalog
+
+    # ---------- Двоичный снимок ----------
+    def _open_binary(self):
+        """Каталог из двоичного снимка, если он собран из текущих CSV и журнала"""
+        if not USE_BINARY_SNAPSHOT:
+            return None
+        mapped = open_snapshot(self.binary_path)
+        if mapped is None or mapped.stamp != self.storage.file_stamp():
+            return None
+        if WATCH_INTERVAL > 0:
+            # Контрольная сумма сверяется в фоне (poll), чтобы не читать файл при запуске
+            self._unverified = mapped
+        elif not mapped.verify():
+            logger.warning("Снимок каталога %s поврежден", self.binary_path)
+            return None
+        # Эти данные уже в каталоге - poll не должен перечитывать их
+        self._file_stamp = mapped.stamp
+        return CatalogSnapshot.from_mapped(mapped)
+
+    def _save_binary(self, catalog, stamp):
+        """Ставит запись снимка в фон; частые правки сливаются в одну запись"""
+        if not USE_BINARY_SNAPSHOT or catalog is DEFAULT_CATALOG:
+            return
+        with self._binary_lock:
+            self._binary_job = (catalog, stamp)
+            if self._binary_writing:
+                return
+            self._binary_writing = True
+        threading.Thread(target=self._write_binary, daemon=True).start()
+
+    def _write_binary(self):
+        while True:
+            with self._binary_lock:
+                job, self._binary_job = self._binary_job, None
+                if job is None:
+                    self._binary_writing = False
+                    return
+            catalog, stamp = job
+            try:
+                write_snapshot(self.binary_path, catalog.names, catalog.sizes, stamp)
+            except OSError as e:
+                logger.warning("Не удалось записать снимок каталога %s: %s", self.binary_path, e)
+
+    def _verify_binary(self):
+        """Сверка контрольной суммы снимка, открытого при запуске"""
+        mapped, self._unverified = self._unverified, None
+        if mapped is None or mapped.verify():
+            return
+        logger.warning("Снимок каталога %s поврежден, каталог перечитывается", self.binary_path)
+        with self._current_lock:
+            catalog = self._reload(self._current_remote, use_binary=False)
+        self._notify(catalog)
+
+    def publish(self):
+        """Применяет к current новые изменения из журнала CSV и оповещает подписчиков"""
+        with self._current_lock:
+            if self._current is None:
+                # Каталог еще никто не читал - соберется при первом current()
+                return
+            stamp = self.storage.file_stamp()
+            changes = self.storage.take_changes()
+            if changes == []:
+                return
+            if changes is None or self._current is DEFAULT_CATALOG:
+                # Журнал свернут другим процессом, каталог открыт из
+                # двоичного снимка или вместо каталога был базовый набор -
+                # перечитываем локальные данные
+                catalog = self._reload(self._current_remote)
+            else:
+                catalog = self._current = self._current.with_changes(changes)
+                if self._current_remote is None:
+                    self._save_binary(catalog, stamp)
+        self._notify(catalog)
+
+    def poll(self):
+        """Правки других процессов (дешевая проверка файлов, затем publish) и
+        новый каталог в кэше Google Sheets"""
+        if self._unverified is not None:
+            self._verify_binary()
+        stamp = self.storage.file_stamp()
+        if stamp != self._file_stamp:
+            self._file_stamp = stamp
+            self.publish()
+        if self.use_sheets and self._current is not None and (cached_catalog(self.source) or None) is not self._current_remote:
+            # Каталог из Google Sheets загрузился в фоне - новая версия для подписчиков
+            self.current(refresh=False)
+
+    def subscribe(self, callback):
+        """callback(catalog) вызывается с каждой новой версией каталога (из
+        потока, который ее получил); возвращает функцию отписки"""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def _notify(self, catalog):
+        for callback in list(self._subscribers):
+            try:
+                callback(catalog)
+            except Exception as e:
+                logger.warning("Ошибка подписчика каталога %s: %s", self.key, e)
+
+    def status(self):
+        """connected, loading, unavailable (Google Sheets) или local_only"""
+        if not self.use_sheets:
+            return "local_only"
+        return catalog_status(self.source)
+
+    def save_changes(self, changes):
+        """Сохраняет изменения в локальный журнал и ставит их в очередь отправки.
+
+        changes - список вида [{"op": "update", "name": "SMA-50-2-103", "size": 3.0}];
+        в Google Sheets они уходят в фоне (write_queue).
+        """
+        with span("save"):
+            if self._shows_defaults():
+                # Первая правка поверх базового набора: сначала сам набор, иначе
+                # каталог из CSV будет состоять только из этой правки
+                changes = [
+                    {"op": "add", "name": name, "size": size} for name, size in DEFAULT_CATALOG.items()
+                ] + list(changes)
+            self.storage.apply_changes(changes)
+        # Открытые сессии получат правку без перезагрузки каталога
+        self.publish()
+        if self.use_sheets:
+            self.write_queue.notify()
+
+    def _shows_defaults(self):
+        """Вместо каталога показывается базовый набор: нет ни листа, ни CSV"""
+        if self.use_sheets and cached_catalog(self.source):
+            return False
+        return not self.storage.snapshot()
+
+    def sync(self):
+        """Инкрементальная синхронизация с Google Sheets.
+
+        Возвращает отчет sync_catalog или None, если Google Sheets не подключен.
+        """
+        if not self.use_sheets:
+            return None
+        with self._sync_lock, span("sync"):
+            report = sync_catalog(self.storage, self.source)
+        # Изменения из таблицы, попавшие в журнал
+        self.publish()
+        return report
+
+    def busy(self):
+        """Есть неотправленные правки или идет синхронизация - выгружать нельзя"""
+        return (self.use_sheets and bool(self.storage.pending()[1])) or self._sync_lock.locked()
+
+
+_services = OrderedDict()
+_services_lock = threading.Lock()
+_watcher = None
+
+
+def _watch():
+    """Фоновый поток: правки других процессов в журналах активных каталогов"""
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        with _services_lock:
+            services = list(_services.values())
+        for service in services:
+            try:
+                service.poll()
+            except Exception as e:
+                logger.warning("Не удалось проверить журнал каталога %s: %s", service.key, e)
+
+
+def get_catalog(key=None):
+    """Каталог по ключу из CATALOGS (по умолчанию - первый).
+
+    Загружается при первом обращении; если активных каталогов больше
+    MAX_ACTIVE_CATALOGS, давно не используемые выгружаются (кроме тех,
+    у которых есть неотправленные правки).
+    """
+    global _watcher
+    key = key or next(iter(CATALOGS))
+    options = CATALOGS[key]
+    with _services_lock:
+        service = _services.get(key)
+        if service is not None:
+            _services.move_to_end(key)
+            return service
+        service = CatalogService(key, options["title"], options["csv"], options["sheet_id"], options["worksheet"])
+        _services[key] = service
+        for old_key in list(_services):
+            if len(_services) <= MAX_ACTIVE_CATALOGS:
+                break
+            old = _services[old_key]
+            if old_key != key and not old.busy():
+                del _services[old_key]
+                release_storage(old.storage.csv_path)
+        if _watcher is None and WATCH_INTERVAL > 0:
+            _watcher = threading.Thread(target=_watch, daemon=True)
+            _watcher.start()
+    if service.use_sheets:
+        # Правки, не отправленные до перезапуска или выгрузки, уходят в фоне
+        service.write_queue.notify()
+    return service
+
+
+def active_catalogs():
+    """Ключи каталогов, загруженных в память (от давно не используемых к свежим)"""
+    with _services_lock:
+        return list(_services)
+
+
+# Каталог по умолчанию - для кода, которому нужен один каталог (API, скрипты)
+def load_catalog(wait=True, key=None):
+    return get_catalog(key).load_catalog(wait)
+
+
+def save_changes(changes, key=None):
+    get_catalog(key).save_changes(changes)
+
+
+def sync(key=None):
+    return get_catalog(key).sync()
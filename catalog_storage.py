@@ -0,0 +1,396 @@
+# Локальное хранилище каталога: снимок CSV + журнал изменений
+import csv
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from catalog_store import CatalogSnapshot
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    HAS_FCNTL = False
+
+# После стольких записей в журнале он сворачивается в новый снимок
+COMPACT_EVERY = 500
+
+# Сколько секунд хранить синхронизированные записи об удалении (tombstones)
+TOMBSTONE_TTL = 90 * 24 * 3600
+
+# Сколько прочитанных из журнала изменений ждать take_changes; дальше
+# подписчику проще перечитать каталог целиком
+MAX_UNSEEN = 10_000
+
+# Версия записи каталога. synced - версия, о которой последний раз
+# договорились локальная копия и Google Sheets
+Record = namedtuple("Record", "size version updated_at deleted synced")
+
+
+class _FileLock:
+    """Межпроцессная блокировка через отдельный .lock файл"""
+
+    def __init__(self, path, exclusive=True):
+        self.path = path
+        self.exclusive = exclusive
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a+b")
+        if HAS_FCNTL:
+            fcntl.flock(self.file, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        else:
+            # В Windows нет разделяемых блокировок - всегда эксклюзивная
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if HAS_FCNTL:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+
+
+def _fsync_dir(path):
+    """fsync каталога, чтобы переименование файла пережило сбой питания"""
+    if not HAS_FCNTL:
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CatalogStorage:
+    """Каталог в CSV-снимке и журнале add/update/delete.
+
+    Каждое изменение - одна дописанная строка журнала (с fsync), поэтому
+    стоимость правки не зависит от размера каталога. Журнал периодически
+    сворачивается в новый снимок. Повторная загрузка в том же процессе
+    дочитывает только новые записи журнала.
+
+    Каждая запись несет версию и время изменения, удаления хранятся как
+    tombstones - это нужно для инкрементальной синхронизации (catalog_sync).
+
+    Все примененные изменения (свои и дописанные другими процессами)
+    отдаются через take_changes - по ним обновляются открытые сессии.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.journal_path = csv_path + ".journal"
+        self.lock_path = csv_path + ".lock"
+        self._mutex = threading.Lock()
+        self._catalog = None
+        self._records = {}
+        self._dirty = set()
+        self._snapshot_stamp = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        # Счетчик изменений в памяти и снимок для него (см. snapshot)
+        self._changes = 0
+        self._shared = None
+        # Изменения с последнего snapshot; None - снимок собирается заново
+        self._since_shared = None
+        # Изменения для take_changes; None - снимок перечитан целиком
+        self._unseen = []
+
+    # ---------- Чтение ----------
+    def _stamp(self):
+        """Отпечаток снимка: меняется при каждом сворачивании журнала"""
+        try:
+            st = os.stat(self.csv_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_snapshot(self):
+        """Читает снимок: name,size[,version,updated_at,deleted,synced]"""
+        self._catalog = {}
+        self._records = {}
+        self._dirty = set()
+        self._changes += 1
+        self._unseen = None
+        self._since_shared = None
+        if not os.path.exists(self.csv_path):
+            return
+        with open(self.csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            for row in reader:
+                if len(row) < 2 or not row[0]:
+                    continue
+                try:
+                    if len(row) >= 6:
+                        version = int(row[2])
+                        updated_at = float(row[3])
+                        deleted = row[4] == "1"
+                        synced = int(row[5])
+                    else:
+                        # Старый формат из двух колонок
+                        version = updated_at = synced = 0
+                        deleted = False
+                    size = None if deleted else float(row[1])
+                except ValueError:
+                    continue
+                self._set(row[0], Record(size, version, updated_at, deleted, synced))
+
+    def _set(self, name, record):
+        self._records[name] = record
+        self._changes += 1
+        if record.deleted:
+            self._catalog.pop(name, None)
+        else:
+            self._catalog[name] = record.size
+        if record.version != record.synced:
+            self._dirty.add(name)
+        else:
+            self._dirty.discard(name)
+
+    def _apply(self, change):
+        """Применяет одну запись журнала"""
+        name = change["name"]
+        previous = self._records.get(name)
+        if change["op"] == "synced":
+            if previous is not None:
+                self._set(name, previous._replace(synced=change["version"]))
+            return
+        deleted = change["op"] == "delete"
+        if self._unseen is not None:
+            if len(self._unseen) < MAX_UNSEEN:
+                self._unseen.append(change)
+            else:
+                self._unseen = None
+        if self._since_shared is not None:
+            if len(self._since_shared) < MAX_UNSEEN:
+                self._since_shared.append(change)
+            else:
+                self._since_shared = None
+        self._set(name, Record(
+            None if deleted else float(change["size"]),
+            # Записи старого журнала без версий
+            change.get("version", (previous.version if previous else 0) + 1),
+            change.get("updated_at", 0.0),
+            deleted,
+            change.get("synced", previous.synced if previous else 0),
+        ))
+
+    def _replay_journal(self):
+        """Дочитывает журнал с последней известной позиции"""
+        if not os.path.exists(self.journal_path):
+            self._journal_offset = 0
+            self._journal_records = 0
+            return
+        if os.path.getsize(self.journal_path) < self._journal_offset:
+            # Журнал был свернут другим процессом
+            self._journal_offset = 0
+            self._journal_records = 0
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Недописанная запись (сбой во время записи)
+                self._journal_offset += len(line)
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    continue
+                self._journal_records += 1
+
+    def _refresh(self):
+        """Приводит состояние в памяти к данным на диске (под блокировкой)"""
+        stamp = self._stamp()
+        if self._catalog is None or stamp != self._snapshot_stamp:
+            self._read_snapshot()
+            self._snapshot_stamp = stamp
+            self._journal_offset = 0
+            self._journal_records = 0
+        self._replay_journal()
+
+    def load(self):
+        """Возвращает копию каталога (снимок + журнал)"""
+        with self._mutex, _FileLock(self.lock_path, exclusive=False):
+            self._refresh()
+            return dict(self._catalog)
+
+    def snapshot(self):
+        """Каталог как CatalogSnapshot; пока данные не менялись - тот же объект.
+
+        Новая версия получается из прошлой правками журнала (with_changes),
+        поэтому индексы снимка (key_index, by_size, stats) не строятся
+        заново после каждой правки.
+        """
+        with self._mutex, _FileLock(self.lock_path, exclusive=False):
+            self._refresh()
+            if self._shared is None or self._shared[0] != self._changes:
+                if self._shared is None or self._since_shared is None:
+                    snapshot = CatalogSnapshot.from_dict(self._catalog)
+                elif self._since_shared:
+                    snapshot = self._shared[1].with_changes(self._since_shared)
+                else:
+                    snapshot = self._shared[1]  # Только отметки синхронизации
+                self._shared = (self._changes, snapshot)
+                self._since_shared = []
+            return self._shared[1]
+
+    def pending(self):
+        """Несинхронизированные записи: (номер состояния в памяти, {название: Record})"""
+        with self._mutex, _FileLock(self.lock_path, exclusive=False):
+            self._refresh()
+            return self._changes, {name: self._records[name] for name in self._dirty}
+
+    def file_stamp(self):
+        """Отпечаток снимка и журнала на диске - дешевая проверка, что
+        каталог менялся (без блокировок и чтения файлов)"""
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except OSError:
+            journal_size = None
+        return self._stamp(), journal_size
+
+    def take_changes(self):
+        """Изменения add/update/delete, примененные с прошлого вызова.
+
+        None - каталог перечитан целиком (журнал свернут другим процессом
+        или изменений слишком много), подписчику нужна полная загрузка.
+        """
+        with self._mutex, _FileLock(self.lock_path, exclusive=False):
+            self._refresh()
+            changes, self._unseen = self._unseen, []
+            return changes
+
+    def __contains__(self, name):
+        with self._mutex, _FileLock(self.lock_path, exclusive=False):
+            self._refresh()
+            return name in self._catalog
+
+    def records(self):
+        """Версии всех записей (включая удаленные) и имена с несинхронизированными изменениями"""
+        with self._mutex, _FileLock(self.lock_path, exclusive=False):
+            self._refresh()
+            return dict(self._records), set(self._dirty)
+
+    # ---------- Запись ----------
+    def _stamp_changes(self, changes):
+        """Проставляет версию и время локальным изменениям"""
+        now = time.time()
+        versions = {}
+        stamped = []
+        for change in changes:
+            name = change["name"]
+            if change["op"] != "synced" and "version" not in change:
+                previous = self._records.get(name)
+                version = versions.get(name, previous.version if previous else 0)
+                change = dict(change, version=version + 1, updated_at=now)
+            if "version" in change:
+                versions[name] = change["version"]
+            stamped.append(change)
+        return stamped
+
+    def apply_changes(self, changes):
+        """Дописывает изменения в журнал.
+
+        changes - список словарей {"op": "add"|"update"|"delete", "name", "size"}.
+        Локальным изменениям версия и время проставляются автоматически;
+        изменения из Google Sheets приходят со своими version/updated_at/synced.
+        """
+        if not changes:
+            return
+        with self._mutex, _FileLock(self.lock_path):
+            self._refresh()
+            data = b"".join(
+                json.dumps(change, ensure_ascii=False).encode("utf-8") + b"\n"
+                for change in self._stamp_changes(changes)
+            )
+            with open(self.journal_path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._replay_journal()
+            if self._journal_records >= COMPACT_EVERY:
+                self._compact()
+
+    def add(self, name, size):
+        self.apply_changes([{"op": "add", "name": name, "size": size}])
+
+    def update(self, name, size):
+        self.apply_changes([{"op": "update", "name": name, "size": size}])
+
+    def delete(self, name):
+        self.apply_changes([{"op": "delete", "name": name}])
+
+    def replace_all(self, catalog):
+        """Заменяет весь каталог: отличия записываются как обычные изменения"""
+        current = self.load()
+        changes = [
+            {"op": "delete", "name": name}
+            for name in current if name not in catalog
+        ]
+        changes += [
+            {"op": "update", "name": name, "size": size}
+            for name, size in catalog.items() if current.get(name) != float(size)
+        ]
+        self.apply_changes(changes)
+
+    def compact(self):
+        """Сворачивает журнал в новый снимок"""
+        with self._mutex, _FileLock(self.lock_path):
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        # Новый снимок пишется во временный файл и атомарно подменяет старый.
+        # Если сбой случится до очистки журнала, повторное применение записей
+        # к новому снимку даст тот же результат - операции идемпотентны.
+        expired = time.time() - TOMBSTONE_TTL
+        tmp_path = self.csv_path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            for name, record in list(self._records.items()):
+                if record.deleted:
+                    if record.synced == record.version and record.updated_at < expired:
+                        del self._records[name]
+                        continue
+                    size = ""
+                else:
+                    size = record.size
+                writer.writerow([
+                    name, size, record.version, record.updated_at,
+                    "1" if record.deleted else "", record.synced,
+                ])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.csv_path)
+        _fsync_dir(self.csv_path)
+        with open(self.journal_path, "wb") as f:
+            os.fsync(f.fileno())
+        self._snapshot_stamp = self._stamp()
+        self._journal_offset = 0
+        self._journal_records = 0
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(csv_path):
+    """Одно хранилище на файл в пределах процесса (общее для всех сессий)"""
+    with _storages_lock:
+        storage = _storages.get(csv_path)
+        if storage is None:
+            storage = _storages[csv_path] = CatalogStorage(csv_path)
+        return storage
+
+
+def release_storage(csv_path):
+    """Забывает хранилище файла: память освобождается, когда на него нет ссылок"""
+    with _storages_lock:
+        _storages.pop(csv_path, None)
@@ -0,0 +1,281 @@
+# Неизменяемый каталог, общий для всех сессий
+import bisect
+import itertools
+import math
+import sys
+import threading
+from array import array
+from collections.abc import ItemsView, Mapping
+
+from connector_search import name_key
+
+# Номера версий уникальны в пределах процесса: по ним кэшируются индексы
+# поиска и результаты расчетов
+_versions = itertools.count(1)
+_versions_lock = threading.Lock()
+
+# До скольких правок with_changes вставляет их в копию, а не строит каталог заново
+INCREMENTAL_CHANGES = 256
+# Сколько шагов with_changes помнит версия (lineage): по ним производные
+# структуры (pair_table) обновляются правками, а не сравнением каталогов
+LINEAGE_DEPTH = 8
+
+
+def _next_version():
+    with _versions_lock:
+        return next(_versions)
+
+
+class CatalogSnapshot(Mapping):
+    """Версия каталога: название -> размер (мм), только для чтения.
+
+    Названия хранятся один раз (sys.intern) в отсортированном кортеже,
+    размеры - в массиве float64 в том же порядке (array('d'); NumPy-вид -
+    через as_numpy, чтобы не загружать NumPy на странице калькулятора),
+    поиск по названию - через словарь название -> размер. Сессии держат ссылку на общий объект, поэтому
+    память не растет с числом сессий. Изменение создает новую версию
+    (with_changes), старая остается нетронутой, пока на нее есть ссылки.
+
+    Снимок может лежать в файле (from_mapped, catalog_binary): тогда names
+    и sizes - представления над mmap, поиск по названию - бинарный, а
+    словарь строится только для операций над всем каталогом.
+
+    Статистика (stats), порядок по размеру (by_size) и индекс
+    нормализованных названий (similar) считаются один раз на версию, а в
+    with_changes переносятся в новую версию с правками, без пересчета по
+    всему каталогу.
+    """
+
+    __slots__ = ("names", "sizes", "version", "_by_name", "_numpy", "_stats", "_by_size", "_by_key", "_lineage")
+
+    def __init__(self, names, sizes):
+        """names - отсортированные уникальные названия, sizes - размеры в том же порядке"""
+        self.names = tuple(names)
+        self.sizes = array("d", sizes)
+        self.version = _next_version()
+        self._by_name = dict(zip(self.names, self.sizes))
+        self._numpy = None
+        self._stats = None
+        self._by_size = None
+        self._by_key = None
+        self._lineage = ()
+
+    def as_numpy(self):
+        """Размеры как массив NumPy только для чтения (без копирования)"""
+        if self._numpy is None:
+            import numpy as np
+            sizes = np.frombuffer(self.sizes, dtype=np.float64) if len(self.sizes) else np.empty(0)
+            sizes.flags.writeable = False
+            self._numpy = sizes
+        return self._numpy
+
+    @classmethod
+    def from_mapped(cls, mapped):
+        """Каталог поверх открытого двоичного снимка (catalog_binary.MappedSnapshot)"""
+        snapshot = cls.__new__(cls)
+        snapshot.names = mapped.names
+        snapshot.sizes = mapped.sizes
+        snapshot.version = _next_version()
+        snapshot._by_name = None
+        snapshot._numpy = None
+        snapshot._stats = None
+        snapshot._by_size = None
+        snapshot._by_key = None
+        snapshot._lineage = ()
+        return snapshot
+
+    def _mapping(self):
+        """Словарь название -> размер (для снимка из файла строится по требованию)"""
+        if self._by_name is None:
+            self._by_name = dict(zip(self.names, self.sizes))
+        return self._by_name
+
+    @classmethod
+    def from_dict(cls, catalog):
+        if isinstance(catalog, CatalogSnapshot):
+            return catalog
+        items = sorted((sys.intern(str(name)), float(size)) for name, size in catalog.items())
+        return cls([name for name, _ in items], [size for _, size in items])
+
+    # ---------- Mapping ----------
+    def __getitem__(self, name):
+        if self._by_name is None:
+            i = self.position(name)
+            if i is None:
+                raise KeyError(name)
+            return self.sizes[i]
+        return self._by_name[name]
+
+    def __contains__(self, name):
+        if self._by_name is None:
+            return self.position(name) is not None
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def items(self):
+        """Пары (название, размер) в порядке названий - без поиска по каждому"""
+        return _Items(self)
+
+    def __repr__(self):
+        return f"<CatalogSnapshot v{self.version}: {len(self)} коннекторов>"
+
+    def position(self, name):
+        """Номер названия в names/sizes или None"""
+        if self._by_name is not None and name not in self._by_name:
+            return None
+        if not isinstance(name, str):
+            return None
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return i
+        return None
+
+    # ---------- Статистика и сортировка ----------
+    def stats(self):
+        """{"count", "total", "mean", "min", "max"} по размерам"""
+        if self._stats is None:
+            sizes = self.sizes
+            self._stats = (len(sizes), math.fsum(sizes), min(sizes, default=None), max(sizes, default=None))
+        count, total, low, high = self._stats
+        return {
+            "count": count,
+            "total": total,
+            "mean": total / count if count else None,
+            "min": low,
+            "max": high,
+        }
+
+    def by_size(self):
+        """Названия по возрастанию размера (при равных - по названию)"""
+        if self._by_size is None:
+            by_name = self._mapping()
+            self._by_size = sorted(self.names, key=lambda name: (by_name[name], name))
+        return self._by_size
+
+    # ---------- Похожие названия ----------
+    def key_index(self):
+        """Нормализованное название -> кортеж названий каталога (см. name_key)"""
+        if self._by_key is None:
+            by_key = {}
+            for name in self.names:
+                key = name_key(name)
+                by_key[key] = by_key.get(key, ()) + (name,)
+            self._by_key = by_key
+        return self._by_key
+
+    def similar(self, name):
+        """Названия каталога, совпадающие с name без учета регистра и
+        разделителей: SMA-50-2-103 и SMA_50_2_103"""
+        return self.key_index().get(name_key(name), ())
+
+    # ---------- Новые версии ----------
+    def lineage(self):
+        """Предки по with_changes от ближнего к дальнему: (версия, правки от
+        нее до этой версии), не больше LINEAGE_DEPTH"""
+        changes = []
+        for version, step in reversed(self._lineage):
+            changes = list(step) + changes
+            yield version, changes
+
+    def with_changes(self, changes):
+        """Новая версия с изменениями [{"op": "add"|"update"|"delete", "name", "size"}]"""
+        step = tuple(change for change in changes if change["op"] in ("add", "update", "delete"))
+        lineage = (self._lineage + ((self.version, step),))[-LINEAGE_DEPTH:]
+        if len(changes) > INCREMENTAL_CHANGES:
+            catalog = dict(self._mapping())
+            for change in step:
+                if change["op"] == "delete":
+                    catalog.pop(change["name"], None)
+                else:
+                    catalog[change["name"]] = change["size"]
+            snapshot = CatalogSnapshot.from_dict(catalog)
+            snapshot._lineage = lineage
+            return snapshot
+
+        # Немного правок: вставки и удаления в копиях отсортированных списков
+        names = list(self.names)
+        sizes = array("d", self.sizes)
+        by_name = dict(self._mapping())
+        stats = self._stats
+        by_size = list(self._by_size) if self._by_size is not None else None
+        by_key = dict(self._by_key) if self._by_key is not None else None
+        for change in changes:
+            name = change["name"]
+            if change["op"] not in ("add", "update", "delete"):
+                continue
+            old = by_name.pop(name, None)
+            if old is not None:
+                i = bisect.bisect_left(names, name)
+                del names[i]
+                del sizes[i]
+                if by_size is not None:
+                    del by_size[bisect.bisect_left(by_size, (old, name), key=lambda n: (by_name.get(n, old), n))]
+                stats = _stats_without(stats, old)
+                if by_key is not None:
+                    key = name_key(name)
+                    rest = tuple(n for n in by_key[key] if n != name)
+                    if rest:
+                        by_key[key] = rest
+                    else:
+                        del by_key[key]
+            if change["op"] == "delete":
+                continue
+            name = sys.intern(str(name))
+            size = float(change["size"])
+            i = bisect.bisect_left(names, name)
+            names.insert(i, name)
+            sizes.insert(i, size)
+            by_name[name] = size
+            if by_size is not None:
+                by_size.insert(bisect.bisect_left(by_size, (size, name), key=lambda n: (by_name[n], n)), name)
+            stats = _stats_with(stats, size)
+            if by_key is not None:
+                key = name_key(name)
+                by_key[key] = by_key.get(key, ()) + (name,)
+
+        snapshot = CatalogSnapshot.__new__(CatalogSnapshot)
+        snapshot.names = tuple(names)
+        snapshot.sizes = sizes
+        snapshot.version = _next_version()
+        snapshot._by_name = by_name
+        snapshot._numpy = None
+        snapshot._stats = stats
+        snapshot._by_size = by_size
+        snapshot._by_key = by_key
+        snapshot._lineage = lineage
+        if stats is not None and stats[0] and None in stats[2:]:
+            # Удален крайний размер - минимум и максимум считаются заново
+            snapshot._stats = None
+        return snapshot
+
+
+class _Items(ItemsView):
+    def __iter__(self):
+        return zip(self._mapping.names, self._mapping.sizes)
+
+
+def _stats_with(stats, size):
+    if stats is None:
+        return None
+    count, total, low, high = stats
+    if not count:
+        return (1, size, size, size)
+    return (count + 1, total + size, min(low, size) if low is not None else None, max(high, size) if high is not None else None)
+
+
+def _stats_without(stats, size):
+    if stats is None:
+        return None
+    count, total, low, high = stats
+    if count <= 1:
+        return (0, 0.0, None, None)
+    # Удален минимум или максимум - крайние значения неизвестны (None)
+    return (count - 1, total - size, None if size == low else low, None if size == high else high)
+
+
+EMPTY = CatalogSnapshot([], [])
@@ -0,0 +1,174 @@
+# Инкрементальная синхронизация локального каталога с Google Sheets
+import json
+import time
+
+from google_sheets_config import SHEET_HEADER, open_catalog_sheet, write_catalog_records
+
+
+def _remote_change(name, remote):
+    """Изменение для локального журнала по записи из таблицы"""
+    change = {
+        "op": "delete" if remote["deleted"] else "update",
+        "name": name,
+        "version": remote["version"],
+        "updated_at": remote["updated_at"],
+        "synced": remote["version"],
+    }
+    if not remote["deleted"]:
+        change["size"] = remote["size"]
+    return change
+
+
+def _same_value(local, remote):
+    if local.deleted or remote["deleted"]:
+        return local.deleted == remote["deleted"]
+    return local.size == remote["size"]
+
+
+def _state_path(storage):
+    return storage.csv_path + ".sync.json"
+
+
+def load_sync_state(storage):
+    """Итоги последней синхронизации (время, счетчики) или пустой словарь"""
+    try:
+        with open(_state_path(storage), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def sync_catalog(storage, source=None):
+    """Синхронизирует локальное хранилище с листом Google Sheets.
+
+    У каждой записи есть версия, а synced - версия, на которой стороны
+    последний раз совпадали. Поэтому в таблицу уходят только локальные
+    изменения после прошлой синхронизации, а в журнал - только изменения
+    из таблицы. Удаления передаются как tombstones. Если запись изменилась
+    с обеих сторон по-разному, это конфликт: он попадает в отчет и не
+    разрешается автоматически (см. resolve_conflict).
+
+    Таблица читается одним запросом, изменения пишутся одним batch_update.
+    source - лист каталога (google_sheets_config.SheetSource).
+    Возвращает отчет {"pushed", "pulled", "conflicts", "finished_at"}.
+    """
+    sheet = open_catalog_sheet(source)
+    if sheet["header"] and sheet["header"][:2] != SHEET_HEADER[:2]:
+        raise ValueError("Неизвестная структура листа: ожидаются колонки " + ", ".join(SHEET_HEADER))
+
+    local, dirty = storage.records()
+    remote = sheet["records"]
+    now = time.time()
+    push = {}
+    local_changes = []
+    conflicts = []
+
+    for name, remote_record in remote.items():
+        local_record = local.get(name)
+        if local_record is None:
+            if not remote_record["deleted"]:
+                local_changes.append(_remote_change(name, remote_record))
+            continue
+        same = _same_value(local_record, remote_record)
+        local_changed = name in dirty
+        # Правка руками в таблице не меняет версию - ее выдает отличие значения
+        remote_changed = remote_record["version"] != local_record.synced or (
+            not local_changed and not same
+        )
+        if local_changed and remote_changed:
+            if same:
+                local_changes.append(_remote_change(name, remote_record))
+            else:
+                conflicts.append({
+                    "name": name,
+                    "local": {
+                        "size": local_record.size,
+                        "deleted": local_record.deleted,
+                        "version": local_record.version,
+                        "updated_at": local_record.updated_at,
+                    },
+                    "remote": {key: remote_record[key] for key in ("size", "deleted", "version", "updated_at")},
+                })
+        elif local_changed:
+            push[name] = local_record
+        elif remote_changed:
+            local_changes.append(_remote_change(name, remote_record))
+
+    for name in local.keys() - remote.keys():
+        local_record = local[name]
+        if name in dirty or not local_record.synced:
+            if not local_record.deleted:
+                # Новая запись или запись из старого CSV, которой не было в таблице
+                push[name] = local_record
+            elif name in dirty:
+                # Удалена раньше, чем попала в таблицу - передавать нечего
+                local_changes.append({"op": "synced", "name": name, "version": local_record.version})
+        elif not local_record.deleted:
+            # Строку удалили из таблицы руками
+            local_changes.append({
+                "op": "delete",
+                "name": name,
+                "version": local_record.version + 1,
+                "updated_at": now,
+                "synced": local_record.version + 1,
+            })
+
+    records = {}
+    for name, local_record in push.items():
+        version = max(local_record.version, 1)
+        records[name] = {
+            "size": local_record.size,
+            "deleted": local_record.deleted,
+            "version": version,
+            "updated_at": local_record.updated_at or now,
+        }
+        if version == local_record.version:
+            local_changes.append({"op": "synced", "name": name, "version": version})
+        else:
+            local_changes.append(_remote_change(name, records[name]))
+
+    # Сначала таблица: если запись не удалась, локальные отметки не ставятся
+    # и изменения уйдут при следующей синхронизации
+    if records:
+        write_catalog_records(sheet, records)
+    storage.apply_changes(local_changes)
+
+    report = {
+        "pushed": len(records),
+        "pulled": len(local_changes) - len(records),
+        "conflicts": conflicts,
+        "finished_at": time.time(),
+    }
+    try:
+        with open(_state_path(storage), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+    except OSError:
+        pass
+    return report
+
+
+def resolve_conflict(storage, conflict, keep):
+    """Разрешает конфликт из отчета sync_catalog.
+
+    keep="remote" - принять значение из таблицы, keep="local" - оставить
+    локальное (оно уйдет в таблицу при следующей синхронизации).
+    """
+    name = conflict["name"]
+    remote = conflict["remote"]
+    if keep == "remote":
+        storage.apply_changes([_remote_change(name, remote)])
+        return
+    local = conflict["local"]
+    version = max(local["version"], remote["version"]) + 1
+    change = {
+        "op": "delete" if local["deleted"] else "update",
+        "name": name,
+        "version": version,
+        "updated_at": time.time(),
+        # Считаем версию из таблицы согласованной - тогда запись уйдет как
+        # обычное локальное изменение
+        "synced": remote["version"],
+    }
+    if not local["deleted"]:
+        change["size"] = local["size"]
+    storage.apply_changes([change])
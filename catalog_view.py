@@ -0,0 +1,66 @@
+# Таблица коннекторов на странице управления: фильтр, сортировка, страницы
+import threading
+from collections import OrderedDict
+
+# Строк на странице по умолчанию
+PAGE_SIZE = 50
+# Сколько результатов фильтра (версия каталога, текст, сортировка) помнить
+FILTER_CACHE_SIZE = 16
+
+_filtered = OrderedDict()
+_filtered_lock = threading.Lock()
+
+
+def _ordered(catalog, sort):
+    """Все названия в порядке сортировки: "name" или "size" """
+    if sort == "size":
+        return catalog.by_size()
+    return catalog.names
+
+
+def _matching(catalog, text, sort):
+    """Названия, содержащие text, в порядке сортировки; общий кэш для сессий"""
+    key = (catalog.version, text, sort)
+    with _filtered_lock:
+        names = _filtered.get(key)
+        if names is not None:
+            _filtered.move_to_end(key)
+            return names
+    names = [name for name in _ordered(catalog, sort) if text in name.upper()]
+    with _filtered_lock:
+        _filtered[key] = names
+        while len(_filtered) > FILTER_CACHE_SIZE:
+            _filtered.popitem(last=False)
+    return names
+
+
+class TableView:
+    """Отфильтрованный и отсортированный вид каталога (CatalogSnapshot).
+
+    В браузер уходит только одна страница. Без фильтра страница
+    вырезается прямо из отсортированных названий каталога, поэтому ее
+    стоимость не зависит от размера каталога; результат фильтра
+    считается один раз на версию каталога и текст.
+    """
+
+    def __init__(self, catalog, text="", sort="name", descending=False):
+        self.catalog = catalog
+        self.descending = descending
+        text = (text or "").strip().upper()
+        self.names = _matching(catalog, text, sort) if text else _ordered(catalog, sort)
+
+    def __len__(self):
+        return len(self.names)
+
+    def page_count(self, page_size=PAGE_SIZE):
+        return max(1, -(-len(self.names) // page_size))
+
+    def page(self, number, page_size=PAGE_SIZE):
+        """Строки страницы number (с 1): [(название, размер), ...]"""
+        start = (number - 1) * page_size
+        if self.descending:
+            stop = len(self.names) - start
+            names = self.names[max(stop - page_size, 0):max(stop, 0)][::-1]
+        else:
+            names = self.names[start:start + page_size]
+        return [(name, self.catalog[name]) for name in names]
@@ -0,0 +1,155 @@
+# Поиск коннекторов по названию: префиксы слов и n-граммы
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from instrumentation import span
+
+# Разделители в названиях вроде 16_SMA-50-2-103/111_NE
+_SEPARATORS = re.compile(r"[\s_\-/\\.,;:()]+")
+
+# Сколько вариантов отдавать в выпадающий список
+SEARCH_LIMIT = 50
+
+# Сколько индексов (версий каталога) держать в памяти процесса
+INDEX_CACHE_SIZE = 4
+
+
+def normalize(text):
+    """Название без регистра и разделителей: 'sma-50_2' -> ('SMA502', ['SMA', '50', '2'])"""
+    tokens = [token for token in _SEPARATORS.split(text.upper()) if token]
+    return "".join(tokens), tokens
+
+
+def name_key(name):
+    """Ключ для поиска дубликатов: 'sma_50-2' и 'SMA-50-2' дают 'SMA502'"""
+    return normalize(name)[0]
+
+
+def name_keys(names):
+    """name_key для pandas Series названий - одной векторной операцией"""
+    return names.str.upper().str.replace(_SEPARATORS.pattern, "", regex=True)
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ConnectorIndex:
+    """Индекс названий коннекторов для подсказок при вводе.
+
+    Строится один раз на версию каталога. Короткие запросы ищутся по
+    отсортированным префиксам (bisect), длинные - пересечением списков
+    триграмм. Если точных совпадений мало, добавляются похожие названия
+    по числу общих триграмм.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.compact = []
+        # (нормализованная строка, номер названия) - для поиска по префиксу:
+        # целые названия и хвосты, начинающиеся с каждого следующего слова
+        self._full = []
+        self._tails = []
+        self._trigrams = {}
+        for i, name in enumerate(self.names):
+            compact, tokens = normalize(name)
+            self.compact.append(compact)
+            self._full.append((compact, i))
+            # Префикс любого слова: "103" найдет 16_SMA-50-2-103/111_NE
+            for position in range(1, len(tokens)):
+                self._tails.append(("".join(tokens[position:]), i))
+            for gram in _trigrams(compact):
+                self._trigrams.setdefault(gram, []).append(i)
+        self._full.sort()
+        self._tails.sort()
+
+    @staticmethod
+    def _prefix_scan(keys, query, found, limit):
+        """Дописывает в found номера названий с префиксом query (по алфавиту)"""
+        for position in range(bisect.bisect_left(keys, (query,)), len(keys)):
+            key, i = keys[position]
+            if len(found) >= limit or not key.startswith(query):
+                break
+            if i not in found:
+                found[i] = None
+
+    def _substring_matches(self, query):
+        postings = sorted(
+            (self._trigrams.get(gram, ()) for gram in _trigrams(query)), key=len
+        )
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return set()
+        return {i for i in candidates if query in self.compact[i]}
+
+    def _similar(self, query, exclude, limit):
+        """Похожие названия (опечатки): ранжирование по общим триграммам"""
+        grams = _trigrams(query)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self._trigrams.get(gram, ()))
+        threshold = max(1, len(grams) // 2)
+        similar = []
+        for i, count in counts.most_common():
+            if count < threshold or len(similar) >= limit:
+                break
+            if i not in exclude:
+                similar.append(i)
+        return similar
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Не более limit названий, лучшие совпадения первыми.
+
+        Порядок: начало названия, начало любого слова, подстрока, похожие.
+        """
+        query, _ = normalize(query or "")
+        if not query:
+            return self.names[:limit]
+
+        # dict как упорядоченное множество
+        found = {}
+        self._prefix_scan(self._full, query, found, limit)
+        self._prefix_scan(self._tails, query, found, limit)
+        if len(found) < limit and len(query) >= 3:
+            rest = self._substring_matches(query).difference(found)
+            for i in heapq.nsmallest(limit - len(found), rest, key=self.compact.__getitem__):
+                found[i] = None
+        if len(found) < limit and len(query) >= 4:
+            for i in self._similar(query, found, limit - len(found)):
+                found[i] = None
+        return [self.names[i] for i in found]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(catalog):
+    """Индекс для каталога; общий для всех сессий с той же версией каталога"""
+    # У CatalogSnapshot есть номер версии - хешировать все названия не нужно
+    version = getattr(catalog, "version", None)
+    key = version if version is not None else (len(catalog), hash(tuple(catalog)))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = ConnectorIndex(catalog)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def search_connectors(catalog, query, limit=SEARCH_LIMIT):
+    """Подсказки для поля ввода: до limit названий из каталога"""
+    with span("search"):
+        return get_index(catalog).search(query, limit)
@@ -0,0 +1,458 @@
+# Раскрой кабеля: окончательные длины раскладываются по бухтам с минимумом отходов
+#
+# Каждый рез занимает на бухте свою длину плюс припуск (kerf) - на рез,
+# зачистку и т.п. Бухты бывают нескольких длин, число бухт не ограничено.
+# Цель - минимум суммарной длины израсходованных бухт, т.е. минимум
+# отходов (остатки бухт и припуски).
+#
+# Два метода:
+#   plan_ffd  - first fit decreasing: резы по убыванию, каждый - в первую
+#               бухту, где хватает остатка (дерево отрезков: O(n log n));
+#               10 000 резов - доли секунды
+#   optimize  - генерация столбцов (LP через scipy, если установлен) с
+#               лимитом времени: улучшает план FFD и дает нижнюю границу,
+#               по которой видно, что план оптимален
+import importlib.util
+import io
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_calc import read_table, to_number
+
+HAS_SCIPY = importlib.util.find_spec("scipy") is not None
+
+# Допуск сравнения длин (мм)
+EPS = 1e-6
+# Лимит времени оптимизации по умолчанию (секунды)
+DEFAULT_TIME_LIMIT = 10.0
+# Узлов перебора на одну задачу о рюкзаке: дальше берется лучший найденный
+# столбец, а нижняя граница LP считается недоказанной
+KNAPSACK_NODES = 20_000
+# Сколько оптимизаций выполняется одновременно (остальные ждут в очереди)
+MAX_JOBS = 2
+
+# Колонки файла с резами и их возможные названия (подходит и результат
+# пакетного расчета)
+COLUMNS = {
+    "length": [
+        "окончательная длина кабеля (мм)", "окончательная длина", "длина реза (мм)", "длина реза",
+        "длина (мм)", "длина", "final_length", "length",
+    ],
+    "quantity": ["количество", "кол-во", "шт", "quantity", "qty"],
+    "label": ["метка", "обозначение", "сборка", "label", "name"],
+}
+
+# Заголовки плана для выгрузки
+PLAN_HEADERS = {
+    "spool": "Бухта",
+    "stock": "Длина бухты (мм)",
+    "order": "Порядок реза",
+    "cut": "Рез №",
+    "label": "Метка",
+    "length": "Длина реза (мм)",
+    "start": "Начало на бухте (мм)",
+}
+
+
+# Длина и необязательное количество: 1500, 1500,5, 1500x4, 1500*4
+_TOKEN = re.compile(r"^(\d+(?:[.,]\d*)?)(?:[x×*х](\d+))?$", re.IGNORECASE)
+
+
+class CuttingPlan:
+    """План раскроя.
+
+    spools - [(длина бухты, [номера резов в порядке нарезки])], номера - в
+    списке lengths. unplaced - [(номер, причина)] для резов, которые не
+    попали в план. lower_bound - нижняя граница суммарной длины бухт (мм),
+    optimal - план не хуже любого другого.
+    """
+
+    def __init__(self, lengths, kerf, spools, method, lower_bound=None, unplaced=()):
+        self.lengths = lengths
+        self.kerf = kerf
+        self.spools = spools
+        self.method = method
+        self.unplaced = list(unplaced)
+        self.total_stock = math.fsum(stock for stock, _ in spools)
+        self.total_cut = math.fsum(lengths[i] for _, cuts in spools for i in cuts)
+        self.lower_bound = lower_bound
+        self.optimal = lower_bound is not None and self.total_stock <= lower_bound + EPS
+
+    @property
+    def cut_count(self):
+        return sum(len(cuts) for _, cuts in self.spools)
+
+    @property
+    def waste(self):
+        """Отходы (мм): остатки бухт и припуски"""
+        return self.total_stock - self.total_cut
+
+    @property
+    def waste_percent(self):
+        return 100 * self.waste / self.total_stock if self.total_stock else 0.0
+
+    def spool_rows(self):
+        """Сводка по бухтам"""
+        rows = []
+        for number, (stock, cuts) in enumerate(self.spools, 1):
+            used = math.fsum(self.lengths[i] + self.kerf for i in cuts)
+            rows.append({
+                "spool": number,
+                "stock": stock,
+                "cuts": len(cuts),
+                "used": used,
+                "remainder": stock - used,
+            })
+        return rows
+
+    def cut_rows(self, labels=None):
+        """Карта раскроя: по строке на рез, в порядке нарезки"""
+        rows = []
+        for number, (stock, cuts) in enumerate(self.spools, 1):
+            start = 0.0
+            for order, i in enumerate(cuts, 1):
+                rows.append({
+                    "spool": number,
+                    "stock": stock,
+                    "order": order,
+                    "cut": i + 1,
+                    "label": labels[i] if labels is not None else "",
+                    "length": self.lengths[i],
+                    "start": start,
+                })
+                start += self.lengths[i] + self.kerf
+        return rows
+
+
+def parse_lengths(text):
+    """Длины из текста: через перевод строки, пробел или ';', десятичная
+    запятая допускается, '1500x4' или '1500*4' - четыре реза по 1500"""
+    lengths = []
+    for token in re.split(r"[\s;]+", text.strip()):
+        if not token:
+            continue
+        match = _TOKEN.match(token)
+        if match is None:
+            raise ValueError(f"Не удалось разобрать '{token}'")
+        value = float(match.group(1).replace(",", "."))
+        repeat = int(match.group(2)) if match.group(2) else 1
+        lengths += [value] * repeat
+    return lengths
+
+
+def read_cuts(data, filename):
+    """Резы из CSV/XLSX: длина, количество (по умолчанию 1) и метка.
+    Возвращает (длины, метки); строки без длины пропускаются"""
+    df = read_table(data, filename, COLUMNS, ("length",))
+    lengths = to_number(df["length"])
+    quantity = to_number(df["quantity"]).fillna(1) if "quantity" in df.columns else None
+    labels = df["label"].fillna("").astype(str).str.strip() if "label" in df.columns else None
+    out_lengths, out_labels = [], []
+    for row in range(len(df)):
+        length = lengths.iat[row]
+        if math.isnan(length):
+            continue
+        repeat = max(int(quantity.iat[row]), 0) if quantity is not None else 1
+        out_lengths += [float(length)] * repeat
+        out_labels += [labels.iat[row] if labels is not None else ""] * repeat
+    return out_lengths, out_labels
+
+
+def _check(lengths, stocks, kerf):
+    """Ширины резов на бухте и резы, которые нельзя разместить"""
+    if not stocks or min(stocks) <= 0:
+        raise ValueError("Нужна хотя бы одна положительная длина бухты")
+    if kerf < 0:
+        raise ValueError("Припуск не может быть отрицательным")
+    longest = max(stocks)
+    widths = [length + kerf for length in lengths]
+    placed, unplaced = [], []
+    for i, length in enumerate(lengths):
+        if not length > 0:
+            unplaced.append((i, "неверная длина"))
+        elif widths[i] > longest + EPS:
+            unplaced.append((i, "длиннее бухты"))
+        else:
+            placed.append(i)
+    return widths, placed, unplaced
+
+
+def _first_fit(order, widths, capacity):
+    """First fit: бухты длины capacity, резы в порядке order.
+
+    Остатки бухт - листья дерева отрезков, во внутренних узлах - максимум
+    остатка в поддереве; первая подходящая бухта находится спуском от корня.
+    Еще не открытые бухты - листья с полной длиной.
+    """
+    size = 1
+    while size < len(order):
+        size *= 2
+    tree = [capacity] * (2 * size)
+    bins = []
+    for i in order:
+        width = widths[i] - EPS
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= width else 2 * node + 1
+        position = node - size
+        if position == len(bins):
+            bins.append([])
+        bins[position].append(i)
+        tree[node] -= widths[i]
+        node //= 2
+        while node:
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if left > right else right
+            node //= 2
+    return bins
+
+
+def _fit_stock(stocks, used):
+    """Самая короткая бухта, на которую помещается used (stocks по возрастанию)"""
+    for stock in stocks:
+        if stock >= used - EPS:
+            return stock
+    return None
+
+
+def _pack(indices, widths, stocks):
+    """FFD для резов indices: для каждой длины бухты - свой проход, затем
+    каждая бухта заменяется самой короткой подходящей; берется проход с
+    наименьшей суммарной длиной"""
+    stocks = sorted(set(stocks))
+    order = sorted(indices, key=lambda i: -widths[i])
+    best, best_total = [], None
+    for capacity in reversed(stocks):
+        if order and widths[order[0]] > capacity + EPS:
+            break
+        spools = []
+        for cuts in _first_fit(order, widths, capacity):
+            spools.append((_fit_stock(stocks, math.fsum(widths[i] for i in cuts)), cuts))
+        total = math.fsum(stock for stock, _ in spools)
+        if best_total is None or total < best_total - EPS:
+            best, best_total = spools, total
+    return best
+
+
+def _trivial_bound(widths, placed, stocks):
+    """Нижняя граница: сумма ширин резов; при одной длине бухты - целое число бухт"""
+    total = math.fsum(widths[i] for i in placed)
+    if len(set(stocks)) == 1:
+        return math.ceil(total / stocks[0] - EPS) * stocks[0]
+    return total
+
+
+def plan_ffd(lengths, stocks, kerf=0.0):
+    """План first fit decreasing (быстрый, обычно в пределах нескольких
+    процентов от оптимума)"""
+    widths, placed, unplaced = _check(lengths, stocks, kerf)
+    spools = _pack(placed, widths, stocks)
+    return CuttingPlan(lengths, kerf, spools, "ffd", _trivial_bound(widths, placed, stocks), unplaced)
+
+
+# ---------- Генерация столбцов ----------
+def _knapsack(weights, values, limits, capacity, max_nodes, deadline=None):
+    """Ограниченный рюкзак: максимум sum(values[k] * a[k]) при
+    sum(weights[k] * a[k]) <= capacity, a[k] <= limits[k].
+
+    Ветви и границы (Хоровиц - Сахни): предметы по убыванию ценности на
+    миллиметр, граница - дробное заполнение остатка. Обход в глубину через
+    явный стек (глубина - число разных длин, рекурсия бы не поместилась).
+    Перебор прерывается после max_nodes узлов или в момент deadline
+    (time.monotonic). Возвращает (ценность, {предмет: количество}, доказан
+    ли оптимум).
+    """
+    items = sorted(
+        (k for k in range(len(weights)) if values[k] > EPS),
+        key=lambda k: values[k] / weights[k],
+        reverse=True,
+    )
+    best_value, best_choice = 0.0, None
+
+    def bound(position, room):
+        total = 0.0
+        for k in items[position:]:
+            take = min(limits[k], room / weights[k])
+            total += take * values[k]
+            room -= take * weights[k]
+            if room <= EPS:
+                break
+        return total
+
+    # Узел: (номер предмета, остаток, ценность, выбор) - выбор хранится
+    # связным списком (предмет, количество, предыдущий выбор)
+    stack = [(0, capacity, 0.0, None)]
+    nodes = 0
+    stopped = False
+    while stack:
+        nodes += 1
+        if nodes > max_nodes or (deadline is not None and time.monotonic() > deadline):
+            stopped = True
+            break
+        position, room, value, choice = stack.pop()
+        if value > best_value + EPS:
+            best_value, best_choice = value, choice
+        if position == len(items) or value + bound(position, room) <= best_value + EPS:
+            continue
+        k = items[position]
+        most = min(limits[k], int((room + EPS) // weights[k]))
+        # Больше штук - раньше: последним кладется в стек наибольшее количество
+        for count in range(most + 1):
+            stack.append((
+                position + 1,
+                room - count * weights[k],
+                value + count * values[k],
+                (k, count, choice) if count else choice,
+            ))
+
+    counts = {}
+    while best_choice is not None:
+        k, count, best_choice = best_choice
+        counts[k] = count
+    return best_value, counts, not stopped
+
+
+def optimize(lengths, stocks, kerf=0.0, time_limit=DEFAULT_TIME_LIMIT, start=None):
+    """Улучшение плана генерацией столбцов (Гилмор - Гомори) за time_limit секунд.
+
+    Резы одной длины объединяются. LP: минимум суммарной длины бухт по
+    схемам раскроя (столбцам), каждая длина нарезается не меньше нужного
+    числа раз. Новые схемы ищутся задачей о рюкзаке по двойственным ценам,
+    пока они улучшают LP или не кончилось время. Целый план: схемы с
+    округленным вниз числом повторений, остаток резов - FFD. Возвращается
+    лучший из этого плана и start (по умолчанию - план FFD). Если LP решена
+    до конца, ее значение - нижняя граница.
+    """
+    if not HAS_SCIPY:
+        raise RuntimeError("Для оптимизации нужен пакет scipy")
+    import numpy as np
+    from scipy import sparse
+    from scipy.optimize import linprog
+
+    deadline = time.monotonic() + time_limit
+    if start is None:
+        start = plan_ffd(lengths, stocks, kerf)
+    widths, placed, unplaced = _check(lengths, stocks, kerf)
+    if not placed or start.optimal:
+        return start
+
+    # Резы одной длины - один предмет с потребностью
+    groups = {}
+    for i in sorted(placed, key=lambda i: -widths[i]):
+        groups.setdefault(widths[i], []).append(i)
+    item_widths = list(groups)
+    demand = [len(groups[w]) for w in item_widths]
+    item_of = {w: k for k, w in enumerate(item_widths)}
+    stock_types = sorted(set(stocks))
+
+    # Начальные схемы - бухты плана start. Схема - (длина бухты, ((предмет,
+    # количество), ...)): разных длин бывают тысячи, а в схеме их единицы,
+    # поэтому и матрица LP разреженная
+    patterns = {}
+    for stock, cuts in start.spools:
+        counts = {}
+        for i in cuts:
+            k = item_of[widths[i]]
+            counts[k] = counts.get(k, 0) + 1
+        patterns[(stock, tuple(sorted(counts.items())))] = None
+    patterns = list(patterns)
+    known = set(patterns)
+
+    lower_bound = None
+    solution = None
+    while True:
+        # Время проверяется перед каждым решением LP; HiGHS получает остаток
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        rows = [k for _, counts in patterns for k, _ in counts]
+        columns = [j for j, (_, counts) in enumerate(patterns) for _ in counts]
+        values = [float(count) for _, counts in patterns for _, count in counts]
+        matrix = sparse.csc_matrix((values, (rows, columns)), shape=(len(item_widths), len(patterns)))
+        result = linprog(
+            np.array([stock for stock, _ in patterns], dtype=float),
+            A_ub=-matrix,
+            b_ub=-np.array(demand, dtype=float),
+            bounds=(0, None),
+            method="highs",
+            options={"time_limit": remaining},
+        )
+        if result.status != 0:
+            break
+        solution = result.x
+        prices = list(-result.ineqlin.marginals)
+        added, exact = False, True
+        for stock in stock_types:
+            value, counts, proved = _knapsack(item_widths, prices, demand, stock, KNAPSACK_NODES, deadline)
+            exact = exact and proved
+            column = (stock, tuple(sorted(counts.items())))
+            if value > stock * (1 + 1e-9) + EPS and column not in known:
+                patterns.append(column)
+                known.add(column)
+                added = True
+        if not added:
+            if exact:
+                lower_bound = result.fun
+            break
+
+    if solution is None:
+        return start
+
+    # Целый план: схемы LP с округлением вниз, остаток - FFD. solution
+    # относится к первым len(solution) схемам (добавленные после последнего
+    # решения LP в него не входят)
+    pools = [list(groups[w]) for w in item_widths]
+    spools = []
+    for (stock, counts), repeat in zip(patterns, solution):
+        for _ in range(int(repeat + 1e-9)):
+            cuts = []
+            for k, count in counts:
+                take = min(count, len(pools[k]))
+                cuts += pools[k][:take]
+                del pools[k][:take]
+            if cuts:
+                spools.append((_fit_stock(stock_types, math.fsum(widths[i] for i in cuts)), cuts))
+    spools += _pack([i for pool in pools for i in pool], widths, stocks)
+
+    bound = _trivial_bound(widths, placed, stocks)
+    if lower_bound is not None:
+        if len(stock_types) == 1:
+            lower_bound = math.ceil(lower_bound / stock_types[0] - 1e-6) * stock_types[0]
+        bound = max(bound, lower_bound)
+    plan = CuttingPlan(lengths, kerf, spools, "optimize", bound, unplaced)
+    if plan.total_stock < start.total_stock - EPS:
+        return plan
+    # План start читает и интерфейс - возвращаем новый объект с границей
+    return CuttingPlan(start.lengths, start.kerf, start.spools, start.method, bound, start.unplaced)
+
+
+# ---------- Фоновый расчет ----------
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def submit(lengths, stocks, kerf=0.0, time_limit=DEFAULT_TIME_LIMIT, start=None):
+    """Оптимизация в фоновом потоке (не в потоке перезапуска Streamlit).
+    Возвращает Future с CuttingPlan"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix="cutting-plan")
+    return _executor.submit(optimize, lengths, stocks, kerf, time_limit, start)
+
+
+def export_plan(plan, labels=None, fmt="csv"):
+    """Карта раскроя в виде файла для скачивания (bytes)"""
+    import pandas as pd
+
+    out = pd.DataFrame(plan.cut_rows(labels), columns=list(PLAN_HEADERS)).rename(columns=PLAN_HEADERS)
+    buffer = io.BytesIO()
+    if fmt == "xlsx":
+        out.to_excel(buffer, index=False)
+    else:
+        # utf-8-sig и ';' - чтобы русский Excel открыл файл без мастера импорта
+        out.to_csv(buffer, index=False, sep=";", decimal=",", encoding="utf-8-sig", float_format="%.2f")
+    return buffer.getvalue()
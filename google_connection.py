@@ -0,0 +1,259 @@
+# Общее подключение к Google: пул соединений, таймауты, повторы и
+# автоматическое отключение (circuit breaker), пока Google недоступен
+#
+# requests, gspread и google-auth загружаются при первом запросе к Google,
+# а не при импорте: страница калькулятора открывается без них
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+
+# Streamlit не обязателен: модуль используется и из HTTP API (api_server)
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+HAS_GSPREAD = all(importlib.util.find_spec(name) is not None for name in ("gspread", "google.oauth2"))
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name, default=None):
+    """Настройка из переменной окружения или секретов Streamlit"""
+    if name in os.environ:
+        return os.environ[name]
+    if st is not None:
+        try:
+            return st.secrets[name]
+        except Exception:
+            pass
+    return default
+
+
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+CREDENTIALS_FILE = get_setting("GOOGLE_CREDENTIALS_FILE", "credentials.json")
+
+# Таймауты (секунды): установка соединения и ожидание ответа
+CONNECT_TIMEOUT = float(get_setting("GOOGLE_CONNECT_TIMEOUT", 5.0))
+READ_TIMEOUT = float(get_setting("GOOGLE_READ_TIMEOUT", 30.0))
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# Повторы с экспоненциальной паузой; 429 - превышена квота Google API
+RETRIES = int(get_setting("GOOGLE_RETRIES", 3))
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_WAIT = 30.0  # Больше не ждем, даже если Google просит (Retry-After)
+
+# Сколько ошибок подряд отключают обращения к Google и на сколько секунд
+BREAKER_FAILURES = int(get_setting("GOOGLE_BREAKER_FAILURES", 3))
+BREAKER_RESET = float(get_setting("GOOGLE_BREAKER_RESET", 60.0))
+
+POOL_SIZE = 10
+
+
+class CircuitOpenError(RuntimeError):
+    """Google недавно не отвечал - запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """Автомат отключения обращений к недоступному сервису.
+
+    После failures ошибок подряд запросы сразу завершаются CircuitOpenError
+    (без ожидания таймаутов), пока не пройдет reset_timeout секунд. Затем
+    пропускается один пробный запрос: успех снова включает обращения,
+    ошибка продлевает отключение.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._errors = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        """"closed" - работает, "open" - отключен, "half-open" - ждет пробный запрос"""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def retry_in(self):
+        """Через сколько секунд будет пробный запрос (0, если не отключен)"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def _before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                wait = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+                raise CircuitOpenError(f"Google недоступен, повторная попытка через {wait:.0f} с")
+            self._probing = True
+            return True
+
+    def _after_call(self, failed, probe):
+        with self._lock:
+            if probe:
+                self._probing = False
+            if not failed:
+                self._errors = 0
+                self._opened_at = None
+                return
+            self._errors += 1
+            if probe or self._errors >= self.failures:
+                if self._opened_at is None or probe:
+                    logger.warning("Google недоступен, обращения отключены на %.0f с", self.reset_timeout)
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        probe = self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            # Ошибки запроса (403, 404, неверные данные) - не сбой сервиса
+            self._after_call(_is_outage(e), probe)
+            raise
+        self._after_call(False, probe)
+        return result
+
+
+def _is_outage(error):
+    """Ошибка говорит о недоступности Google, а не о неверном запросе"""
+    # Модули уже загружены, если запрос до них дошел
+    requests = sys.modules.get("requests")
+    if requests is not None and isinstance(
+        error, (requests.ConnectionError, requests.Timeout, requests.exceptions.RetryError)
+    ):
+        return True
+    gspread = sys.modules.get("gspread")
+    if gspread is not None and isinstance(error, gspread.exceptions.APIError):
+        return error.code in RETRY_STATUSES
+    return False
+
+
+# Один автомат на процесс: экспорт CSV и Sheets API ходят на одни серверы
+breaker = CircuitBreaker()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Общая для процесса сессия requests с keep-alive и повторами GET"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            class _Retry(Retry):
+                def get_retry_after(self, response):
+                    retry_after = super().get_retry_after(response)
+                    return None if retry_after is None else min(retry_after, MAX_RETRY_WAIT)
+
+            session = requests.Session()
+            retry = _Retry(
+                total=RETRIES,
+                read=1,  # Медленный ответ повторяем один раз, чтобы не ждать READ_TIMEOUT * RETRIES
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(["GET", "HEAD"]),
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def http_get(url, **kwargs):
+    """GET через общую сессию с таймаутами и автоматом отключения.
+
+    Повторы (urllib3 Retry) идут внутри одного вызова автомата, поэтому
+    сбоем считается только запрос, для которого повторы кончились.
+
+    Ответ нужно закрыть (with http_get(...) as response).
+    """
+    # instrumentation сам читает настройки отсюда, поэтому импорт здесь
+    from instrumentation import count_call
+    count_call("sheets_export")
+    kwargs.setdefault("timeout", TIMEOUT)
+    return breaker.call(get_session().get, url, **kwargs)
+
+
+def _retrying_http_client():
+    """HTTP клиент gspread: повторы при 429/5xx с паузой, автомат отключения"""
+    import gspread
+    from instrumentation import count_call
+
+    class _RetryingHTTPClient(gspread.HTTPClient):
+        def request(self, *args, **kwargs):
+            # Для автомата отключения это один вызов: сбоем считается
+            # только запрос, для которого кончились повторы
+            return breaker.call(self._request_with_retries, *args, **kwargs)
+
+        def _request_with_retries(self, *args, **kwargs):
+            for attempt in range(RETRIES + 1):
+                count_call("sheets_api")
+                try:
+                    return super().request(*args, **kwargs)
+                except gspread.exceptions.APIError as e:
+                    if e.code not in RETRY_STATUSES or attempt == RETRIES:
+                        raise
+                    wait = RETRY_BACKOFF * 2 ** attempt
+                    try:
+                        wait = float(e.response.headers.get("Retry-After", wait))
+                    except (TypeError, ValueError):
+                        pass
+                    time.sleep(min(wait, MAX_RETRY_WAIT))
+
+    return _RetryingHTTPClient
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gspread_client():
+    """Авторизованный клиент gspread, один на процесс.
+
+    Токен обновляется автоматически при истечении, поэтому
+    credentials.json читается только при первом обращении.
+    """
+    global _client
+    if not HAS_GSPREAD:
+        return None
+    with _client_lock:
+        if _client is None:
+            import gspread
+            from google.oauth2.service_account import Credentials
+
+            creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPE)
+            client = gspread.authorize(creds, http_client=_retrying_http_client())
+            client.set_timeout(TIMEOUT)
+            _client = client
+        return _client
+
+
+def reset_gspread_client():
+    """Сбрасывает клиент (например, после замены credentials.json)"""
+    global _client
+    with _client_lock:
+        _client = None
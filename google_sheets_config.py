@@ -1,103 +1,339 @@
 # Конфигурация для Google Sheets
-import streamlit as st
+import csv
+import logging
+import threading
+import time
+from urllib.parse import quote
 
-# Импорты для работы с Google Sheets (только для публичного доступа)
+# Streamlit не обязателен: модуль используется и из HTTP API (api_server)
 try:
-    import gspread
-    from oauth2client.service_account import ServiceAccountCredentials
-    HAS_GSPREAD = True
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
 except ImportError:
-    HAS_GSPREAD = False
+    st = None
 
-# Настройки Google Sheets
-SCOPE = [
-    "https://spreadsheets.google.com/feeds",
-    "https://www.googleapis.com/auth/drive"
-]
+from catalog_storage import TOMBSTONE_TTL
+from catalog_store import EMPTY, CatalogSnapshot
+# Подключение (пул, таймауты, повторы, автомат отключения) - в google_connection
+from google_connection import HAS_GSPREAD, CircuitOpenError, get_gspread_client, get_setting, http_get
+from instrumentation import span
 
-# ID вашей Google Sheets таблицы (извлеките из URL)
-import streamlit as st
+logger = logging.getLogger(__name__)
+
+def _notify(level, message):
+    """Сообщение об ошибке: в лог и, внутри сессии Streamlit, на страницу"""
+    logger.log(level, message)
+    if st is not None and get_script_run_ctx(suppress_warning=True) is not None:
+        if level >= logging.ERROR:
+            st.error(message)
+        else:
+            st.warning(message)
 
+
+# ID вашей Google Sheets таблицы (извлеките из URL)
 # Получаем ID из секретов Streamlit Cloud или используем по умолчанию
-try:
-    SPREADSHEET_ID = st.secrets["GOOGLE_SHEETS_ID"]
-except:
-    SPREADSHEET_ID = "10SrcUM8AAehI0rIV_c0szFW-9TWhbvb5iO0GecaahmY"  # Fallback ID
+SPREADSHEET_ID = get_setting("GOOGLE_SHEETS_ID", "10SrcUM8AAehI0rIV_c0szFW-9TWhbvb5iO0GecaahmY")  # Fallback ID
 
 WORKSHEET_NAME = "Каталог"  # Название листа
+# URL экспорта листа в CSV ({id} - ID таблицы); меняется для бенчмарков
+EXPORT_URL = get_setting(
+    "GOOGLE_SHEETS_EXPORT_URL", "https://docs.google.com/spreadsheets/d/{id}/export?format=csv"
+)
+# Экспорт листа по названию ({sheet}) - для каталогов на других листах таблицы
+SHEET_EXPORT_URL = get_setting(
+    "GOOGLE_SHEETS_SHEET_EXPORT_URL", "https://docs.google.com/spreadsheets/d/{id}/gviz/tq?tqx=out:csv&sheet={sheet}"
+)
+# Заголовки колонок листа: версия, время изменения и отметка удаления
+# нужны для инкрементальной синхронизации (catalog_sync)
+SHEET_HEADER = ['Вид коннектора', 'Размер (мм)', 'Версия', 'Обновлено', 'Удален']
+STAGING_SUFFIX = " (запись)"  # Промежуточный лист для полной перезаписи
+
+# Схема экспорта CSV: поле -> допустимые заголовки колонки (без учета
+# регистра). Колонки ищутся один раз на ответ; порядок колонок в листе
+# значения не имеет. Заголовки можно переопределить в настройках
+# (SHEET_NAME_COLUMN, SHEET_SIZE_COLUMN, SHEET_DELETED_COLUMN)
+SHEET_SCHEMA = {
+    "name": [get_setting("SHEET_NAME_COLUMN", SHEET_HEADER[0]), "Коннектор", "Connector", "Name"],
+    "size": [get_setting("SHEET_SIZE_COLUMN", SHEET_HEADER[1]), "Размер", "Size", "Size (mm)"],
+    "deleted": [get_setting("SHEET_DELETED_COLUMN", SHEET_HEADER[4]), "Deleted"],
+}
+# Сколько строк экспорта переводить в числа за один раз
+PARSE_BATCH = 5000
+
+# Время жизни общего кэша каталога (секунды) и сколько еще можно отдавать
+# устаревшие данные, пока идет фоновое обновление
+CACHE_TTL = float(get_setting("CATALOG_CACHE_TTL", 60.0))
+CACHE_STALE_TTL = float(get_setting("CATALOG_CACHE_STALE_TTL", 600.0))
+
+class SheetSource:
+    """Лист с каталогом и кэш его содержимого.
+
+    Кэш общий для всех сессий Streamlit, которые работают с этим листом;
+    у каждого каталога (catalog_service) свой лист и свой кэш.
+    """
+
+    def __init__(self, spreadsheet_id=SPREADSHEET_ID, worksheet_name=WORKSHEET_NAME):
+        self.spreadsheet_id = spreadsheet_id
+        self.worksheet_name = worksheet_name
+        self.cache = {
+            "catalog": None,
+            "etag": None,
+            "last_modified": None,
+            "fetched_at": 0.0,
+            "invalid": False,
+            "refreshing": False,
+            "error": None,  # Ошибка последней загрузки (для статуса в боковой панели)
+            "failed_at": 0.0,
+        }
+        self.cache_lock = threading.Lock()
+        self.fetch_lock = threading.Lock()
+
+    def export_url(self):
+        """URL экспорта листа в CSV"""
+        if self.worksheet_name == WORKSHEET_NAME or "{sheet}" in EXPORT_URL:
+            return EXPORT_URL.format(id=self.spreadsheet_id, sheet=quote(self.worksheet_name))
+        return SHEET_EXPORT_URL.format(id=self.spreadsheet_id, sheet=quote(self.worksheet_name))
+
+    def __repr__(self):
+        return f"<SheetSource {self.spreadsheet_id}/{self.worksheet_name}>"
+
+
+# Лист по умолчанию (GOOGLE_SHEETS_ID, лист "Каталог")
+DEFAULT_SOURCE = SheetSource()
 
 def get_google_sheets_client():
-    """Получение клиента Google Sheets"""
+    """Получение клиента Google Sheets (авторизация один раз на процесс)"""
     if not HAS_GSPREAD:
         return None
     try:
-        # Создаем учетные данные из JSON файла
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            "credentials.json", SCOPE
-        )
-        client = gspread.authorize(creds)
-        return client
+        return get_gspread_client()
+    except CircuitOpenError:
+        raise
     except Exception as e:
-        st.error(f"Ошибка подключения к Google Sheets: {e}")
+        _notify(logging.ERROR, f"Ошибка подключения к Google Sheets: {e}")
         return None
 
-def get_public_sheets_client():
-    """Получение клиента для публичных таблиц"""
-    if not HAS_GSPREAD:
-        return None
+
+def _resolve_columns(header):
+    """Номера колонок схемы в заголовке экспорта: {"name": 0, "size": 1, "deleted": 4 или None}"""
+    positions = {str(title).strip().lower(): i for i, title in reversed(list(enumerate(header)))}
+    columns = {}
+    for field, titles in SHEET_SCHEMA.items():
+        columns[field] = next(
+            (positions[title.strip().lower()] for title in titles if title.strip().lower() in positions), None
+        )
+    missing = [SHEET_SCHEMA[field][0] for field in ("name", "size") if columns[field] is None]
+    if missing:
+        raise ValueError(
+            "В листе не найдены колонки: " + ", ".join(missing)
+            + " (заголовок: " + ", ".join(map(str, header)) + ")"
+        )
+    return columns
+
+
+def _to_floats(values):
+    """Пачка строк -> числа; None для пустых и нечисловых значений"""
+    try:
+        return list(map(float, values))
+    except ValueError:
+        pass
+    numbers = []
+    for value in values:
+        try:
+            numbers.append(float(value.replace(",", ".")))
+        except ValueError:
+            numbers.append(None)
+    return numbers
+
+
+def parse_catalog_csv(lines):
+    """Каталог из строк CSV экспорта (итерируемый объект строк).
+
+    Колонки определяются один раз по заголовку (SHEET_SCHEMA), строки
+    читаются потоком, размеры переводятся в числа пачками по PARSE_BATCH.
+    Строки с отметкой удаления пропускаются.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return {}
+    columns = _resolve_columns(header)
+    name_col, size_col, deleted_col = columns["name"], columns["size"], columns["deleted"]
+    width = max(col for col in columns.values() if col is not None) + 1
+
+    catalog = {}
+    names, sizes = [], []
+
+    def flush():
+        for name, size in zip(names, _to_floats(sizes)):
+            if size is not None:
+                catalog[name] = size
+        names.clear()
+        sizes.clear()
+
+    for row in reader:
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        if deleted_col is not None and row[deleted_col]:
+            continue
+        name, size = row[name_col], row[size_col].strip()
+        if name and size:
+            names.append(name)
+            sizes.append(size)
+            if len(names) >= PARSE_BATCH:
+                flush()
+    flush()
+    return catalog
+
+
+def _fetch_catalog_from_sheets(etag=None, last_modified=None, source=None):
+    """Один запрос экспорта CSV; возвращает (каталог или None при 304, etag, last_modified)"""
+    # Используем публичный доступ через URL
+    # URL для экспорта Google Sheets в CSV (публичный доступ)
+    csv_url = (source or DEFAULT_SOURCE).export_url()
+
+    # Загружаем данные с заголовками
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    # Условный запрос: если таблица не менялась, Google вернет 304 без тела
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    # stream=True: тело разбирается по мере чтения, без копии всего CSV в памяти;
+    # соединение берется из общего пула, таймауты и повторы - в http_get
+    with http_get(csv_url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return None, etag, last_modified
+        response.raise_for_status()
+        # utf-8-sig убирает BOM, если он есть
+        response.encoding = 'utf-8-sig'
+        catalog = parse_catalog_csv(response.iter_lines(decode_unicode=True))
+        return (
+            catalog,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+        )
+
+def _refresh_catalog_cache(source):
+    """Перезапрашивает каталог и обновляет общий кэш"""
+    cache = source.cache
+    with source.cache_lock:
+        etag = cache["etag"]
+        last_modified = cache["last_modified"]
+    with span("sheets_fetch"):
+        catalog, etag, last_modified = _fetch_catalog_from_sheets(etag, last_modified, source)
+    with source.cache_lock:
+        if catalog is not None:
+            # Один неизменяемый объект на загрузку - общий для всех сессий
+            cache["catalog"] = CatalogSnapshot.from_dict(catalog)
+        cache["etag"] = etag
+        cache["last_modified"] = last_modified
+        cache["fetched_at"] = time.monotonic()
+        cache["invalid"] = False
+        cache["error"] = None
+
+def _record_failure(source, error):
+    """Ошибка загрузки для статуса и паузы перед следующей попыткой"""
+    with source.cache_lock:
+        source.cache["error"] = str(error)
+        source.cache["failed_at"] = time.monotonic()
+
+def _failed_recently(cache):
+    """После неудачной загрузки следующая попытка - не раньше чем через CACHE_TTL"""
+    return bool(cache["error"]) and time.monotonic() - cache["failed_at"] < CACHE_TTL
+
+def _background_refresh(source):
+    """Фоновое обновление кэша (stale-while-revalidate)"""
+    cache = source.cache
     try:
-        # Для публичных таблиц используем gspread без авторизации
-        return gspread
+        with source.fetch_lock:
+            _refresh_catalog_cache(source)
     except Exception as e:
-        st.error(f"Ошибка подключения к публичной таблице: {e}")
-        return None
+        # Оставляем устаревшие данные, повторим при следующем обращении
+        logger.warning("Не удалось обновить каталог из Google Sheets: %s", e)
+        _record_failure(source, e)
+    finally:
+        with source.cache_lock:
+            cache["refreshing"] = False
+
+def invalidate_catalog_cache(source=None):
+    """Сбрасывает кэш каталога: следующее обращение пойдет в Google Sheets"""
+    source = source or DEFAULT_SOURCE
+    with source.cache_lock:
+        source.cache["invalid"] = True
+
+def catalog_status(source=None):
+    """Состояние кэша без запросов к Google: connected, loading или unavailable"""
+    source = source or DEFAULT_SOURCE
+    cache = source.cache
+    with source.cache_lock:
+        if cache["catalog"] is not None:
+            return "connected"
+        if cache["refreshing"]:
+            return "loading"
+        return "unavailable"
+
+def cached_catalog(source=None):
+    """Каталог из общего кэша без запросов к Google (None - еще не загружен)"""
+    source = source or DEFAULT_SOURCE
+    with source.cache_lock:
+        return source.cache["catalog"]
+
+def load_catalog_from_sheets(force=False, wait=True, source=None):
+    """Загрузка каталога из Google Sheets (через общий для всех сессий кэш).
+
+    Возвращает CatalogSnapshot - общий объект, изменять его нельзя; если
+    лист загрузить не удалось - пустой EMPTY.
+    wait=False - если каталог еще не загружен, загрузка запускается в фоне,
+    а сразу возвращается пустой каталог (см. catalog_status).
+    source - лист (SheetSource), по умолчанию DEFAULT_SOURCE.
+    """
+    source = source or DEFAULT_SOURCE
+    cache = source.cache
+    with source.cache_lock:
+        catalog = cache["catalog"]
+        if catalog is None and not wait and not force:
+            # Холодный старт: страница не ждет сеть
+            if not cache["refreshing"] and not _failed_recently(cache):
+                cache["refreshing"] = True
+                threading.Thread(target=_background_refresh, args=(source,), daemon=True).start()
+            return EMPTY
+        age = time.monotonic() - cache["fetched_at"]
+        usable = catalog is not None and not force
+        if usable and not cache["invalid"] and age < CACHE_TTL:
+            return catalog
+        # Устаревшие данные отдаем сразу, а обновляем их в фоне. Без
+        # ожидания (wait=False) так же отдается и сброшенный кэш: поток
+        # перезапуска сессии не ждет выгрузку листа
+        stale = not cache["invalid"] and age < CACHE_TTL + CACHE_STALE_TTL
+        if usable and (stale or not wait):
+            if not cache["refreshing"]:
+                cache["refreshing"] = True
+                threading.Thread(target=_background_refresh, args=(source,), daemon=True).start()
+            return catalog
+        if not force and _failed_recently(cache):
+            return catalog or EMPTY
 
-def load_catalog_from_sheets():
-    """Загрузка каталога из Google Sheets"""
     try:
-        # Используем публичный доступ через URL
-        import requests
-        import csv
-        from io import StringIO
-        
-        # URL для экспорта Google Sheets в CSV (публичный доступ)
-        csv_url = f"https://docs.google.com/spreadsheets/d/{SPREADSHEET_ID}/export?format=csv"
-        
-        # Загружаем данные с заголовками
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(csv_url, headers=headers)
-        response.raise_for_status()
-        
-        # Исправляем кодировку
-        response.encoding = 'utf-8'
-        
-        # Парсим CSV
-        csv_data = StringIO(response.text)
-        reader = csv.DictReader(csv_data)
-        
-        rows = list(reader)
-        catalog = {}
-        for row in rows:
-            # Проверяем разные возможные названия колонок
-            name_key = None
-            size_key = None
-            
-            for key in row.keys():
-                # Ищем колонку с названием коннектора (более гибкий поиск)
-                if any(word in key.lower() for word in ['коннектор', 'connector', 'вид', 'type']):
-                    name_key = key
-                # Ищем колонку с размером (более гибкий поиск)
-                if any(word in key.lower() for word in ['размер', 'size', 'мм', 'mm']):
-                    size_key = key
-            
-            if name_key and size_key and row[name_key] and row[size_key]:
-                try:
-                    catalog[row[name_key]] = float(row[size_key])
-                except ValueError:
-                    continue
-        return catalog
+        # Одна загрузка листа на процесс: остальные сессии ждут ее результата
+        with source.fetch_lock:
+            with source.cache_lock:
+                fresh = (
+                    cache["catalog"] is not None
+                    and not cache["invalid"]
+                    and time.monotonic() - cache["fetched_at"] < CACHE_TTL
+                )
+            if not fresh or force:
+                _refresh_catalog_cache(source)
+        with source.cache_lock:
+            return cache["catalog"] or EMPTY
+    except CircuitOpenError as e:
+        # Google недавно не отвечал - сразу переходим на локальный каталог
+        _notify(logging.WARNING, f"{e}. Используются локальные данные.")
+        _record_failure(source, e)
+        return EMPTY
     except Exception as e:
         # Более детальная информация об ошибке
         error_msg = f"Ошибка загрузки данных: {e}"
@@ -107,34 +343,220 @@ def load_catalog_from_sheets():
             error_msg += " (Таблица не найдена)"
         elif "timeout" in str(e).lower():
             error_msg += " (Таймаут подключения)"
-        st.error(error_msg)
-        return {}
+        _notify(logging.ERROR, error_msg)
+        _record_failure(source, e)
+        return EMPTY
 
-def save_catalog_to_sheets(catalog):
-    """Сохранение каталога в Google Sheets"""
-    if not HAS_GSPREAD:
-        st.warning("Модуль gspread не установлен. Сохранение недоступно.")
-        return False
-    
+def _parse_sheet_number(value, cast=float):
+    """Число из ячейки таблицы (учитывает запятую как десятичный разделитель)"""
+    try:
+        return cast(float(str(value).strip().replace(',', '.')))
+    except ValueError:
+        return None
+
+def _sheet_row(name, record):
+    """Строка листа для записи каталога"""
+    return [
+        name,
+        "" if record["deleted"] else record["size"],
+        record["version"],
+        record["updated_at"],
+        "1" if record["deleted"] else "",
+    ]
+
+def open_catalog_sheet(source=None):
+    """Читает лист каталога одним запросом.
+
+    Возвращает состояние листа: записи по названиям (с номерами строк,
+    версиями и отметками удаления) и строки, которые можно занять.
+    """
+    source = source or DEFAULT_SOURCE
     client = get_google_sheets_client()
     if not client:
+        raise RuntimeError("Клиент Google Sheets недоступен")
+    spreadsheet = client.open_by_key(source.spreadsheet_id)
+    worksheet = spreadsheet.worksheet(source.worksheet_name)
+    values = worksheet.get_all_values(value_render_option='UNFORMATTED_VALUE')
+    rows = [[str(cell).strip() for cell in row] for row in values]
+
+    expired = time.time() - TOMBSTONE_TTL
+    records = {}
+    free_rows = []
+    junk_rows = set()
+    # Строка 1 - заголовки, данные начинаются со второй
+    for row_number, row in enumerate(rows[1:], start=2):
+        row = row + [""] * (len(SHEET_HEADER) - len(row))
+        name = row[0]
+        deleted = row[4] == "1"
+        size = None if deleted else _parse_sheet_number(row[1])
+        if not name or name in records or (size is None and not deleted):
+            # Пустая строка, дубликат или мусор - строка свободна
+            free_rows.append((row_number, None))
+            if any(row):
+                junk_rows.add(row_number)
+            continue
+        updated_at = _parse_sheet_number(row[3]) or 0.0
+        records[name] = {
+            "size": size,
+            "version": _parse_sheet_number(row[2], int) or 0,
+            "updated_at": updated_at,
+            "deleted": deleted,
+            "row": row_number,
+        }
+        if deleted and updated_at < expired:
+            # Давно удаленный коннектор - строку можно переиспользовать
+            free_rows.append((row_number, name))
+
+    return {
+        "source": source,
+        "spreadsheet": spreadsheet,
+        "worksheet": worksheet,
+        "header": rows[0] if rows else [],
+        "row_count": len(rows),
+        "records": records,
+        "free_rows": free_rows,
+        "junk_rows": junk_rows,
+    }
+
+def _row_ranges(changes):
+    """Группирует измененные строки в непрерывные диапазоны для batch_update"""
+    last_column = chr(ord('A') + len(SHEET_HEADER) - 1)
+    ranges = []
+    start = None
+    values = []
+    for row_number in sorted(changes):
+        if start is not None and row_number == start + len(values):
+            values.append(changes[row_number])
+            continue
+        if start is not None:
+            ranges.append({'range': f"A{start}:{last_column}{start + len(values) - 1}", 'values': values})
+        start = row_number
+        values = [changes[row_number]]
+    if start is not None:
+        ranges.append({'range': f"A{start}:{last_column}{start + len(values) - 1}", 'values': values})
+    return ranges
+
+def write_catalog_records(sheet, records):
+    """Записывает измененные записи одним batch_update.
+
+    sheet - результат open_catalog_sheet(), records - словарь
+    {название: {"size", "version", "updated_at", "deleted"}}.
+    Удаленные коннекторы остаются в листе с отметкой в колонке "Удален".
+    """
+    worksheet = sheet["worksheet"]
+    existing = sheet["records"]
+    # Строку старого tombstone не отдаем, если этот же коннектор пишется сейчас
+    free_rows = sorted(
+        (row for row, owner in sheet["free_rows"] if owner not in records),
+        reverse=True,
+    )
+
+    changes = {}
+    if sheet["header"][:len(SHEET_HEADER)] != SHEET_HEADER:
+        changes[1] = list(SHEET_HEADER)
+    last_row = max(sheet["row_count"], 1)
+    for name, record in records.items():
+        if name in existing:
+            row_number = existing[name]["row"]
+        elif free_rows:
+            row_number = free_rows.pop()
+        else:
+            last_row += 1
+            row_number = last_row
+        changes[row_number] = _sheet_row(name, record)
+
+    # Дубликаты и мусор, не занятые новыми записями, очищаем
+    for row_number in sheet["junk_rows"]:
+        if row_number not in changes:
+            changes[row_number] = [""] * len(SHEET_HEADER)
+
+    if not changes:
+        return
+    last_row = max(changes)
+    if last_row > worksheet.row_count:
+        worksheet.add_rows(last_row - worksheet.row_count)
+    if worksheet.col_count < len(SHEET_HEADER):
+        worksheet.add_cols(len(SHEET_HEADER) - worksheet.col_count)
+    with span("sheets_write"):
+        worksheet.batch_update(_row_ranges(changes), value_input_option='RAW')
+    # Кэш не сбрасываем: эти правки уже есть в локальном каталоге
+    # (CatalogService.publish), а лист перечитается по CACHE_TTL
+
+def _rewrite_worksheet(sheet, catalog):
+    """Полная перезапись через промежуточный лист с атомарной подменой"""
+    import gspread
+
+    spreadsheet = sheet["spreadsheet"]
+    worksheet = sheet["worksheet"]
+    now = time.time()
+    values = [list(SHEET_HEADER)] + [
+        _sheet_row(name, {"size": size, "version": 1, "updated_at": now, "deleted": False})
+        for name, size in catalog.items()
+    ]
+    source = sheet["source"]
+    staging_title = f"{source.worksheet_name}{STAGING_SUFFIX}"
+
+    # Остатки неудачной прошлой попытки
+    try:
+        spreadsheet.del_worksheet(spreadsheet.worksheet(staging_title))
+    except gspread.exceptions.WorksheetNotFound:
+        pass
+
+    staging = spreadsheet.add_worksheet(
+        title=staging_title, rows=max(len(values), 1), cols=len(SHEET_HEADER)
+    )
+    staging.update(range_name="A1", values=values, value_input_option='RAW')
+
+    # Удаление старого листа и переименование нового - один атомарный запрос,
+    # поэтому экспорт никогда не увидит пустой или наполовину записанный лист
+    spreadsheet.batch_update({'requests': [
+        {'deleteSheet': {'sheetId': worksheet.id}},
+        {'updateSheetProperties': {
+            'properties': {
+                'sheetId': staging.id,
+                'title': source.worksheet_name,
+                'index': worksheet.index,
+            },
+            'fields': 'title,index',
+        }},
+    ]})
+    invalidate_catalog_cache(source)
+
+def save_catalog_to_sheets(catalog, full_rewrite=False, source=None):
+    """Сохранение каталога в Google Sheets (отправляются только изменения)"""
+    if not HAS_GSPREAD:
+        _notify(logging.WARNING, "Модуль gspread не установлен. Сохранение недоступно.")
         return False
     
     try:
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        worksheet = spreadsheet.worksheet(WORKSHEET_NAME)
-        
-        # Очищаем лист
-        worksheet.clear()
+        # Текущее состояние листа - один запрос
+        sheet = open_catalog_sheet(source)
         
-        # Добавляем заголовки
-        worksheet.append_row(['Вид коннектора', 'Размер (мм)'])
+        if full_rewrite or sheet["header"][:2] != SHEET_HEADER[:2]:
+            # Структура листа неизвестна - переписываем его целиком
+            _rewrite_worksheet(sheet, catalog)
+            return True
         
-        # Добавляем данные
+        now = time.time()
+        records = {}
+        for name, record in sheet["records"].items():
+            if name in catalog:
+                if record["deleted"] or record["size"] != float(catalog[name]):
+                    records[name] = {"size": catalog[name], "deleted": False}
+            elif not record["deleted"]:
+                records[name] = {"size": None, "deleted": True}
         for name, size in catalog.items():
-            worksheet.append_row([name, size])
+            if name not in sheet["records"]:
+                records[name] = {"size": size, "deleted": False}
+        for name, record in records.items():
+            previous = sheet["records"].get(name)
+            record["version"] = (previous["version"] if previous else 0) + 1
+            record["updated_at"] = now
         
+        write_catalog_records(sheet, records)
+        # Этих правок нет в локальном каталоге - кэш листа больше не актуален
+        invalidate_catalog_cache(sheet["source"])
         return True
     except Exception as e:
-        st.error(f"Ошибка сохранения данных: {e}")
+        _notify(logging.ERROR, f"Ошибка сохранения данных: {e}")
         return False
@@ -0,0 +1,333 @@
+# Жгуты: дерево сегментов кабеля с коннекторами, сростками и переходниками
+#
+# Сегмент - отрезок кабеля между двумя узлами жгута (разъем, сросток,
+# переходник, точка ветвления). На каждом конце сегмента может стоять
+# коннектор из каталога; пустое название - размер 0 (сросток без
+# детали, голый конец). Длина реза сегмента - та же формула, что на
+# странице калькулятора:
+#   длина реза = длина кабеля - (размер коннектора "от" + "до") + толеранс
+#
+# Сегменты образуют дерево; корень - узел "от" первого сегмента. Для
+# каждого пути от корня до конечного узла считаются номинальная длина и
+# накопление допусков ± сегментов: худший случай (сумма), RSS (корень из
+# суммы квадратов) и Монте-Карло. Все сегменты и пути считаются за один
+# проход по массивам NumPy: путь - строка матрицы инцидентности
+# (путь x сегмент), длины путей - произведение матрицы на вектор.
+import numpy as np
+import pandas as pd
+
+from batch_calc import read_table, to_number
+from calculator import compute_final_length
+from catalog_store import CatalogSnapshot
+
+# Колонки жгута и их возможные названия во входном файле
+COLUMNS = {
+    "segment": ["сегмент", "segment", "name"],
+    "start": ["от узла", "от", "from", "start"],
+    "end": ["до узла", "до", "to", "end"],
+    "connector1": ["коннектор (от)", "коннектор 1", "connector1", "connector from"],
+    "connector2": ["коннектор (до)", "коннектор 2", "connector2", "connector to"],
+    "length": ["длина кабеля (мм)", "длина кабеля", "длина", "length"],
+    "tolerance": ["толеранс", "толеранц", "tolerance", "tol"],
+    "tolerance_type": ["тип толеранса", "tolerance_type", "tol_type"],
+    "deviation": ["± допуск (мм)", "допуск (мм)", "допуск", "deviation"],
+}
+
+# Заголовки редактора и результата
+HEADERS = {
+    "segment": "Сегмент",
+    "start": "От узла",
+    "end": "До узла",
+    "connector1": "Коннектор (от)",
+    "connector2": "Коннектор (до)",
+    "length": "Длина кабеля (мм)",
+    "tolerance": "Толеранс",
+    "tolerance_type": "Тип толеранса",
+    "deviation": "± Допуск (мм)",
+    "size1": "Размер (от) (мм)",
+    "size2": "Размер (до) (мм)",
+    "tolerance_mm": "Толеранс (мм)",
+    "cut_length": "Длина реза (мм)",
+    "error": "Ошибка",
+}
+
+PATH_HEADERS = {
+    "path": "Путь",
+    "segments": "Сегментов",
+    "nominal": "Номинал (мм)",
+    "worst_min": "Худший случай: мин (мм)",
+    "worst_max": "Худший случай: макс (мм)",
+    "rss": "RSS ± (мм)",
+    "mean": "Среднее (мм)",
+    "std": "σ (мм)",
+    "low": "0,135% (мм)",
+    "high": "99,865% (мм)",
+    "min": "Мин (мм)",
+    "max": "Макс (мм)",
+    "yield": "В допуске (%)",
+}
+
+# Монте-Карло: выборки считаются частями, чтобы память не зависела от их числа
+CHUNK_SAMPLES = 100_000
+# Корзин гистограммы на путь (по ним считаются квантили)
+HISTOGRAM_BINS = 2_000
+# Квантили, соответствующие ±3σ нормального распределения
+LOW_QUANTILE = 0.00135
+HIGH_QUANTILE = 0.99865
+
+
+def example_harness():
+    """Пример жгута: разъем X1, сросток J1 и две ветви к X2 и X3"""
+    return pd.DataFrame([
+        {"segment": "W1", "start": "X1", "end": "J1", "connector1": "SF9351-60004", "connector2": "",
+         "length": 800.0, "tolerance": 2.0, "tolerance_type": "мм", "deviation": 3.0},
+        {"segment": "W2", "start": "J1", "end": "X2", "connector1": "", "connector2": "16_MCX-50-2-104",
+         "length": 450.0, "tolerance": 0.0, "tolerance_type": "мм", "deviation": 2.0},
+        {"segment": "W3", "start": "J1", "end": "X3", "connector1": "", "connector2": "16_SMA-50-2-103/111_NE",
+         "length": 1200.0, "tolerance": 0.5, "tolerance_type": "%", "deviation": 4.0},
+    ], columns=list(COLUMNS))
+
+
+def read_harness(data, filename):
+    """Читает жгут из CSV/XLSX с колонками из COLUMNS"""
+    df = read_table(data, filename, COLUMNS, ("start", "end", "length"))
+    for column, default in (("segment", ""), ("connector1", ""), ("connector2", ""),
+                            ("tolerance", "0"), ("tolerance_type", "мм"), ("deviation", "0")):
+        if column not in df.columns:
+            df[column] = default
+    df = df[list(COLUMNS)]
+    for column in ("length", "tolerance", "deviation"):
+        df[column] = to_number(df[column])
+    return df
+
+
+def export_harness(df):
+    """Жгут в CSV для скачивания (тот же формат читает read_harness)"""
+    return df[list(COLUMNS)].rename(columns=HEADERS).to_csv(
+        index=False, sep=";", decimal=",", encoding="utf-8-sig"
+    ).encode("utf-8-sig")
+
+
+def _text(series):
+    return series.fillna("").astype(str).str.strip()
+
+
+class Harness:
+    """Жгут, разобранный в массивы.
+
+    Сегменты - в порядке строк (пустые строки редактора пропускаются).
+    incidence - матрица bool (путь x сегмент): сегменты пути от корня до
+    конечного узла leaves[i]. Ошибки структуры (цикл, несвязный жгут,
+    петля) - ValueError.
+    """
+
+    def __init__(self, df):
+        frame = pd.DataFrame({
+            "segment": _text(df["segment"]),
+            "start": _text(df["start"]),
+            "end": _text(df["end"]),
+            "connector1": _text(df["connector1"]),
+            "connector2": _text(df["connector2"]),
+            "length": to_number(df["length"]),
+            "tolerance": to_number(df["tolerance"]).fillna(0.0),
+            "tolerance_type": _text(df["tolerance_type"]).str.lower().replace("", "мм"),
+            "deviation": to_number(df["deviation"]).fillna(0.0).abs(),
+        })
+        blank = (frame["start"] == "") & (frame["end"] == "") & frame["length"].isna()
+        frame = frame[~blank].reset_index(drop=True)
+        unnamed = frame["segment"] == ""
+        frame.loc[unnamed, "segment"] = [f"#{i + 1}" for i in frame.index[unnamed]]
+        self.frame = frame
+        self.root, self.leaves, self.paths, self.incidence = self._tree(frame)
+
+    @staticmethod
+    def _tree(frame):
+        """Обход дерева от корня: пути до конечных узлов и матрица инцидентности"""
+        if frame.empty:
+            raise ValueError("В жгуте нет сегментов")
+        links = {}
+        for i, (name, start, end) in enumerate(zip(frame["segment"], frame["start"], frame["end"])):
+            if not start or not end:
+                raise ValueError(f"Сегмент {name}: не указаны узлы")
+            if start == end:
+                raise ValueError(f"Сегмент {name}: начало и конец в одном узле {start}")
+            links.setdefault(start, []).append((i, end))
+            links.setdefault(end, []).append((i, start))
+        if len(frame) != len(links) - 1:
+            raise ValueError(
+                f"Жгут должен быть деревом: {len(links)} узлов и {len(frame)} сегментов "
+                f"(ожидается {len(links) - 1}) - есть цикл, повторный сегмент или отдельная часть"
+            )
+
+        root = frame["start"].iat[0]
+        # Обход в глубину: для каждого узла - сегменты пути от корня
+        route = {root: []}
+        stack = [root]
+        leaves = []
+        while stack:
+            node = stack.pop()
+            children = [(i, other) for i, other in links[node] if other not in route]
+            for i, other in children:
+                route[other] = route[node] + [i]
+                stack.append(other)
+            if not children and node != root:
+                leaves.append(node)
+        if len(route) != len(links):
+            missing = sorted(set(links) - set(route))
+            raise ValueError("Жгут должен быть связным: не соединены узлы " + ", ".join(missing[:5]))
+
+        leaves.sort(key=lambda node: route[node])
+        incidence = np.zeros((len(leaves), len(frame)), dtype=bool)
+        paths = []
+        for p, leaf in enumerate(leaves):
+            incidence[p, route[leaf]] = True
+            nodes = [root]
+            for i in route[leaf]:
+                nodes.append(frame["end"].iat[i] if frame["start"].iat[i] == nodes[-1] else frame["start"].iat[i])
+            paths.append(" → ".join(nodes))
+        return root, leaves, paths, incidence
+
+
+def _sizes(names, catalog):
+    """Размеры коннекторов по названиям (как в пакетном расчете: при промахе -
+    в верхнем регистре); пустое название - 0"""
+    if isinstance(catalog, CatalogSnapshot):
+        sizes = pd.Series(catalog.as_numpy(), index=catalog.names)
+    else:
+        sizes = pd.Series(catalog, dtype="float64")
+    found = names.map(sizes)
+    missing = found.isna()
+    if missing.any():
+        found[missing] = names[missing].str.upper().map(sizes)
+    found[names == ""] = 0.0
+    return found
+
+
+def evaluate(harness, catalog):
+    """Длины резов всех сегментов и накопление допусков по путям.
+
+    Возвращает (сегменты, пути) - DataFrame с колонками из HEADERS и
+    PATH_HEADERS. Номинал пути - сумма длин сегментов с толерансом (длина
+    реза + размеры коннекторов); худший случай - номинал ± сумма допусков,
+    RSS - корень из суммы квадратов допусков.
+    """
+    segments = harness.frame.copy()
+    segments["size1"] = _sizes(segments["connector1"], catalog)
+    segments["size2"] = _sizes(segments["connector2"], catalog)
+    length = segments["length"].to_numpy()
+    percent = segments["tolerance_type"].isin(["%", "процент", "percent"]).to_numpy()
+    tolerance = segments["tolerance"].to_numpy()
+    segments["tolerance_mm"] = np.where(percent, tolerance / 100 * length, tolerance)
+    segments["cut_length"] = compute_final_length(
+        length, segments["size1"].to_numpy(), segments["size2"].to_numpy(), segments["tolerance_mm"].to_numpy()
+    )
+
+    error = pd.Series("", index=segments.index)
+    error = error.mask(segments["size1"].isna(), error + "неизвестный коннектор '" + segments["connector1"] + "'; ")
+    error = error.mask(segments["size2"].isna(), error + "неизвестный коннектор '" + segments["connector2"] + "'; ")
+    error = error.mask(segments["length"].isna(), error + "неверная длина; ")
+    error = error.mask(segments["cut_length"] <= 0, error + "длина реза не больше 0; ")
+    segments["error"] = error.str.rstrip("; ")
+
+    incidence = harness.incidence.astype(np.float64)
+    deviation = segments["deviation"].to_numpy()
+    nominal = incidence @ (length + segments["tolerance_mm"].to_numpy())
+    worst = incidence @ deviation
+    paths = pd.DataFrame({
+        "path": harness.paths,
+        "segments": harness.incidence.sum(axis=1),
+        "nominal": nominal,
+        "worst_min": nominal - worst,
+        "worst_max": nominal + worst,
+        "rss": np.sqrt(incidence @ deviation ** 2),
+    })
+    return segments, paths
+
+
+class Simulation:
+    """Результат Монте-Карло: stats (DataFrame по путям) и гистограммы
+    отклонений от номинала (counts, low, width - по путям)"""
+
+    def __init__(self, stats, counts, low, width, samples):
+        self.stats = stats
+        self.counts = counts
+        self.low = low
+        self.width = width
+        self.samples = samples
+
+    def histogram(self, path, bins=50):
+        """Гистограмма пути для графика: DataFrame отклонение (мм) -> доля (%)"""
+        step = HISTOGRAM_BINS // bins
+        counts = self.counts[path].reshape(bins, step).sum(axis=1)
+        centers = self.low[path] + self.width[path] * step * (np.arange(bins) + 0.5)
+        return pd.DataFrame({"Отклонение (мм)": np.round(centers, 3), "Доля (%)": 100 * counts / self.samples})
+
+
+def monte_carlo(harness, samples=1_000_000, limit=None, distribution="normal", seed=None):
+    """Монте-Карло накопления допусков.
+
+    Отклонение длины каждого сегмента - нормальное с σ = допуск / 3
+    (допуск - граница ±3σ) или равномерное в ±допуск (distribution=
+    "uniform"). Выборки считаются частями по CHUNK_SAMPLES: отклонения
+    сегментов (выборка x сегмент) умножаются на транспонированную матрицу
+    путей. limit - допуск сборки ±мм: доля выборок, где отклонение пути
+    не больше limit. Квантили - по гистограмме из HISTOGRAM_BINS корзин.
+    """
+    segments, paths = evaluate(harness, {})
+    deviation = segments["deviation"].to_numpy()
+    paths_t = harness.incidence.T.astype(np.float64)
+    path_count = len(paths)
+    worst = paths["worst_max"].to_numpy() - paths["nominal"].to_numpy()
+    rss = paths["rss"].to_numpy()
+    # Диапазон гистограммы: худший случай, для нормального - не меньше ±6σ;
+    # выборки за краем попадают в крайние корзины (на квантили ±3σ не влияют)
+    half = np.maximum(worst if distribution == "uniform" else np.maximum(worst, 2 * rss), 1e-9)
+    low = -half
+    width = 2 * half / HISTOGRAM_BINS
+    offsets = np.arange(path_count) * HISTOGRAM_BINS
+
+    rng = np.random.default_rng(seed)
+    total = np.zeros(path_count)
+    squares = np.zeros(path_count)
+    lows = np.full(path_count, np.inf)
+    highs = np.full(path_count, -np.inf)
+    inside = np.zeros(path_count, dtype=np.int64)
+    counts = np.zeros(path_count * HISTOGRAM_BINS, dtype=np.int64)
+    for start in range(0, samples, CHUNK_SAMPLES):
+        n = min(CHUNK_SAMPLES, samples - start)
+        if distribution == "uniform":
+            draws = rng.uniform(-1.0, 1.0, (n, len(deviation))) * deviation
+        else:
+            draws = rng.standard_normal((n, len(deviation))) * (deviation / 3)
+        offsets_n = draws @ paths_t
+        total += offsets_n.sum(axis=0)
+        squares += np.square(offsets_n).sum(axis=0)
+        lows = np.minimum(lows, offsets_n.min(axis=0))
+        highs = np.maximum(highs, offsets_n.max(axis=0))
+        if limit is not None:
+            inside += (np.abs(offsets_n) <= limit + 1e-9).sum(axis=0)
+        bins = np.clip(((offsets_n - low) / width).astype(np.int64), 0, HISTOGRAM_BINS - 1)
+        counts += np.bincount((bins + offsets).ravel(), minlength=path_count * HISTOGRAM_BINS)
+    counts = counts.reshape(path_count, HISTOGRAM_BINS)
+
+    mean = total / samples
+    cumulative = np.cumsum(counts, axis=1)
+
+    def quantile(q):
+        index = np.argmax(cumulative >= q * samples, axis=1)
+        return low + width * (index + 0.5)
+
+    nominal = paths["nominal"].to_numpy()
+    stats = pd.DataFrame({
+        "path": paths["path"],
+        "nominal": nominal,
+        "mean": nominal + mean,
+        "std": np.sqrt(np.maximum(squares / samples - mean ** 2, 0.0)),
+        "low": nominal + quantile(LOW_QUANTILE),
+        "high": nominal + quantile(HIGH_QUANTILE),
+        "min": nominal + lows,
+        "max": nominal + highs,
+    })
+    if limit is not None:
+        stats["yield"] = 100 * inside / samples
+    return Simulation(stats, counts, low, width, samples)
@@ -0,0 +1,278 @@
+# Замеры времени и счетчики запросов к Google: по сессиям и на процесс
+#
+# span("catalog_load") - время участка кода, count_call("sheets_api") -
+# запрос к внешнему сервису. Перезапуск страницы Streamlit оборачивается в
+# begin_rerun() / finish_rerun(), участки страницы отмечаются section().
+# Итоги отдаются в формате Prometheus (render_prometheus, METRICS_PORT) и
+# пишутся по одной строке JSON на перезапуск (METRICS_JSONL_FILE).
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google_connection import get_setting
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    get_script_run_ctx = None
+
+logger = logging.getLogger(__name__)
+
+# Файл JSONL с записью о каждом перезапуске страницы (пусто - не писать)
+JSONL_FILE = get_setting("METRICS_JSONL_FILE")
+# Порт для /metrics в формате Prometheus (пусто - не запускать)
+METRICS_PORT = get_setting("METRICS_PORT")
+METRICS_HOST = get_setting("METRICS_HOST", "127.0.0.1")
+
+# Границы корзин гистограммы (секунды)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Сколько сессий помнить и сколько строк профиля показывать
+MAX_SESSIONS = 500
+PROFILE_LINES = 30
+
+_lock = threading.Lock()
+# Гистограммы по участкам: имя -> [счетчики корзин, сумма, количество]
+_spans = {}
+_calls = Counter()
+_sessions = OrderedDict()
+_server = None
+
+
+def _session_id():
+    if get_script_run_ctx is None:
+        return None
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def _session(create=False):
+    """Данные текущей сессии Streamlit (None вне потока страницы)"""
+    session_id = _session_id()
+    if session_id is None:
+        return None
+    session = _sessions.get(session_id)
+    if session is None and create:
+        session = {"id": session_id, "reruns": 0, "calls": Counter(), "current": None, "last": None, "profile": None}
+        _sessions[session_id] = session
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    return session
+
+
+def _observe(name, seconds):
+    """Добавляет замер в гистограмму процесса (вызывается под _lock)"""
+    histogram = _spans.get(name)
+    if histogram is None:
+        histogram = _spans[name] = [[0] * len(BUCKETS), 0.0, 0]
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            histogram[0][i] += 1
+    histogram[1] += seconds
+    histogram[2] += 1
+
+
+def record(name, seconds):
+    """Замер участка: в гистограмму процесса и в текущий перезапуск сессии"""
+    with _lock:
+        _observe(name, seconds)
+        session = _session()
+        current = session and session["current"]
+        if current is not None:
+            current["spans"][name] = current["spans"].get(name, 0.0) + seconds
+            current["last_activity"] = time.perf_counter()
+
+
+@contextmanager
+def span(name):
+    """Замер времени блока: with span("catalog_load"): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def count_call(kind):
+    """Учет запроса к внешнему сервису (kind: sheets_export, sheets_api)"""
+    with _lock:
+        _calls[kind] += 1
+        session = _session()
+        if session is not None:
+            session["calls"][kind] += 1
+            if session["current"] is not None:
+                session["current"]["calls"][kind] += 1
+
+
+# ---------- Перезапуски страницы ----------
+def begin_rerun(page=None, profile=False):
+    """Начало перезапуска страницы; profile=True - профилировать его (cProfile)"""
+    with _lock:
+        session = _session(create=True)
+        if session is None:
+            return
+        _sessions.move_to_end(session["id"])
+        if session["current"] is not None:
+            # Прошлый перезапуск прерван st.rerun() - закрываем по последнему замеру
+            _close_rerun(session, interrupted=True)
+        now = time.perf_counter()
+        session["current"] = {
+            "started_at": time.time(),
+            "start": now,
+            "last_activity": now,
+            "page": page,
+            "spans": {},
+            "calls": Counter(),
+            "section": None,
+            "profiler": None,
+        }
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        session["current"]["profiler"] = profiler
+
+
+def section(name):
+    """Начало участка страницы; предыдущий участок заканчивается здесь"""
+    now = time.perf_counter()
+    with _lock:
+        session = _session()
+        current = session and session["current"]
+        if current is None:
+            return
+        _end_section(current, now)
+        current["section"] = (name, now)
+
+
+def _end_section(current, now):
+    if current["section"] is not None:
+        name, start = current["section"]
+        _observe(name, now - start)
+        current["spans"][name] = current["spans"].get(name, 0.0) + now - start
+        current["section"] = None
+    current["last_activity"] = now
+
+
+def finish_rerun():
+    """Конец перезапуска: итог в гистограммы, JSONL и отчет сессии"""
+    with _lock:
+        session = _session()
+        if session is not None and session["current"] is not None:
+            _close_rerun(session, interrupted=False)
+
+
+def _close_rerun(session, interrupted):
+    current = session["current"]
+    session["current"] = None
+    end = current["last_activity"] if interrupted else time.perf_counter()
+    _end_section(current, end)
+    seconds = end - current["start"]
+    _observe("rerun", seconds)
+    session["reruns"] += 1
+
+    profiler = current["profiler"]
+    if profiler is not None:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        session["profile"] = out.getvalue()
+
+    entry = {
+        "time": current["started_at"],
+        "session": session["id"],
+        "page": current["page"],
+        "seconds": round(seconds, 6),
+        "interrupted": interrupted,
+        "spans": {name: round(value, 6) for name, value in current["spans"].items()},
+        "calls": dict(current["calls"]),
+    }
+    session["last"] = entry
+    if JSONL_FILE:
+        try:
+            with open(JSONL_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning("Не удалось записать метрики в %s: %s", JSONL_FILE, e)
+
+
+def session_report():
+    """Для боковой панели: прошлый перезапуск, запросы сессии, профиль"""
+    with _lock:
+        session = _session()
+        if session is None:
+            return None
+        return {
+            "reruns": session["reruns"],
+            "calls": dict(session["calls"]),
+            "last": session["last"],
+            "profile": session["profile"],
+        }
+
+
+# ---------- Экспорт ----------
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    """Метрики процесса в текстовом формате Prometheus"""
+    lines = [
+        "# HELP cable_calc_span_seconds Время участков кода и перезапусков страницы",
+        "# TYPE cable_calc_span_seconds histogram",
+    ]
+    with _lock:
+        for name, (buckets, total, count) in sorted(_spans.items()):
+            label = _label(name)
+            for bound, value in zip(BUCKETS, buckets):
+                lines.append(f'cable_calc_span_seconds_bucket{{span="{label}",le="{bound}"}} {value}')
+            lines.append(f'cable_calc_span_seconds_bucket{{span="{label}",le="+Inf"}} {count}')
+            lines.append(f'cable_calc_span_seconds_sum{{span="{label}"}} {total}')
+            lines.append(f'cable_calc_span_seconds_count{{span="{label}"}} {count}')
+        lines.append("# HELP cable_calc_upstream_calls_total Запросы к Google")
+        lines.append("# TYPE cable_calc_upstream_calls_total counter")
+        for kind, value in sorted(_calls.items()):
+            lines.append(f'cable_calc_upstream_calls_total{{kind="{_label(kind)}"}} {value}')
+        lines.append("# HELP cable_calc_sessions Сессии Streamlit, известные процессу")
+        lines.append("# TYPE cable_calc_sessions gauge")
+        lines.append(f"cable_calc_sessions {len(_sessions)}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host=None):
+    """Запускает /metrics в фоновом потоке (один раз на процесс)"""
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host or METRICS_HOST, int(port)), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Не удалось открыть порт метрик %s: %s", port, e)
+                _server = False
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server or None
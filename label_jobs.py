@@ -0,0 +1,209 @@
+# Пакетные задания на этикетки и карты резов
+#
+# Задание делится на части по CHUNK_ROWS сборок, части рисуются в общем
+# пуле процессов (label_render.render_chunk), а готовые части по порядку
+# дописываются в ZIP на диске. Поток перезапуска Streamlit только
+# запускает задание и показывает прогресс: рисование идет в других
+# процессах и не занимает GIL сессий.
+#
+# Пул общий для всех сессий. Каждое задание держит в пуле не больше
+# частей, чем в нем процессов, поэтому задания разных пользователей
+# чередуются, а не ждут друг друга целиком.
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from google_connection import get_setting
+from label_render import ROWS_PER_PAGE, PdfWriter, render_chunk
+
+logger = logging.getLogger(__name__)
+
+# Процессов в пуле (0 - рисовать в потоке задания, без пула)
+LABEL_WORKERS = int(get_setting("LABEL_WORKERS", os.cpu_count() or 1))
+# Сборок в одной части задания (кратно ROWS_PER_PAGE - страница карты
+# резов целиком рисуется одним процессом)
+CHUNK_ROWS = 4 * ROWS_PER_PAGE
+
+# Шрифт с кириллицей; без него - встроенный шрифт Pillow
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+FONT_PATH = get_setting("LABEL_FONT") or next((path for path in FONT_CANDIDATES if os.path.exists(path)), None)
+
+# Форматы задания и подписи в интерфейсе
+FORMATS = {
+    "zpl": "ZPL (термопринтер)",
+    "png": "PNG (по файлу на этикетку)",
+    "pdf": "PDF (этикетки и карта резов)",
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Общий пул процессов (spawn: процессы не наследуют потоки Streamlit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=LABEL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool(pool):
+    """Сломанный пул (процесс убит) заменяется новым при следующем задании"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def assemblies(result):
+    """Сборки для этикеток из результата batch_calc.calculate_bom: строки
+    без ошибок, значения - обычные числа и строки (дешево передавать в процессы)"""
+    result = result[result["error"] == ""]
+    return [
+        {
+            "number": int(index) + 1,
+            "connector1": str(row.connector1),
+            "connector2": str(row.connector2),
+            "length": float(row.length),
+            "tolerance": float(row.tolerance),
+            "tolerance_type": str(row.tolerance_type),
+            "tolerance_mm": float(row.tolerance_mm),
+            "final_length": float(row.final_length),
+        }
+        for index, row in zip(result.index, result.itertuples(index=False))
+    ]
+
+
+class LabelJob:
+    """Задание: этикетки и карта резов для списка сборок в ZIP-архиве.
+
+    Запускается сразу в фоновом потоке. Прогресс - done из total, по
+    окончании status "done" и path - путь к ZIP, при ошибке "error" и
+    error, после cancel - "cancelled". Временный каталог удаляется вместе
+    с объектом задания.
+    """
+
+    def __init__(self, rows, formats, title="Карта резов"):
+        self.total = len(rows)
+        self.done = 0
+        self.status = "running"
+        self.error = None
+        self.path = None
+        self.started = time.time()
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._dir = tempfile.mkdtemp(prefix="labels-")
+        weakref.finalize(self, shutil.rmtree, self._dir, True)
+        options = {
+            "formats": set(formats),
+            "font_path": FONT_PATH,
+            "title": title,
+            "pages": max(math.ceil(len(rows) / ROWS_PER_PAGE), 1),
+        }
+        self._thread = threading.Thread(target=self._run, args=(rows, options), name="label-job", daemon=True)
+        self._thread.start()
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 1.0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _chunks(self, rows, options):
+        """Готовые части по порядку; в пуле - не больше LABEL_WORKERS частей задания"""
+        parts = [
+            (rows[start:start + CHUNK_ROWS], dict(options, first_row=start))
+            for start in range(0, len(rows), CHUNK_ROWS)
+        ]
+        if LABEL_WORKERS <= 0:
+            for part in parts:
+                yield render_chunk(*part)
+            return
+        pool = _get_pool()
+        pending = deque()
+        try:
+            for part in parts:
+                pending.append(pool.submit(render_chunk, *part))
+                if len(pending) >= LABEL_WORKERS:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _run(self, rows, options):
+        formats = options["formats"]
+        zpl_path = os.path.join(self._dir, "labels.zpl")
+        labels_path = os.path.join(self._dir, "labels.pdf")
+        sheets_path = os.path.join(self._dir, "summary.pdf")
+        archive_path = os.path.join(self._dir, "labels.zip")
+        try:
+            # PNG сразу идут в архив, ZPL и PDF - в свои файлы, которые
+            # добавляются в архив в конце (в ZIP пишется один файл за раз).
+            # При ошибке и отмене все файлы закрываются; недописанные PDF
+            # удаляет PdfWriter, архив и ZPL - обработчик ниже
+            with ExitStack() as stack:
+                archive = stack.enter_context(zipfile.ZipFile(archive_path, "w"))
+                zpl = stack.enter_context(open(zpl_path, "w", encoding="utf-8"))
+                labels = stack.enter_context(PdfWriter(labels_path)) if "pdf" in formats else None
+                sheets = stack.enter_context(PdfWriter(sheets_path)) if "pdf" in formats else None
+                for part in self._chunks(rows, options):
+                    if self._cancelled.is_set():
+                        raise RuntimeError("Задание отменено")
+                    zpl.write(part["zpl"])
+                    for name, data in part["png"]:
+                        archive.writestr("labels/" + name, data, compress_type=zipfile.ZIP_STORED)
+                    for page in part["labels"]:
+                        labels.add_page(page)
+                    for page in part["sheets"]:
+                        sheets.add_page(page)
+                    self.done += part["count"]
+                zpl.close()
+                if "zpl" in formats:
+                    archive.write(zpl_path, "labels.zpl", compress_type=zipfile.ZIP_DEFLATED)
+                if labels is not None:
+                    labels.close()
+                    sheets.close()
+                    archive.write(labels_path, "labels.pdf", compress_type=zipfile.ZIP_DEFLATED)
+                    archive.write(sheets_path, "summary.pdf", compress_type=zipfile.ZIP_DEFLATED)
+        except Exception as e:
+            # Недописанный архив не должен остаться на диске
+            for path in (archive_path, zpl_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if self._cancelled.is_set():
+                self.status = "cancelled"
+            else:
+                logger.warning("Не удалось подготовить этикетки: %s", e)
+                self.error = str(e)
+                self.status = "error"
+        else:
+            self.path = archive_path
+            self.status = "done"
+        finally:
+            self.finished = time.time()
@@ -0,0 +1,250 @@
+# Рисование этикеток и карт резов (ZPL, PNG, PDF)
+#
+# Модуль выполняется в процессах пула label_jobs, поэтому импортирует
+# только Pillow и стандартную библиотеку: без Streamlit, pandas и
+# настроек приложения (их значения приходят в options).
+import io
+import os
+import zlib
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Этикетка 58 x 40 мм, термопринтер 203 dpi (8 точек на мм)
+LABEL_WIDTH_MM = 58
+LABEL_HEIGHT_MM = 40
+DOTS_PER_MM = 8
+# Карта резов: лист A4 при 150 dpi
+SHEET_SIZE = (1240, 1754)
+SHEET_DPI = 150
+ROWS_PER_PAGE = 40
+
+# Колонки карты резов: (заголовок, ширина в точках)
+SHEET_COLUMNS = [
+    ("№", 90),
+    ("1 Коннектор", 280),
+    ("2 Коннектор", 280),
+    ("Длина (мм)", 130),
+    ("Толеранс", 200),
+    ("Окончат. (мм)", 160),
+]
+
+def tolerance_text(row):
+    """Толеранс как на странице калькулятора: 5 мм или 0,5 % (12,50 мм)"""
+    if row["tolerance_type"] in ("%", "процент", "percent"):
+        return f"{row['tolerance']:g} % ({row['tolerance_mm']:.2f} мм)"
+    return f"{row['tolerance']:g} мм"
+
+
+def _zpl_text(text):
+    """Текст для ^FD с ^FH: служебные символы ZPL - шестнадцатеричными кодами"""
+    return str(text).replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+
+def zpl_label(row):
+    """Этикетка в ZPL II (UTF-8, ^CI28)"""
+    width = LABEL_WIDTH_MM * DOTS_PER_MM
+    height = LABEL_HEIGHT_MM * DOTS_PER_MM
+    lines = [
+        (16, 26, f"Сборка № {row['number']}"),
+        (56, 24, f"1: {row['connector1']}"),
+        (90, 24, f"2: {row['connector2']}"),
+        (124, 24, f"Длина кабеля: {row['length']:g} мм"),
+        (158, 24, f"Толеранс: {tolerance_text(row)}"),
+    ]
+    out = ["^XA", "^CI28", f"^PW{width}", f"^LL{height}"]
+    for y, size, text in lines:
+        out.append(f"^FO16,{y}^A0N,{size},{size}^FH^FD{_zpl_text(text)}^FS")
+    out.append(f"^FO16,{height - 120}^GB{width - 32},2,2^FS")
+    out.append(f"^FO16,{height - 100}^A0N,56,56^FH^FD{_zpl_text(format(row['final_length'], '.2f'))} мм^FS")
+    out.append("^XZ")
+    return "\n".join(out) + "\n"
+
+
+@lru_cache(maxsize=None)
+def _font(path, size):
+    """Шрифт TrueType; без файла шрифта - встроенный шрифт Pillow"""
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size)
+
+
+def _fit(draw, text, font, width):
+    """Обрезает текст по ширине (длинные названия коннекторов)"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def render_label(row, font_path=None):
+    """Этикетка как черно-белое изображение (режим "1") в точках принтера"""
+    width = LABEL_WIDTH_MM * DOTS_PER_MM
+    height = LABEL_HEIGHT_MM * DOTS_PER_MM
+    image = Image.new("1", (width, height), 1)
+    draw = ImageDraw.Draw(image)
+    regular = _font(font_path, 24)
+    draw.text((16, 14), f"Сборка № {row['number']}", font=_font(font_path, 26), fill=0)
+    lines = [
+        f"1: {row['connector1']}",
+        f"2: {row['connector2']}",
+        f"Длина кабеля: {row['length']:g} мм",
+        f"Толеранс: {tolerance_text(row)}",
+    ]
+    for i, text in enumerate(lines):
+        draw.text((16, 54 + 34 * i), _fit(draw, text, regular, width - 32), font=regular, fill=0)
+    draw.line((16, height - 120, width - 16, height - 120), fill=0, width=2)
+    draw.text((16, height - 100), f"{row['final_length']:.2f} мм", font=_font(font_path, 56), fill=0)
+    return image
+
+
+def render_sheet(rows, page, pages, title, font_path=None):
+    """Страница карты резов (оттенки серого): шапка и до ROWS_PER_PAGE строк"""
+    width, height = SHEET_SIZE
+    image = Image.new("L", SHEET_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    header = _font(font_path, 30)
+    regular = _font(font_path, 22)
+    margin = 50
+    draw.text((margin, margin), title, font=header, fill=0)
+    draw.text((width - margin, margin), f"Стр. {page} из {pages}", font=regular, fill=0, anchor="ra")
+
+    y = margin + 70
+    row_height = (height - y - margin) // (ROWS_PER_PAGE + 1)
+    x = margin
+    for name, column_width in SHEET_COLUMNS:
+        draw.text((x + 6, y + 8), _fit(draw, name, regular, column_width - 12), font=regular, fill=0)
+        x += column_width
+    draw.line((margin, y + row_height, x, y + row_height), fill=0, width=2)
+    for row in rows:
+        y += row_height
+        values = [
+            str(row["number"]),
+            row["connector1"],
+            row["connector2"],
+            f"{row['length']:g}",
+            tolerance_text(row),
+            f"{row['final_length']:.2f}",
+        ]
+        x = margin
+        for value, (_, column_width) in zip(values, SHEET_COLUMNS):
+            draw.text((x + 6, y + 8), _fit(draw, value, regular, column_width - 12), font=regular, fill=0)
+            x += column_width
+        draw.line((margin, y + row_height, x, y + row_height), fill=160, width=1)
+    return image
+
+
+def pdf_page(image, dpi):
+    """Страница для PdfWriter: (ширина pt, высота pt, BitsPerComponent,
+    ширина px, высота px, сжатые строки изображения)"""
+    bits = 1 if image.mode == "1" else 8
+    width, height = image.size
+    # Строки режима "1" у Pillow упакованы так же, как ждет PDF (1 - белый)
+    data = zlib.compress(image.tobytes(), 6)
+    return (width * 72 / dpi, height * 72 / dpi, bits, width, height, data)
+
+
+def render_chunk(rows, options):
+    """Часть задания (выполняется в процессе пула).
+
+    rows - сборки (словари из label_jobs.assemblies) подряд, начиная со
+    строки карты резов с номером, кратным ROWS_PER_PAGE. options:
+    formats (набор из "zpl", "png", "pdf"), font_path, title, pages.
+    Возвращает {"count": число сборок, "zpl": текст, "png": [(имя, bytes)],
+    "labels": [страницы PDF], "sheets": [страницы PDF]}.
+    """
+    formats = options["formats"]
+    font_path = options.get("font_path")
+    out = {"count": len(rows), "zpl": "", "png": [], "labels": [], "sheets": []}
+    if "zpl" in formats:
+        out["zpl"] = "".join(zpl_label(row) for row in rows)
+    if "png" in formats or "pdf" in formats:
+        for row in rows:
+            image = render_label(row, font_path)
+            if "png" in formats:
+                buffer = io.BytesIO()
+                image.save(buffer, "PNG", dpi=(DOTS_PER_MM * 25.4,) * 2)
+                out["png"].append((f"{row['number']:05d}.png", buffer.getvalue()))
+            if "pdf" in formats:
+                out["labels"].append(pdf_page(image, DOTS_PER_MM * 25.4))
+    if "pdf" in formats:
+        first_page = options["first_row"] // ROWS_PER_PAGE + 1
+        for i in range(0, len(rows), ROWS_PER_PAGE):
+            sheet = render_sheet(rows[i:i + ROWS_PER_PAGE], first_page + i // ROWS_PER_PAGE, options["pages"], options["title"], font_path)
+            out["sheets"].append(pdf_page(sheet, SHEET_DPI))
+    return out
+
+
+class PdfWriter:
+    """PDF из готовых изображений страниц, пишется в файл по мере поступления.
+
+    Каждая страница - одно изображение во весь лист (pdf_page). Объекты
+    записываются сразу, в конце - дерево страниц и таблица xref, поэтому
+    в памяти держатся только смещения объектов. Как контекстный менеджер
+    при ошибке закрывает файл и удаляет недописанный PDF.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._pages = []
+        self._next = 3  # 1 - каталог, 2 - дерево страниц
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number] = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % number + body)
+        if stream is not None:
+            self._file.write(b"\nstream\n" + stream + b"\nendstream")
+        self._file.write(b"\nendobj\n")
+
+    def add_page(self, page):
+        width_pt, height_pt, bits, width, height, data = page
+        image, content, number = self._next, self._next + 1, self._next + 2
+        self._next += 3
+        self._object(image, (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray"
+            b" /BitsPerComponent %d /Filter /FlateDecode /Length %d >>" % (width, height, bits, len(data))
+        ), data)
+        draw = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (width_pt, height_pt)
+        self._object(content, b"<< /Length %d >>" % len(draw), draw)
+        self._object(number, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f]"
+            b" /Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>" % (width_pt, height_pt, image, content)
+        ))
+        self._pages.append(number)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def discard(self):
+        """Закрывает файл без завершения и удаляет его"""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        if self._file.closed:
+            return
+        kids = b" ".join(b"%d 0 R" % number for number in self._pages)
+        self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages)))
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._file.tell()
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next)
+        for number in range(1, self._next):
+            self._file.write(b"%010d 00000 n \n" % self._offsets[number])
+        self._file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self._next, xref))
+        self._file.close()
@@ -0,0 +1,249 @@
+# Таблица пар коннекторов: обратный расчет "какая пара подходит"
+import bisect
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from calculator import tolerance_to_mm
+
+# Сколько пар отдавать в ответ по умолчанию
+PAIRS_LIMIT = 100
+# Доля изменившихся коннекторов, до которой таблица обновляется, а не строится заново
+INCREMENTAL_SHARE = 0.05
+# Погрешность сравнения сумм размеров (мм)
+EPS = 1e-9
+
+
+class PairTable:
+    """Суммы размеров всех пар коннекторов, отсортированные по возрастанию.
+
+    Пар коннекторов n^2, но разных размеров в каталоге немного, поэтому
+    таблица строится по парам разных размеров (i <= j): сумма, номера
+    размеров и число пар коннекторов с такими размерами. Запрос по окну
+    окончательной длины - два бинарных поиска (searchsorted) по суммам,
+    коннекторы подставляются только для найденных строк.
+
+    Таблица неизменяемая: with_changes возвращает новую, пересчитывая
+    только строки измененных размеров.
+    """
+
+    def __init__(self, catalog=None):
+        if catalog is None:
+            return
+        self.sizes_by_name = {name: float(size) for name, size in catalog.items()}
+        values = sorted(set(self.sizes_by_name.values()))
+        self.size_values = np.array(values, dtype=np.float64)
+        self.members = [[] for _ in values]
+        position = {value: k for k, value in enumerate(values)}
+        for name in sorted(self.sizes_by_name):
+            self.members[position[self.sizes_by_name[name]]].append(name)
+        i, j = np.triu_indices(len(values))
+        self._set_rows(self.size_values[i] + self.size_values[j], i, j)
+
+    def _set_rows(self, sums, i, j):
+        order = np.argsort(sums, kind="stable")
+        self.sums = sums[order]
+        self.pair_i = i[order]
+        self.pair_j = j[order]
+
+    def __len__(self):
+        """Число пар коннекторов (без учета порядка)"""
+        return self._count(np.arange(len(self.sums)))
+
+    # ---------- Обновление ----------
+    def with_changes(self, changes):
+        """Новая таблица с изменениями [{"op": "add"|"update"|"delete", "name", "size"}]"""
+        table = PairTable()
+        table.sizes_by_name = dict(self.sizes_by_name)
+        table.members = [list(names) for names in self.members]
+        table.size_values = self.size_values
+        table.sums, table.pair_i, table.pair_j = self.sums, self.pair_i, self.pair_j
+        for change in changes:
+            name = change["name"]
+            old = table.sizes_by_name.pop(name, None)
+            if old is not None:
+                table._remove_member(name, old)
+            if change["op"] != "delete":
+                size = float(change["size"])
+                table.sizes_by_name[name] = size
+                table._add_member(name, size)
+        return table
+
+    def _add_member(self, name, size):
+        k = int(np.searchsorted(self.size_values, size))
+        if k < len(self.size_values) and self.size_values[k] == size:
+            bisect.insort(self.members[k], name)
+            return
+        # Новый размер: номера размеров >= k сдвигаются, добавляются строки (k, все)
+        self.size_values = np.insert(self.size_values, k, size)
+        self.members.insert(k, [name])
+        pair_i = self.pair_i + (self.pair_i >= k)
+        pair_j = self.pair_j + (self.pair_j >= k)
+        others = np.arange(len(self.size_values))
+        new_i = np.minimum(others, k)
+        new_j = np.maximum(others, k)
+        new_sums = self.size_values[new_i] + self.size_values[new_j]
+        # Вставка в отсортированные массивы без полной пересортировки
+        order = np.argsort(new_sums, kind="stable")
+        new_sums, new_i, new_j = new_sums[order], new_i[order], new_j[order]
+        at = np.searchsorted(self.sums, new_sums, side="right")
+        self.sums = np.insert(self.sums, at, new_sums)
+        self.pair_i = np.insert(pair_i, at, new_i)
+        self.pair_j = np.insert(pair_j, at, new_j)
+
+    def _remove_member(self, name, size):
+        k = int(np.searchsorted(self.size_values, size))
+        names = self.members[k]
+        names.remove(name)
+        if names:
+            return
+        # Размер больше не встречается - его строки удаляются
+        keep = (self.pair_i != k) & (self.pair_j != k)
+        self.size_values = np.delete(self.size_values, k)
+        del self.members[k]
+        pair_i, pair_j = self.pair_i[keep], self.pair_j[keep]
+        self.sums = self.sums[keep]
+        self.pair_i = pair_i - (pair_i > k)
+        self.pair_j = pair_j - (pair_j > k)
+
+    # ---------- Запросы ----------
+    def _expand(self, rows, limit):
+        """Пары коннекторов для строк таблицы (не больше limit)"""
+        pairs = []
+        for row in rows:
+            i, j = int(self.pair_i[row]), int(self.pair_j[row])
+            first, second = self.members[i], self.members[j]
+            for a, name1 in enumerate(first):
+                for name2 in (first[a:] if i == j else second):
+                    if len(pairs) >= limit:
+                        return pairs
+                    pairs.append((name1, name2, float(self.size_values[i]), float(self.size_values[j])))
+        return pairs
+
+    def _count(self, rows):
+        counts = np.array([len(names) for names in self.members], dtype=np.int64)
+        a, b = counts[self.pair_i[rows]], counts[self.pair_j[rows]]
+        return int(np.where(self.pair_i[rows] == self.pair_j[rows], a * (a + 1) // 2, a * b).sum())
+
+    def pairs_in_window(self, cable_len, min_final, max_final, tolerance=0.0, tolerance_type="мм", limit=PAIRS_LIMIT):
+        """Пары, у которых окончательная длина для cable_len попадает в [min_final, max_final].
+
+        Возвращает (число всех подходящих пар, первые limit пар по возрастанию
+        суммы размеров) - пары в виде словарей как у calculator.calculate.
+        """
+        tol_mm = tolerance_to_mm(tolerance, tolerance_type, cable_len)
+        # final = cable_len - sum + tol_mm  =>  sum = cable_len + tol_mm - final
+        low = cable_len + tol_mm - max_final - EPS
+        high = cable_len + tol_mm - min_final + EPS
+        rows = np.arange(
+            np.searchsorted(self.sums, low, side="left"),
+            np.searchsorted(self.sums, high, side="right"),
+        )
+        results = [
+            {
+                "connector1": name1,
+                "connector2": name2,
+                "size1": size1,
+                "size2": size2,
+                "tolerance_mm": tol_mm,
+                "final_length": cable_len - (size1 + size2) + tol_mm,
+            }
+            for name1, name2, size1, size2 in self._expand(rows, limit)
+        ]
+        return self._count(rows), results
+
+    def cut_lengths(self, final_length, tolerance=0.0, tolerance_type="мм", connector=None, limit=PAIRS_LIMIT):
+        """Длина реза, нужная каждой паре для окончательной длины final_length.
+
+        Для толеранса в % он считается от длины реза:
+        final = cut - sum + cut * p / 100  =>  cut = (final + sum) / (1 + p / 100).
+        connector - оставить только пары с этим коннектором. Возвращает
+        (число пар, первые limit пар по возрастанию длины реза).
+        """
+        def cut_for(sums):
+            if tolerance_type == "%":
+                return (final_length + sums) / (1 + tolerance / 100)
+            return final_length + sums - tolerance
+
+        if connector is not None:
+            size = self.sizes_by_name[connector]
+            # Пары с одним коннектором: по одной на каждый размер второго
+            sums = size + self.size_values
+            cuts = cut_for(sums)
+            results = []
+            for k in np.argsort(cuts, kind="stable"):
+                for name in self.members[k]:
+                    if len(results) >= limit:
+                        break
+                    results.append(_cut_row(connector, name, size, float(self.size_values[k]), float(cuts[k])))
+            return len(self.sizes_by_name), results
+
+        # Суммы отсортированы, поэтому и длины реза идут по возрастанию
+        rows = np.arange(len(self.sums))
+        results = [
+            _cut_row(name1, name2, size1, size2, float(cut_for(size1 + size2)))
+            for name1, name2, size1, size2 in self._expand(rows, limit)
+        ]
+        return self._count(rows), results
+
+
+def _cut_row(name1, name2, size1, size2, cut):
+    return {"connector1": name1, "connector2": name2, "size1": size1, "size2": size2, "cable_len": cut}
+
+
+_tables = OrderedDict()
+_tables_lock = threading.Lock()
+TABLE_CACHE_SIZE = 4
+
+
+def get_pair_table(catalog):
+    """Таблица пар для версии каталога; общая для всех сессий.
+
+    Версия, полученная правками (CatalogSnapshot.with_changes) из версии с
+    готовой таблицей, пересчитывает только строки этих правок. Другой
+    каталог сравнивается с последней таблицей и, если отличается
+    несколькими коннекторами, тоже обновляется правками.
+    """
+    key = getattr(catalog, "version", None)
+    if key is None:
+        key = (len(catalog), hash(tuple(catalog)))
+    lineage = catalog.lineage() if hasattr(catalog, "lineage") else ()
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is not None:
+            _tables.move_to_end(key)
+            return table
+        base = changes = None
+        for version, changes in lineage:
+            base = _tables.get(version)
+            if base is not None:
+                break
+        previous = next(reversed(_tables.values()), None)
+
+    table = None
+    if base is not None:
+        if len(changes) <= INCREMENTAL_SHARE * max(len(catalog), 1):
+            table = base.with_changes(changes)
+    elif previous is not None:
+        old = previous.sizes_by_name
+        changes = [
+            {"op": "update", "name": name, "size": catalog[name]}
+            for name in catalog if old.get(name) != catalog[name]
+        ]
+        added = sum(1 for change in changes if change["name"] not in old)
+        if len(catalog) - added < len(old):
+            # Часть коннекторов удалена
+            changes += [
+                {"op": "delete", "name": name}
+                for name in old if name not in catalog
+            ]
+        if len(changes) <= INCREMENTAL_SHARE * max(len(catalog), 1):
+            table = previous.with_changes(changes)
+    if table is None:
+        table = PairTable(catalog)
+    with _tables_lock:
+        _tables[key] = table
+        while len(_tables) > TABLE_CACHE_SIZE:
+            _tables.popitem(last=False)
+    return table
@@ -0,0 +1,81 @@
+// Расчет длины кабеля в браузере (повторяет calculator.py) и поиск по каталогу
+
+// Толеранс в мм; для толеранса в % - от длины кабеля
+function toleranceToMm(tolerance, toleranceType, cableLen) {
+  if (toleranceType === '%') {
+    return (tolerance / 100) * cableLen;
+  }
+  return tolerance;
+}
+
+// Окончательная длина кабеля с учетом размеров двух коннекторов
+function computeFinalLength(cableLen, size1, size2, tolMm) {
+  return cableLen - (size1 + size2) + (tolMm || 0);
+}
+
+// Название без регистра и разделителей, как connector_search.normalize
+const SEPARATORS = /[\s_\-/\\.,;:()]+/g;
+function normalize(text) {
+  return String(text).toUpperCase().replace(SEPARATORS, '');
+}
+
+// Каталог из /catalog/snapshot: {"names": [...], "sizes": [...]}
+class Catalog {
+  constructor(snapshot) {
+    this.names = snapshot.names;
+    this.sizes = snapshot.sizes;
+    this.index = new Map();
+    this.compact = new Array(this.names.length);
+    for (let i = 0; i < this.names.length; i++) {
+      this.index.set(this.names[i], i);
+      this.compact[i] = normalize(this.names[i]);
+    }
+  }
+
+  get size() {
+    return this.names.length;
+  }
+
+  sizeOf(name) {
+    const i = this.index.get(name);
+    return i === undefined ? undefined : this.sizes[i];
+  }
+
+  // До limit названий: сначала по началу названия, потом по подстроке
+  search(query, limit = 20) {
+    const needle = normalize(query || '');
+    if (!needle) {
+      return this.names.slice(0, limit);
+    }
+    const prefix = [];
+    const inner = [];
+    for (let i = 0; i < this.compact.length && prefix.length < limit; i++) {
+      const at = this.compact[i].indexOf(needle);
+      if (at === 0) {
+        prefix.push(this.names[i]);
+      } else if (at > 0 && inner.length < limit) {
+        inner.push(this.names[i]);
+      }
+    }
+    return prefix.concat(inner).slice(0, limit);
+  }
+
+  // Полный расчет для пары, как calculator.calculate
+  calculate(connector1, connector2, cableLen, tolerance = 0, toleranceType = 'мм') {
+    const size1 = this.sizeOf(connector1);
+    const size2 = this.sizeOf(connector2);
+    if (size1 === undefined || size2 === undefined) {
+      return null;
+    }
+    const tolMm = toleranceToMm(tolerance, toleranceType, cableLen);
+    return {
+      connector1, connector2, size1, size2,
+      tolerance_mm: tolMm,
+      final_length: computeFinalLength(cableLen, size1, size2, tolMm),
+    };
+  }
+}
+
+if (typeof module !== 'undefined') {
+  module.exports = { toleranceToMm, computeFinalLength, normalize, Catalog };
+}
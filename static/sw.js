@@ -0,0 +1,104 @@
+// Service Worker для PWA: оболочка и каталог доступны без сети
+const CACHE_NAME = 'cable-calculator-v2';
+const SNAPSHOT_URL = '/catalog/snapshot';
+const urlsToCache = [
+  '/',
+  '/index.html',
+  '/calc.js',
+  '/manifest.json',
+  '/icon-192.png',
+  '/icon-512.png',
+  SNAPSHOT_URL
+];
+
+// Установка service worker
+self.addEventListener('install', function(event) {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then(function(cache) {
+        return cache.addAll(urlsToCache);
+      })
+      .then(function() {
+        return self.skipWaiting();
+      })
+  );
+});
+
+// Активация service worker: старые версии кеша удаляются
+self.addEventListener('activate', function(event) {
+  event.waitUntil(
+    caches.keys().then(function(cacheNames) {
+      return Promise.all(
+        cacheNames.map(function(cacheName) {
+          if (cacheName !== CACHE_NAME) {
+            return caches.delete(cacheName);
+          }
+        })
+      );
+    }).then(function() {
+      return self.clients.claim();
+    })
+  );
+});
+
+// Каталог: сначала сеть (с If-None-Match по ETag, без изменений сервер
+// отвечает 304), без сети - последняя сохраненная версия
+function catalogFromNetwork(request) {
+  return caches.open(CACHE_NAME).then(function(cache) {
+    return cache.match(SNAPSHOT_URL).then(function(cached) {
+      const headers = new Headers();
+      const etag = cached && cached.headers.get('ETag');
+      if (etag) {
+        headers.set('If-None-Match', etag);
+      }
+      return fetch(SNAPSHOT_URL, { headers: headers, cache: 'no-store' })
+        .then(function(response) {
+          if (response.status === 304 && cached) {
+            return cached;
+          }
+          if (response.ok) {
+            cache.put(SNAPSHOT_URL, response.clone());
+          }
+          return response;
+        })
+        .catch(function() {
+          return cached || Response.error();
+        });
+    });
+  });
+}
+
+// Оболочка: из кеша, а обновление - в фоне
+function shellFromCache(request) {
+  return caches.open(CACHE_NAME).then(function(cache) {
+    return cache.match(request).then(function(cached) {
+      const network = fetch(request)
+        .then(function(response) {
+          if (response.ok) {
+            cache.put(request, response.clone());
+          }
+          return response;
+        })
+        .catch(function() {
+          return cached || Response.error();
+        });
+      return cached || network;
+    });
+  });
+}
+
+// Перехват запросов
+self.addEventListener('fetch', function(event) {
+  if (event.request.method !== 'GET') {
+    return;
+  }
+  const url = new URL(event.request.url);
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+  if (url.pathname === SNAPSHOT_URL) {
+    event.respondWith(catalogFromNetwork(event.request));
+  } else if (urlsToCache.indexOf(url.pathname) !== -1) {
+    event.respondWith(shellFromCache(event.request));
+  }
+});
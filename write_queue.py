@@ -0,0 +1,104 @@
+# Фоновая отправка изменений каталога в Google Sheets
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд ждать после правки, чтобы отправить серию правок одним запросом
+COALESCE_DELAY = 1.0
+# Повтор после ошибки: пауза удваивается от RETRY_BASE до RETRY_MAX секунд
+RETRY_BASE = 5.0
+RETRY_MAX = 300.0
+
+
+class WriteQueue:
+    """Очередь записи: правки сразу попадают в локальный журнал, а в
+    Google Sheets уходят из фонового потока.
+
+    Очередью служит сам журнал хранилища: несинхронизированные записи
+    переживают перезапуск и уходят при следующей отправке. Серия правок
+    за COALESCE_DELAY секунд отправляется одним batch_update (push -
+    функция синхронизации, например CatalogService.sync). При ошибке
+    отправка повторяется с растущей паузой. Когда отправлять нечего, поток
+    завершается - у неактивных каталогов потоков нет.
+    """
+
+    def __init__(self, storage, push):
+        self.storage = storage
+        self.push = push
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._failures = 0
+        self.last_synced = None
+        self.last_error = None
+        self.retry_at = None
+
+    def notify(self):
+        """Есть новые изменения: запускает поток при необходимости и будит его"""
+        with self._lock:
+            self._idle.clear()
+            self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="catalog-write-queue", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        delay = None  # None - ждем следующей правки
+        while True:
+            self._wake.wait(timeout=delay)
+            time.sleep(COALESCE_DELAY)
+            self._wake.clear()
+            if not self.storage.pending()[1]:
+                if self._stop_if_idle():
+                    return
+                delay = None
+                continue
+            try:
+                self.push()
+            except Exception as e:
+                self._failures += 1
+                delay = min(RETRY_BASE * 2 ** (self._failures - 1), RETRY_MAX)
+                self.last_error = str(e)
+                self.retry_at = time.time() + delay
+                logger.warning("Не удалось отправить изменения в Google Sheets: %s (повтор через %.0f с)", e, delay)
+                continue
+            self._failures = 0
+            self.last_error = None
+            self.retry_at = None
+            self.last_synced = time.time()
+            # Во время отправки могли прийти новые правки - проверим еще раз
+            if self._stop_if_idle():
+                return
+            delay = 0.0
+
+    def _stop_if_idle(self):
+        """Завершает поток, если новых правок нет (notify запустит новый)"""
+        with self._lock:
+            if self._wake.is_set():
+                return False
+            self._thread = None
+            self._idle.set()
+            return True
+
+    def flush(self, timeout=None):
+        """Ждет, пока очередь опустеет или отправка завершится ошибкой"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._idle.wait(timeout=0.05):
+            if self.last_error is not None and self.retry_at is not None:
+                return False
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+        return True
+
+    def status(self):
+        """Состояние для боковой панели: {"pending", "last_synced", "error", "retry_at"}"""
+        return {
+            "pending": len(self.storage.pending()[1]),
+            "last_synced": self.last_synced,
+            "error": self.last_error,
+            "retry_at": self.retry_at,
+        }